@@ -20,7 +20,14 @@
 # __init__ - initalize modules
 #------------------------------------------------------------------------------
 
+from apf    import ApfFile
 from cdl    import CdlFile
+from common import FloatFormat
+from common import NamedList
+from common import RangeSet
 from common import Variable
+from common import VariableTable
 from mas    import MasFile
+from reader import BlockEvents
+from reader import BlockReader
 from rib    import RibFile
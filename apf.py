@@ -0,0 +1,314 @@
+#------------------------------------------------------------------------------
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#                     Version 2, December 2004
+#
+#  Copyright (C) 2013 Electronic Dreams <maverick.babylon.drifter@gmail.com>
+#
+#  Everyone is permitted to copy and distribute verbatim or modified
+#  copies of this license document, and changing it is allowed as long
+#  as the name is changed.
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#    TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+#
+#   0. You just DO WHAT THE FUCK YOU WANT TO.
+#
+#------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------
+# apf.py - Massive agent playback file. (.apf)
+#------------------------------------------------------------------------------
+
+import multiprocessing
+import os
+
+import numpy as np
+
+from common   import Compression
+from snapshot import Snapshot
+
+#------------------------------------------------------------------------------
+# class ApfFile
+#------------------------------------------------------------------------------
+
+class ApfFile(object):
+    """Baked agent animation, the channels of every frame as one (frames,
+    channels) array.
+
+    The ascii channel layout is read: ':' keyword and '#' comment lines,
+    a line holding the frame number, then one line per segment of its
+    name followed by its channel values.  The segment layout is taken from
+    the first frame and every frame must match it.
+
+    The parsed channels are cached next to the file as a snapshot and
+    memory mapped when the cache is still valid, so a segment only reads
+    the pages it touches.
+    """
+
+    #--------------------------------------------------------------------------
+    # statics
+    #--------------------------------------------------------------------------
+
+    _sCacheVersion   = 1
+    _sCacheExtension = '.apfc'
+
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    def loadRibFile(rib_file, processes=None, cache=True):
+        """Load the apf of every ant in the rib file, keyed by the apf path
+        as written in the ant.  Relative paths are found from the rib file
+        directory.  Files are parsed by a pool of processes, use processes=1
+        to parse them in process.  With the cache the workers save it and
+        the files are mapped here, without it the parsed channels are sent
+        back from the workers.
+        """
+
+        directory = os.path.dirname(rib_file._path)
+        paths     = {}
+        for ant in rib_file.ants:
+            if ant.apf not in paths:
+                paths[ant.apf] = os.path.join(directory, ant.apf)
+
+        # workers write the caches, mapping them here shares the pages
+        jobs = sorted(set(paths.values()))
+        data = {}
+        if processes != 1 and len(jobs) > 1:
+            pool = multiprocessing.Pool(processes)
+            try:
+                if cache:
+                    pool.map(_cacheApf, jobs)
+                else:
+                    data = dict(zip(jobs, pool.map(_readApf, jobs)))
+            finally:
+                pool.close()
+                pool.join()
+
+        files = {}
+        for path in jobs:
+            if path in data:
+                files[path] = ApfFile._fromData(path, data[path])
+            else:
+                files[path] = ApfFile(path, cache)
+        return dict((apf, files[path]) for apf, path in paths.iteritems())
+
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    def _fromData(path, data):
+        """File of already parsed channels, see _getData.
+        """
+        apf_file       = ApfFile.__new__(ApfFile)
+        apf_file._path = path
+        apf_file._setData(data)
+        return apf_file
+
+    #--------------------------------------------------------------------------
+    # methods
+    #--------------------------------------------------------------------------
+
+    def __init__(self, path, cache=True):
+        """Open the file at path, mapping the cached channels if up to date,
+        otherwise parsing the file and saving the cache when possible.
+        """
+        super(ApfFile, self).__init__()
+
+        # save path to file
+        self._path = path
+
+        # use the cache if valid, read in file contents otherwise
+        if not (cache and self._loadCache()):
+            self._read(path)
+            if cache:
+                self._saveCache()
+
+    #--------------------------------------------------------------------------
+
+    def __len__(self):
+        return len(self.frames)
+
+    #--------------------------------------------------------------------------
+
+    def __contains__(self, name):
+        return name in self._segments
+
+    #--------------------------------------------------------------------------
+
+    def __getitem__(self, name):
+        return self.segment(name)
+
+    #--------------------------------------------------------------------------
+
+    def segment(self, name):
+        """(frames, n) view of the channels of the named segment.
+        """
+        start, stop = self._segments[name]
+        return self.channels[:, start:stop]
+
+    #--------------------------------------------------------------------------
+
+    def channel(self, name, index):
+        """Values of a single channel of the named segment over all frames.
+        """
+        start, stop = self._segments[name]
+        if not 0 <= index < stop - start:
+            raise IndexError("Segment %s has no channel %d" % (name, index))
+        return self.channels[:, start + index]
+
+    #--------------------------------------------------------------------------
+
+    def frame(self, frame):
+        """Channels of the frame with the given frame number.
+        """
+        index = np.searchsorted(self.frames, frame)
+        if index >= len(self.frames) or self.frames[index] != frame:
+            raise KeyError("Frame %d not found in %s" % (frame, self._path))
+        return self.channels[index]
+
+    #--------------------------------------------------------------------------
+    # helper methods
+    #--------------------------------------------------------------------------
+
+    def _read(self, path):
+        """Parses the contents of the file at the given path.
+        """
+
+        segments = []
+        counts   = []
+        frames   = []
+        values   = []
+        index    = 0
+
+        for line in Compression.read(path).split('\n'):
+            entries = line.split()
+            if not entries or entries[0][0] in ':#':
+                continue
+
+            # frame number line
+            if len(entries) == 1 and entries[0].lstrip('-').isdigit():
+                if frames and index != len(segments):
+                    raise ValueError("Frame %d is missing segments: %s" %
+                                     (frames[-1], path))
+                frames.append(int(entries[0]))
+                index = 0
+                continue
+
+            if not frames:
+                raise ValueError("Channels found before a frame: %s" % path)
+
+            # the first frame sets the layout
+            if len(frames) == 1:
+                segments.append(entries[0])
+                counts.append(len(entries) - 1)
+            elif index >= len(segments) or entries[0] != segments[index] or \
+                 len(entries) - 1 != counts[index]:
+                raise ValueError("Frame %d doesn't match the segment layout: %s"
+                                 % (frames[-1], path))
+            values.append(" ".join(entries[1:]))
+            index += 1
+
+        if frames and index != len(segments):
+            raise ValueError("Frame %d is missing segments: %s" %
+                             (frames[-1], path))
+
+        stops    = np.cumsum(counts, dtype=np.int64)
+        channels = np.fromstring(" ".join(values), dtype=np.float32, sep=' ')
+        if channels.size != sum(counts) * len(frames):
+            raise ValueError("Expected %d channel values, read %d: %s" %
+                             (sum(counts) * len(frames), channels.size, path))
+        self._setData({
+            'frames'   : np.array(frames, dtype=np.int64),
+            'segments' : segments,
+            'channels' : channels.reshape(len(frames), int(stops[-1]) if counts else 0),
+            'starts'   : stops - np.array(counts, dtype=np.int64),
+            'stops'    : stops,
+        })
+
+    #--------------------------------------------------------------------------
+
+    def _getData(self):
+        """Parsed channels and segment layout, as saved in the cache.
+        """
+        return {
+            'frames'   : self.frames,
+            'segments' : self.segments,
+            'channels' : self.channels,
+            'starts'   : self._starts,
+            'stops'    : self._stops,
+        }
+
+    #--------------------------------------------------------------------------
+
+    def _setData(self, data):
+        self.frames    = data['frames']
+        self.segments  = data['segments']
+        self.channels  = data['channels']
+        self._starts   = data['starts']
+        self._stops    = data['stops']
+        self._segments = dict(zip(self.segments, zip(self._starts, self._stops)))
+
+    #--------------------------------------------------------------------------
+
+    def _getCachePath(self):
+        return self._path + ApfFile._sCacheExtension
+
+    #--------------------------------------------------------------------------
+
+    def _getStamp(self):
+        stat = os.stat(self._path)
+        return (stat.st_size, stat.st_mtime)
+
+    #--------------------------------------------------------------------------
+
+    def _loadCache(self):
+        """Map the cached channels, False if missing or out of date.
+        """
+
+        path = self._getCachePath()
+        if not os.path.exists(path):
+            return False
+
+        # a damaged or unreadable cache is reparsed and replaced
+        try:
+            cache = Snapshot.load(path, True)
+            if not isinstance(cache, dict) or \
+               cache.get('version') != ApfFile._sCacheVersion or \
+               tuple(cache['stamp']) != self._getStamp():
+                return False
+            self._setData(cache)
+        except (ValueError, TypeError, KeyError, EnvironmentError):
+            return False
+        return True
+
+    #--------------------------------------------------------------------------
+
+    def _saveCache(self):
+        """Save the parsed channels next to the file, skipped if the
+        directory isn't writable.
+        """
+        cache = self._getData()
+        cache['version'] = ApfFile._sCacheVersion
+        try:
+            cache['stamp'] = self._getStamp()
+            Snapshot.save(cache, self._getCachePath())
+        except (IOError, OSError):
+            pass
+
+#------------------------------------------------------------------------------
+# helper functions
+#------------------------------------------------------------------------------
+
+def _cacheApf(path):
+    """Parse the file and write its cache.  Module level so it can be sent
+    to pool workers.
+    """
+    ApfFile(path)
+
+#------------------------------------------------------------------------------
+
+def _readApf(path):
+    """Parse the file without the cache, returning the parsed channels to
+    send back from pool workers.
+    """
+    return ApfFile(path, False)._getData()
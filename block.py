@@ -20,11 +20,17 @@
 # block.py - Base class for blocks found in Massive files.
 #------------------------------------------------------------------------------
 
+import contextlib
 import re
+import threading
+
+import numpy as np
 
 from scanf import sscanf
 from scanf import IncompleteCaptureError
 
+from common import FloatFormat
+
 #------------------------------------------------------------------------------
 # class Block
 #------------------------------------------------------------------------------
@@ -33,6 +39,47 @@ class Block(object):
     """Base class for blocks of data in massive files.
     """
 
+    #--------------------------------------------------------------------------
+    # statics
+    #--------------------------------------------------------------------------
+
+    _sParsing = threading.local()
+
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    @contextlib.contextmanager
+    def parsing(preserve=False, lazy=False):
+        """Parse options for the blocks created by the current thread within
+        the with block.
+
+        With preserve the source text of attribute lines and arrays is kept
+        and values unchanged since parsing are written back using it.
+
+        With lazy only the source lines of scanf attributes are kept, they
+        are parsed the first time they are read.  Attributes that were never
+        read or are unchanged are written back using the source lines.
+        """
+        parsing  = Block._sParsing
+        previous = (Block.isPreserving(), Block.isLazy())
+        parsing.preserve, parsing.lazy = preserve, lazy
+        try:
+            yield
+        finally:
+            parsing.preserve, parsing.lazy = previous
+
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    def isPreserving():
+        return getattr(Block._sParsing, 'preserve', False)
+
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    def isLazy():
+        return getattr(Block._sParsing, 'lazy', False)
+
     #--------------------------------------------------------------------------
     # initialization
     #--------------------------------------------------------------------------
@@ -40,6 +87,37 @@ class Block(object):
     def __init__(self):
         pass
 
+    #--------------------------------------------------------------------------
+
+    def __getattr__(self, attribute):
+        """Parses a lazy attribute the first time it is read, see parsing.
+
+        The value is stored on the instance so later reads don't get here.
+        The source lines are kept to write the attribute back as is while
+        it is unchanged.
+        """
+
+        # only attributes with deferred lines are missing on purpose
+        lazy = self.__dict__.get('_lazy')
+        if not lazy or attribute not in lazy:
+            raise AttributeError("'%s' object has no attribute '%s'" % \
+                (type(self).__name__, attribute))
+
+        # parse the lines, multiple entries become a list
+        formatting, lines = lazy.pop(attribute)
+        values = []
+        for line in lines:
+            value = self._parseAttributeScanf(line, formatting)
+            values.append(value[0] if len(value) == 1 else value)
+        value = values[0] if len(values) == 1 else values
+
+        # keep the lines for writing the attribute back unchanged
+        sources = self.__dict__.setdefault('_sources', {})
+        sources[attribute] = zip(values, lines)
+
+        self.__dict__[attribute] = value
+        return value
+
     #--------------------------------------------------------------------------
     # helper methods
     #--------------------------------------------------------------------------
@@ -56,6 +134,117 @@ class Block(object):
         """
         return re.compile(r"^((?!$))", re.M).sub("    " * count, block)
 
+    #--------------------------------------------------------------------------
+
+    def _splitHeader(self, block):
+        """Header line and body of a block, the body has one indent removed.
+
+        Blocks are either text or a reader.BlockNode.  The body of a node is
+        its list of child nodes, lines are only copied out of the file text
+        once they are parsed, see _iterLines and _getText.
+        """
+        if isinstance(block, basestring):
+            header, block = block.partition('\n')[::2]
+            return header, self._removeIndent(block)
+        return block.header.lstrip(), block.children
+
+    #--------------------------------------------------------------------------
+
+    def _splitLine(self, block):
+        """First line of a block body and the rest of the body.
+        """
+        if isinstance(block, basestring):
+            return block.partition('\n')[::2]
+        return (block[0].text() if block else ""), block[1:]
+
+    #--------------------------------------------------------------------------
+
+    def _getText(self, block):
+        """Text of a block body, see _splitHeader.
+        """
+        if isinstance(block, basestring):
+            return block
+        return "\n".join([node.text() for node in block])
+
+    #--------------------------------------------------------------------------
+
+    def _iterLines(self, block):
+        """Attribute name and line of each top level line in a block body,
+        lines include the lines nested under them.  Lines of a node body that
+        have nested lines are returned as the node itself.
+        """
+
+        # node bodies are already split up
+        if not isinstance(block, basestring):
+            for node in block:
+                yield node.name, (node if node.children else node.text())
+            return
+
+        # remove trailing newlines
+        block = block.strip('\n')
+
+        # loop over the block line by line
+        index = 0
+        lines = block.split('\n')
+        while index < len(lines):
+
+            # grab line and increment
+            line   = lines[index]
+            index += 1
+
+            # gather up indented child lines
+            children = []
+            while (index < len(lines)) and re.match('^(?:\t|    )', lines[index]):
+                children.append(lines[index])
+                index += 1
+
+            # add children to line
+            children.insert(0, line)
+            line = "\n".join(children)
+
+            # use proper seperator to grab the attribute name
+            yield re.split('\s', line)[0], line
+
+    #--------------------------------------------------------------------------
+
+    def _parseArray(self, block, columns):
+        """Parses rows of bracketed numbers into a (n, columns) float64 array.
+        Each non empty line is a row, raises ValueError on malformed rows.
+        """
+        rows  = len([line for line in block.split('\n') if line.strip()])
+        block = block.replace('[', ' ').replace(']', ' ')
+        data  = np.fromstring(block, dtype=np.float64, sep=' ')
+        if data.size != rows * columns:
+            raise ValueError("Expected %d rows of %d numbers, read %d: %s" %
+                (rows, columns, data.size, " ".join(block.split())[:80]))
+        return data.reshape(rows, columns)
+
+    #--------------------------------------------------------------------------
+
+    def _keepArraySource(self, block, array):
+        """Keeps a copy of the parsed array and its text when preserving the
+        source formatting, see parsing.
+        """
+        if not Block.isPreserving():
+            return None
+        return (array.copy(), block.strip('\n'))
+
+    #--------------------------------------------------------------------------
+
+    def _printArray(self, formatting, array, source=None):
+        """Prints each row of the array using the formatting, one per line.
+        The source text is used instead if the array is unchanged.
+        """
+        array = np.asarray(array, dtype=np.float64)
+        if source != None and np.array_equal(array, source[0]):
+            return source[1]
+        float_format = FloatFormat.current()
+        if not float_format.isGeneral():
+            formatting = float_format.compile(formatting)[0]
+        lines  = "\n".join([formatting] * len(array))
+        values = float_format.convert(array.ravel().tolist())
+        return lines % tuple(values)
+
     #--------------------------------------------------------------------------
     # attribute handler methods
     #--------------------------------------------------------------------------
@@ -134,56 +323,44 @@ class Block(object):
         entrys are available the first matching entry will be returned.
         """
 
-        # multiple entrys
+        # multiple entrys, the matching entry is picked up front
         if isinstance(formatting, list):
-            for scanf_format in formatting:
-                try:
-                    #print "<<<----", scanf_format, line
-                    return sscanf(line, scanf_format)
-                except IncompleteCaptureError, e:
-                    pass
+            return FormatMatcher.get(formatting).scan(line)
 
         # single entry
-        else:
-            return sscanf(line, formatting)
-
-        # problem if none of the formats worked
-        raise IncompleteCaptureError("Format error for %s" % line)
+        return sscanf(line, formatting)
 
     #--------------------------------------------------------------------------
 
     def parseAttributes(self, block, scanf_list, special_list={}, skip_list=[]):
         """Parses block for attributes using the formatting.
-        """
 
-        # remove trailing newlines
-        block = block.strip('\n')
+        The block is the text of a block body or the child nodes of a
+        reader.BlockNode, see _splitHeader.  Special formatters are handed
+        lines with nested lines as nodes when given nodes.
+        """
 
         # create a hash of the attributes for easy lookup
         scanf_map, order = self._createAttributeFormattingMap(scanf_list)
 
-        # loop over the block line by line
-        index = 0
-        rest  = []
-        lines = block.split('\n')
-        while index < len(lines):
+        # source lines are only kept when preserving the source formatting
+        sources = None
+        if Block.isPreserving():
+            sources = self.__dict__.setdefault('_sources', {})
 
-            # grab line and increment
-            line   = lines[index]
-            index += 1
+        # lazy attributes keep their lines to be parsed on first access
+        lazy = None
+        if Block.isLazy():
+            lazy = self.__dict__.setdefault('_lazy', {})
 
-            # gather up indented child lines
-            children = []
-            while (index < len(lines)) and re.match('^(?:\t|    )', lines[index]):
-                children.append(lines[index])
-                index += 1
+        # loop over the top level lines of the block
+        rest = []
+        for attribute, line in self._iterLines(block):
 
-            # add children to line
-            children.insert(0, line)
-            line = "\n".join(children)
-
-            # use proper seperator to grab the attribute name
-            attribute = re.split('\s', line)[0]
+            # only special formatters take nodes
+            if not isinstance(line, basestring) and \
+               (attribute in skip_list or attribute not in special_list):
+                line = line.text()
 
             # skip attribute
             if attribute in skip_list:
@@ -195,6 +372,13 @@ class Block(object):
                 #print "special_list-> ", attribute, line
                 special_list[attribute](line)
 
+            # defer scanf formatter until the attribute is read, unless the
+            #  class uses the name which would hide it from __getattr__
+            elif (lazy != None) and (attribute in scanf_map) and \
+                 not hasattr(type(self), attribute):
+                entry = lazy.setdefault(attribute, (scanf_map[attribute], []))
+                entry[1].append(line)
+
             # use scanf formatter
             elif attribute in scanf_map:
                 #print "scanf-> ", attribute, line
@@ -207,6 +391,10 @@ class Block(object):
                 # set attribute
                 self._setAttribute(attribute, value)
 
+                # keep the source line to write back if left untouched
+                if sources != None:
+                    sources.setdefault(attribute, []).append((value, line))
+
             # attribute not found
             else:
                 #print "rest-> ", attribute, line
@@ -214,6 +402,8 @@ class Block(object):
 
         # add default entires for missing attibutes
         for attribute in scanf_map.keys():
+            if lazy and attribute in lazy:
+                continue
             if not hasattr(self, attribute):
                 setattr(self, attribute, None)
 
@@ -222,70 +412,344 @@ class Block(object):
 
     #--------------------------------------------------------------------------
 
-    def _printAttributePrintf(self, formatting, value):
-        """Use printf (%) to export the data from the line.
-
-        Formatting can be a single entry or a list of entrys.  If multiple
-        entrys are available the first matching entry will be returned.
-        """
-
-        # multiple entrys
-        if isinstance(formatting, list):
-
-            for scanf_format in formatting:
-                try:
-                    #print "-->>", scanf_format, value
-                    return scanf_format % value
-                except TypeError, e:
-                    pass
-
-        # single entry
-        else:
-            return formatting % value
-
-        # problem if none of the formats worked
-        raise TypeError("Valid format not found for values.")
-
-    #--------------------------------------------------------------------------
-
     def printAttributes(self, scanf_list, special_list={}):
         """Prints out all of the attributes in the list.
         """
 
-        # create a hash of the attributes for easy lookup
-        scanf_map, order = self._createAttributeFormattingMap(scanf_list, False)
+        # printer compiled once per formatting list
+        printer = AttributePrinter.get(scanf_list)
 
-        # print out all of the attributes
-        block = ""
-        for attribute in order:
+        # source lines kept by parseAttributes
+        sources = getattr(self, '_sources', None)
+        lazy    = getattr(self, '_lazy', None)
+
+        # print out all of the attributes into a single buffer
+        output = []
+        write  = output.append
+        for attribute in printer.order:
 
             # seperator
             if attribute == "_seperator_":
-                block += '\n'
+                write('\n')
                 continue
 
             # use special formatter
             if attribute in special_list:
                 special_block = special_list[attribute]()
                 if special_block != '':
-                    block += special_block + '\n'
+                    write(special_block + '\n')
                 continue
 
-            # only process attributes that exist on the object
-            if not hasattr(self, attribute):
+            # lazy attributes that were never read or set are written as is
+            if lazy and attribute in lazy and attribute not in self.__dict__:
+                write("".join([line + '\n' for line in lazy[attribute][1]]))
                 continue
 
-            # skip empty attributes
-            value = getattr(self, attribute)
+            # skip missing and empty attributes
+            value = getattr(self, attribute, None)
             if value == None:
                 continue
 
             # add attribute to block
-            formatting = scanf_map[attribute]
-            if isinstance(value, list):
-                for entry in value:
-                    block += self._printAttributePrintf(formatting, entry) + "\n"
+            entries = value if isinstance(value, list) else (value,)
+            if sources and attribute in sources:
+                source = sources[attribute]
+                for index, entry in enumerate(entries):
+                    write(self._printAttributeSource(printer, attribute,
+                                                     entry, source, index))
             else:
-                block += self._printAttributePrintf(formatting, value) + "\n"
+                for entry in entries:
+                    write(printer.format(attribute, entry) + '\n')
+
+        return "".join(output)
+
+    #--------------------------------------------------------------------------
+
+    def _printAttributeSource(self, printer, attribute, value, source, index):
+        """Prints the source line kept by parseAttributes if the value is
+        unchanged since parsing, otherwise formats the value.
+        """
+        if index < len(source):
+            parsed, line = source[index]
+            if type(value) == type(parsed) and value == parsed:
+                return line + "\n"
+        return printer.format(attribute, value) + "\n"
+
+#------------------------------------------------------------------------------
+# class AttributePrinter
+#------------------------------------------------------------------------------
+
+class AttributePrinter(object):
+    """Printer compiled from a scanf formatting list.
+
+    Attributes with several formats pick theirs by the arity and types of
+    the value, a format is used if it has one conversion per value and
+    numeric conversions only get numbers.  Values the rules can't place go
+    through the original try each format fallback.
+    """
+
+    #--------------------------------------------------------------------------
+    # statics
+    #--------------------------------------------------------------------------
+
+    _sPrinters = {}
+
+    _sNumeric = frozenset('diouxXeEfFgG')
+    _sNumbers = (int, long, float, bool, np.number)
+
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    def get(scanf_list):
+        """Cached printer for the formatting list.
+        """
+        key     = tuple(scanf_list)
+        printer = AttributePrinter._sPrinters.get(key)
+        if printer == None:
+            printer = AttributePrinter(scanf_list)
+            AttributePrinter._sPrinters[key] = printer
+        return printer
+
+    #--------------------------------------------------------------------------
+    # methods
+    #--------------------------------------------------------------------------
+
+    def __init__(self, scanf_list):
+        self.order    = []
+        self._formats = {}
+
+        for entry in scanf_list:
+
+            # grab attribute, seperators can repeat
+            attribute = re.split('\s', entry)[0]
+            if attribute.startswith('_') or (not attribute in self._formats):
+                self.order.append(attribute)
+
+            # conversions of the entry, numeric or any
+            conversions = [match.group(0)[-1] for match in
+                           FloatFormat._sConversion.finditer(entry)]
+            kinds       = tuple([c in AttributePrinter._sNumeric
+                                 for c in conversions if c != '%'])
+            self._formats.setdefault(attribute, []).append((entry, kinds))
+
+    #--------------------------------------------------------------------------
+
+    def format(self, attribute, value):
+        """Same as formatting the value with the first entry of the
+        attribute that accepts it.
+        """
+        formats      = self._formats[attribute]
+        float_format = FloatFormat.current()
+        if len(formats) == 1:
+            return float_format.format(formats[0][0], value)
+
+        formatting = self._select(formats, value)
+        if formatting != None:
+            try:
+                return float_format.format(formatting, value)
+            except TypeError, e:
+                pass
+
+        # fall back to trying each entry in turn
+        for formatting, kinds in formats:
+            try:
+                return float_format.format(formatting, value)
+            except TypeError, e:
+                pass
+        raise TypeError("Valid format not found for values.")
+
+    #--------------------------------------------------------------------------
+    # helper methods
+    #--------------------------------------------------------------------------
+
+    def _select(self, formats, value):
+        """First entry matching the arity and types of the value.
+        """
+        values = value if isinstance(value, tuple) else (value,)
+        for formatting, kinds in formats:
+            if len(kinds) != len(values):
+                continue
+            for numeric, entry in zip(kinds, values):
+                if numeric and not isinstance(entry, AttributePrinter._sNumbers):
+                    break
+            else:
+                return formatting
+        return None
+
+#------------------------------------------------------------------------------
+# class FormatMatcher
+#------------------------------------------------------------------------------
+
+class FormatMatcher(object):
+    """Selects which of several scanf formats matches a line.
+
+    The formats are translated into a single ordered alternation regex, the
+    first alternative that matches is the first format sscanf would accept.
+    Conversions consume exactly the characters sscanf's greedy scan does
+    and only match where that text converts, so the regex decides the
+    format without trying sscanf on each one.  Formats using directives
+    other than %d %i %f %s, ie widths, can't be translated and leave the
+    matcher disabled, scan then tries each format in turn.
+    """
+
+    #--------------------------------------------------------------------------
+    # statics
+    #--------------------------------------------------------------------------
 
-        return block
+    _sMatchers = {}
+
+    _sDirective = re.compile(r'%(.)|(\s+)|([^%\s]+)')
+
+    # sscanf collects a run of the characters a conversion may use and then
+    #  converts it, the lookaheads reject a match it would have read past
+    _sPatterns = {
+        'd' : r'\s*[-+]?\d+(?!\d)',
+        'i' : r'[-+]?(?:0[xX][0-9a-fA-F]+|0[bB][01]+|0+(?![0xX])[0-7]*|'
+              r'[1-9]\d*)(?![0-9a-fA-F])',
+        'f' : r'\s*[-+]?(?:(?:\d+\.?\d*|\.\d+)[eE][-+]?\d+(?!\d)|'
+              r'(?:\d+\.\d+|\.\d+)(?![\deE+-])|\d+\.?(?![.\deE+-]))',
+        's' : r'\s*\S+(?!\S)',
+        '%' : r'%',
+    }
+
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    def get(formatting):
+        """Cached matcher for the list of formats.
+        """
+        key     = tuple(formatting)
+        matcher = FormatMatcher._sMatchers.get(key)
+        if matcher == None:
+            matcher = FormatMatcher(formatting)
+            FormatMatcher._sMatchers[key] = matcher
+        return matcher
+
+    #--------------------------------------------------------------------------
+    # methods
+    #--------------------------------------------------------------------------
+
+    def __init__(self, formatting):
+        self.formatting = list(formatting)
+        self.regex      = None
+
+        try:
+            alternatives = ["(?P<f%d>%s)" % (index, self._translate(entry))
+                            for index, entry in enumerate(self.formatting)]
+            self.regex   = re.compile("|".join(alternatives))
+        except ValueError:
+            pass
+
+    #--------------------------------------------------------------------------
+
+    def select(self, line):
+        """First format matching the line, None if there is none or the
+        matcher is disabled.
+        """
+        if self.regex == None:
+            return None
+        match = self.regex.match(line)
+        if match == None:
+            return None
+        return self.formatting[int(match.lastgroup[1:])]
+
+    #--------------------------------------------------------------------------
+
+    def scan(self, line):
+        """Values read from the line by the first format that matches.
+        """
+
+        # the regex decides the format when there is one
+        if self.regex != None:
+            scanf_format = self.select(line)
+            if scanf_format == None:
+                raise IncompleteCaptureError("Format error for %s" % line)
+            return sscanf(line, scanf_format)
+
+        # otherwise try each entry in turn
+        for scanf_format in self.formatting:
+            try:
+                return sscanf(line, scanf_format)
+            except IncompleteCaptureError, e:
+                pass
+        raise IncompleteCaptureError("Format error for %s" % line)
+
+    #--------------------------------------------------------------------------
+    # helper methods
+    #--------------------------------------------------------------------------
+
+    def _translate(self, entry):
+        """Regex matching the same prefix of a line as the scanf format.
+        """
+        parts = []
+        for match in FormatMatcher._sDirective.finditer(entry):
+            directive, space, literal = match.groups()
+            if directive != None:
+                if directive not in FormatMatcher._sPatterns:
+                    raise ValueError("Unsupported directive %%%s" % directive)
+                parts.append(FormatMatcher._sPatterns[directive])
+            elif space != None:
+                parts.append(r'\s*')
+            else:
+                parts.append(re.escape(literal))
+        return "".join(parts)
+
+#------------------------------------------------------------------------------
+# class RawBlock
+#------------------------------------------------------------------------------
+
+class RawBlock(Block):
+    """Base class for blocks whose body is kept as unparsed text.
+
+    Only the header is parsed up front, the body stays as an offset into the
+    text handed in and is dedented the first time _raw is accessed.  Bodies
+    that were never replaced are written back exactly as they were read.
+    """
+
+    #--------------------------------------------------------------------------
+    # initialization
+    #--------------------------------------------------------------------------
+
+    def __init__(self, block):
+        super(RawBlock, self).__init__()
+
+        # remember where the body starts instead of copying it out
+        index        = block.find('\n')
+        self._block  = block
+        self._offset = len(block) if index < 0 else index + 1
+        self._cache  = None
+
+        # parse the block header
+        self._parseHeader(block[:index] if index >= 0 else block)
+
+    #--------------------------------------------------------------------------
+    # properties
+    #--------------------------------------------------------------------------
+
+    def _getRaw(self):
+        """Body of the block with the indent removed.
+        """
+        if self._cache == None:
+            self._cache = self._removeIndent(self._block[self._offset:])
+        return self._cache
+
+    #--------------------------------------------------------------------------
+
+    def _setRaw(self, raw):
+        self._cache = raw
+        self._block = None
+
+    #--------------------------------------------------------------------------
+
+    _raw = property(_getRaw, _setRaw)
+
+    #--------------------------------------------------------------------------
+    # helper methods
+    #--------------------------------------------------------------------------
+
+    def _printRaw(self):
+        """Indented body of the block, the original text if never replaced.
+        """
+        if self._block != None:
+            return self._block[self._offset:]
+        return self._addIndent(self._cache)
@@ -25,6 +25,11 @@ import re
 from scanf import sscanf
 from scanf import IncompleteCaptureError
 
+from block    import Block
+from common   import Compression
+from common   import FloatFormat
+from snapshot import Snapshot
+
 from cdl_blocks import *
 
 #------------------------------------------------------------------------------
@@ -42,12 +47,26 @@ class CdlFile(object):
     _sVersionFormatting = "# CDL created with massive v%s"
     _sUnitsFormatting   = "units %s"
 
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    def loadSnapshot(path, mmap=False):
+        """Load a parsed file from a binary snapshot.
+        """
+        cdl_file = Snapshot.load(path, mmap)
+        if not isinstance(cdl_file, CdlFile):
+            raise TypeError("Snapshot doesn't contain a CdlFile: %s" % path)
+        return cdl_file
+
     #--------------------------------------------------------------------------
     # methods
     #--------------------------------------------------------------------------
 
-    def __init__(self, path):
-        """Open file at path, read contents into memory, and close.
+    def __init__(self, path, preserve=False, lazy=False):
+        """Open file at path, read contents into memory, and close.  With
+        preserve the source text is kept to write unchanged values back as
+        is, with lazy attributes are only parsed when first read, see
+        Block.parsing.
         """
         super(CdlFile, self).__init__()
 
@@ -55,12 +74,15 @@ class CdlFile(object):
         self._path = path
 
         # read in file contents
-        self._read(path)
+        with Block.parsing(preserve, lazy):
+            self._read(path)
 
     #--------------------------------------------------------------------------
 
-    def write(self, path=None):
-        """Write the file to the given path.
+    def write(self, path=None, level=None, float_format=None):
+        """Write the file to the given path, .gz paths are compressed using
+        the level or the Compression default.  Floats are written using the
+        float format, see FloatFormat.
         """
 
         # use read path if path not specified
@@ -68,7 +90,8 @@ class CdlFile(object):
             path = self._path
 
         # open the file and write out scene
-        with open(path, 'wb') as cdl_file:
+        with Compression.open(path, 'wb', level) as cdl_file, \
+             FloatFormat.use(float_format):
 
             # version
             version = CdlFile._sVersionFormatting % self.version
@@ -81,6 +104,13 @@ class CdlFile(object):
             # write object block to file
             cdl_file.write("%s" % str(self.object_block))
 
+    #--------------------------------------------------------------------------
+
+    def saveSnapshot(self, path):
+        """Write the parsed file to a binary snapshot, see Snapshot.
+        """
+        Snapshot.save(self, path)
+
     #--------------------------------------------------------------------------
     # helper methods
     #--------------------------------------------------------------------------
@@ -89,23 +119,22 @@ class CdlFile(object):
         """Parses the contents of the file at the given path.
         """
 
-        # parse the contents of the file ('U' deals with newlines cross-platformly)
-        with open(path, 'rU') as agent_file:
-            scene = agent_file.read()
+        # parse the contents of the file, newlines are made consistent
+        scene = Compression.read(path)
 
-            # parse out the inital comment
-            version, scene = scene.partition('\n')[::2]
-            self.version   = sscanf(version, CdlFile._sVersionFormatting)
+        # parse out the inital comment
+        version, scene = scene.partition('\n')[::2]
+        self.version   = sscanf(version, CdlFile._sVersionFormatting)
 
-            # eat single newline
-            scene = scene.partition('\n')[2]
+        # eat single newline
+        scene = scene.partition('\n')[2]
 
-            # parse out the units specifier
-            units, scene = scene.partition('\n')[::2]
-            self.units   = sscanf(units, CdlFile._sUnitsFormatting)
+        # parse out the units specifier
+        units, scene = scene.partition('\n')[::2]
+        self.units   = sscanf(units, CdlFile._sUnitsFormatting)
 
-            # eat single newline
-            scene = scene.partition('\n')[2]
+        # eat single newline
+        scene = scene.partition('\n')[2]
 
-            # parse object block
-            self.object_block = ObjectBlock(scene)
+        # parse object block
+        self.object_block = ObjectBlock(scene)
@@ -26,8 +26,12 @@ import re
 from scanf import sscanf
 from scanf import IncompleteCaptureError
 
-from block  import Block
-from common import Variable
+from block    import Block
+from block    import RawBlock
+from common   import NamedList
+from common   import Variable
+from common   import VariableTable
+from skeleton import Skeleton
 
 #------------------------------------------------------------------------------
 # class Object Block
@@ -96,6 +100,15 @@ class ObjectBlock(Block):
         "motion tree"
     ]
 
+    # indent change and number of following lines to leave untouched for
+    #  main block lines by keyword, all other lines get indented
+    _sMainBlockIndents = [
+        ("variable",     -1, 0),    # variables are unindented by one tab
+        ("end dynamics",  0, 0),
+        ("translate",     0, 0),
+        ("transform",     0, 4),    # matrix rows follow the tag
+    ]
+
     #--------------------------------------------------------------------------
     # methods
     #--------------------------------------------------------------------------
@@ -105,22 +118,22 @@ class ObjectBlock(Block):
         """
         super(ObjectBlock, self).__init__()
 
-        # initialize fields
-        self.variables   = []
+        # initialize fields, named entries are indexed for lookups by name
+        self.variables   = NamedList()
         self.dynamics    = None
         self.transform   = None
-        self.afields     = []
-        self.standins    = []
-        self.segments    = []
-        self.springs     = []
-        self.materials   = []
-        self.clothes     = []
-        self.geometries  = []
-        self.options     = []
-        self.hairs       = []
-        self.bones       = []
+        self.afields     = NamedList()
+        self.standins    = NamedList()
+        self.segments    = NamedList()
+        self.springs     = NamedList()
+        self.materials   = NamedList()
+        self.clothes     = NamedList()
+        self.geometries  = NamedList()
+        self.options     = NamedList()
+        self.hairs       = NamedList()
+        self.bones       = NamedList()
         self.fuzzies     = []
-        self.actions     = []
+        self.actions     = NamedList()
         self.motiontrees = []
 
         # fix block formatting for consistancy
@@ -199,33 +212,50 @@ class ObjectBlock(Block):
 
         return block
 
+    #--------------------------------------------------------------------------
+
+    def skeleton(self):
+        """Build an array backed tree of the agent segments.
+        """
+        return Skeleton.fromSegments(self.segments, self.order, self.angles)
+
+    #--------------------------------------------------------------------------
+
+    def variableTable(self):
+        """Build an array backed table of the agent variables, see
+        VariableTable.update to apply changes made to it.
+        """
+        return VariableTable(self.variables)
+
     #--------------------------------------------------------------------------
     # helper methods
     #--------------------------------------------------------------------------
 
     def _processBlock(self, block, mode):
         """Attempts to fix the fucked up indenting that the cdl file uses.
+
+        The indent change for each line is worked out in a single pass and
+        applied with slicing.  Pre processing adds the indents, post
+        processing takes them away again.
         """
 
         # we can either pre or post process the block
         if mode == "pre":
-            addIndent    = self._addIndent
-            removeIndent = self._removeIndent
+            sign = 1
         elif mode == "post":
-            addIndent    = self._removeIndent
-            removeIndent = self._addIndent
+            sign = -1
 
         # split up the block into lines
         lines = block.split('\n')
 
         # run through each line fixing the indentation
-        new_lines     = []
         in_main_block = True
         in_dynamics   = False
         in_motiontree = True
         skip_count    = 0
-        for index in range(len(lines)):
-            line = lines[index]
+        for index, line in enumerate(lines):
+            stripped = line.lstrip(' ')
+            delta    = 0
 
             # - context checking -
 
@@ -247,63 +277,59 @@ class ObjectBlock(Block):
 
             if skip_count > 0:
                 skip_count -= 1
-                pass
 
             # skip start object tag
             elif line.startswith("object"):
                 pass
 
-            # main block formatting
+            # main block formatting, special processing for dynamics block
             elif in_main_block:
-
-                # special processing for dynamics block
                 if in_dynamics:
-                    if line.lstrip(' ').startswith("rbd_solver"):
-                        lines[index] = addIndent(line)
-
-                # variables should be unindented by one tab
-                elif line.lstrip(' ').startswith("variable"):
-                    lines[index] = removeIndent(line)
-
-                # skip end dynamics tag
-                elif line.lstrip(' ').startswith("end dynamics"):
-                    pass
-
-                # skip translate tag
-                elif line.lstrip(' ').startswith("translate"):
-                    pass
-
-                # skip transform tag
-                elif line.lstrip(' ').startswith("transform"):
-                    skip_count = 4
-                    pass
-
-                # default to adding an indent
+                    delta = 1 if stripped.startswith("rbd_solver") else 0
                 else:
-                    lines[index] = addIndent(line)
+                    delta, skip_count = self._getMainBlockIndent(stripped)
 
             # add indent to first motion tree line seperator
             elif in_motiontree and (line == ''):
                 if mode == "pre":
-                    lines[index]  = "        "
+                    lines[index] = "        "
                 in_motiontree = False
 
             # skip object end tag
             elif line.startswith("end object"):
                 pass
 
-            elif (mode == "post") and line.lstrip(' ').startswith('\t'):
-                lines[index] = line.lstrip(' ')
+            elif (mode == "post") and stripped.startswith('\t'):
+                lines[index] = stripped
 
             # default to adding an indent
             else:
-                lines[index] = addIndent(line)
+                delta = 1
+
+            # - apply indent change -
+
+            delta *= sign
+            if (delta > 0) and (line != ''):
+                lines[index] = "    " + line
+            elif (delta < 0) and line.startswith("    "):
+                lines[index] = line[4:]
 
         # return newly formatted block
         return "\n".join(lines)
 
     #--------------------------------------------------------------------------
 
+    def _getMainBlockIndent(self, line):
+        """Looks up the indent change and number of lines to leave untouched
+        for an unindented main block line.
+        """
+        for keyword, delta, skip_count in ObjectBlock._sMainBlockIndents:
+            if line.startswith(keyword):
+                return delta, skip_count
+        return 1, 0
+
+    #--------------------------------------------------------------------------
+
     def _parseHeader(self, header):
         """Object block header contains object name.
         """
@@ -502,7 +528,7 @@ class ObjectBlock(Block):
 # class DynamicsBlock
 #------------------------------------------------------------------------------
 
-class DynamicsBlock(Block):
+class DynamicsBlock(RawBlock):
     """Defines agents dynamics settings.
     """
 
@@ -520,23 +546,13 @@ class DynamicsBlock(Block):
     def __init__(self, block):
         """Initialize self with agent data.
         """
-        super(DynamicsBlock, self).__init__()
-
-        # remove the block header
-        header, block = block.partition('\n')[::2]
-        self._parseHeader(header)
-
-        # remove indent from block
-        block = self._removeIndent(block)
-
-        # save attributes
-        self._raw = block
+        super(DynamicsBlock, self).__init__(block)
 
     #--------------------------------------------------------------------------
 
     def __str__(self):
-        block = self._raw
-        return "dynamics\n%s\nend dynamics" % self._addIndent(block)
+        block = self._printRaw()
+        return "dynamics\n%s\nend dynamics" % block
 
     #--------------------------------------------------------------------------
     # methods
@@ -552,7 +568,7 @@ class DynamicsBlock(Block):
 # class AFieldBlock
 #------------------------------------------------------------------------------
 
-class AFieldBlock(Block):
+class AFieldBlock(RawBlock):
     """Defines an agent field.
     """
 
@@ -570,24 +586,14 @@ class AFieldBlock(Block):
     def __init__(self, block):
         """Initialize self with agent data.
         """
-        super(AFieldBlock, self).__init__()
-
-        # remove the block header
-        header, block = block.partition('\n')[::2]
-        self._parseHeader(header)
-
-        # remove indent from block
-        block = self._removeIndent(block)
-
-        # save attributes
-        self._raw = block
+        super(AFieldBlock, self).__init__(block)
 
     #--------------------------------------------------------------------------
 
     def __str__(self):
         header = "afield %s %s" % (self.type, self.name)
-        block  = self._raw
-        return "%s\n%s\nend afield\n" % (header, self._addIndent(block))
+        block  = self._printRaw()
+        return "%s\n%s\nend afield\n" % (header, block)
 
     #--------------------------------------------------------------------------
     # methods
@@ -603,7 +609,7 @@ class AFieldBlock(Block):
 # class StandinBlock
 #------------------------------------------------------------------------------
 
-class StandinBlock(Block):
+class StandinBlock(RawBlock):
     """Defines agent standins.
     """
 
@@ -621,24 +627,14 @@ class StandinBlock(Block):
     def __init__(self, block):
         """Initialize self with agent data.
         """
-        super(StandinBlock, self).__init__()
-
-        # remove the block header
-        header, block = block.partition('\n')[::2]
-        self._parseHeader(header)
-
-        # remove indent from block
-        block = self._removeIndent(block)
-
-        # save attributes
-        self._raw = block
+        super(StandinBlock, self).__init__(block)
 
     #--------------------------------------------------------------------------
 
     def __str__(self):
         header = "standin %s" % self.name
-        block  = self._raw
-        return "%s\n%s\n" % (header, self._addIndent(block))
+        block  = self._printRaw()
+        return "%s\n%s\n" % (header, block)
 
     #--------------------------------------------------------------------------
     # methods
@@ -654,7 +650,7 @@ class StandinBlock(Block):
 # class SegmentNode
 #------------------------------------------------------------------------------
 
-class SegmentNode(Block):
+class SegmentNode(RawBlock):
     """Defines an agent joint.
     """
 
@@ -672,24 +668,14 @@ class SegmentNode(Block):
     def __init__(self, block):
         """Initialize self with agent data.
         """
-        super(SegmentNode, self).__init__()
-
-        # remove the block header
-        header, block = block.partition('\n')[::2]
-        self._parseHeader(header)
-
-        # remove indent from block
-        block = self._removeIndent(block)
-
-        # save attributes
-        self._raw = block
+        super(SegmentNode, self).__init__(block)
 
     #--------------------------------------------------------------------------
 
     def __str__(self):
         header = ("segment %s" % self.name) if self.name else "segment"
-        block  = self._raw
-        return "%s\n%s\n" % (header, self._addIndent(block))
+        block  = self._printRaw()
+        return "%s\n%s\n" % (header, block)
 
     #--------------------------------------------------------------------------
     # methods
@@ -713,7 +699,7 @@ class SegmentNode(Block):
 # class SpringNode
 #------------------------------------------------------------------------------
 
-class SpringNode(Block):
+class SpringNode(RawBlock):
     """Defines an agent spring.
     """
 
@@ -731,24 +717,14 @@ class SpringNode(Block):
     def __init__(self, block):
         """Initialize self with agent data.
         """
-        super(SpringNode, self).__init__()
-
-        # remove the block header
-        header, block = block.partition('\n')[::2]
-        self._parseHeader(header)
-
-        # remove indent from block
-        block = self._removeIndent(block)
-
-        # save attributes
-        self._raw = block
+        super(SpringNode, self).__init__(block)
 
     #--------------------------------------------------------------------------
 
     def __str__(self):
         header = ("spring %s" % self.name) if self.name else "spring"
-        block  = self._raw
-        return "%s\n%s\n" % (header, self._addIndent(block))
+        block  = self._printRaw()
+        return "%s\n%s\n" % (header, block)
 
     #--------------------------------------------------------------------------
     # methods
@@ -772,7 +748,7 @@ class SpringNode(Block):
 # class MaterialNode
 #------------------------------------------------------------------------------
 
-class MaterialNode(Block):
+class MaterialNode(RawBlock):
     """Defines an agent material.
     """
 
@@ -790,24 +766,14 @@ class MaterialNode(Block):
     def __init__(self, block):
         """Initialize self with agent data.
         """
-        super(MaterialNode, self).__init__()
-
-        # remove the block header
-        header, block = block.partition('\n')[::2]
-        self._parseHeader(header)
-
-        # remove indent from block
-        block = self._removeIndent(block)
-
-        # save attributes
-        self._raw = block
+        super(MaterialNode, self).__init__(block)
 
     #--------------------------------------------------------------------------
 
     def __str__(self):
         header = ("material %s" % self.name) if self.name else "material"
-        block  = self._raw
-        return "%s\n%s\n" % (header, self._addIndent(block))
+        block  = self._printRaw()
+        return "%s\n%s\n" % (header, block)
 
     #--------------------------------------------------------------------------
     # methods
@@ -831,7 +797,7 @@ class MaterialNode(Block):
 # class ClothNode
 #------------------------------------------------------------------------------
 
-class ClothNode(Block):
+class ClothNode(RawBlock):
     """Defines agent cloth.
     """
 
@@ -849,24 +815,14 @@ class ClothNode(Block):
     def __init__(self, block):
         """Initialize self with agent data.
         """
-        super(ClothNode, self).__init__()
-
-        # remove the block header
-        header, block = block.partition('\n')[::2]
-        self._parseHeader(header)
-
-        # remove indent from block
-        block = self._removeIndent(block)
-
-        # save attributes
-        self._raw = block
+        super(ClothNode, self).__init__(block)
 
     #--------------------------------------------------------------------------
 
     def __str__(self):
         header = ("cloth %s" % self.name) if self.name else "cloth"
-        block  = self._raw
-        return "%s\n%s\n" % (header, self._addIndent(block))
+        block  = self._printRaw()
+        return "%s\n%s\n" % (header, block)
 
     #--------------------------------------------------------------------------
     # methods
@@ -890,7 +846,7 @@ class ClothNode(Block):
 # class GeometryNode
 #------------------------------------------------------------------------------
 
-class GeometryNode(Block):
+class GeometryNode(RawBlock):
     """Defines agent geometry.
     """
 
@@ -908,24 +864,14 @@ class GeometryNode(Block):
     def __init__(self, block):
         """Initialize self with agent data.
         """
-        super(GeometryNode, self).__init__()
-
-        # remove the block header
-        header, block = block.partition('\n')[::2]
-        self._parseHeader(header)
-
-        # remove indent from block
-        block = self._removeIndent(block)
-
-        # save attributes
-        self._raw = block
+        super(GeometryNode, self).__init__(block)
 
     #--------------------------------------------------------------------------
 
     def __str__(self):
         header = ("geometry %s" % self.name) if self.name else "geometry"
-        block  = self._raw
-        return "%s\n%s\n" % (header, self._addIndent(block))
+        block  = self._printRaw()
+        return "%s\n%s\n" % (header, block)
 
     #--------------------------------------------------------------------------
     # methods
@@ -949,7 +895,7 @@ class GeometryNode(Block):
 # class OptionNode
 #------------------------------------------------------------------------------
 
-class OptionNode(Block):
+class OptionNode(RawBlock):
     """Defines an agent option.
     """
 
@@ -967,24 +913,14 @@ class OptionNode(Block):
     def __init__(self, block):
         """Initialize self with agent data.
         """
-        super(OptionNode, self).__init__()
-
-        # remove the block header
-        header, block = block.partition('\n')[::2]
-        self._parseHeader(header)
-
-        # remove indent from block
-        block = self._removeIndent(block)
-
-        # save attributes
-        self._raw = block
+        super(OptionNode, self).__init__(block)
 
     #--------------------------------------------------------------------------
 
     def __str__(self):
         header = ("option %s" % self.name) if self.name else "option"
-        block  = self._raw
-        return "%s\n%s\n\n" % (header, self._addIndent(block))
+        block  = self._printRaw()
+        return "%s\n%s\n\n" % (header, block)
 
     #--------------------------------------------------------------------------
     # methods
@@ -1000,7 +936,7 @@ class OptionNode(Block):
 # class HairNode
 #------------------------------------------------------------------------------
 
-class HairNode(Block):
+class HairNode(RawBlock):
     """Defines agent hair.
     """
 
@@ -1018,24 +954,14 @@ class HairNode(Block):
     def __init__(self, block):
         """Initialize self with agent data.
         """
-        super(HairNode, self).__init__()
-
-        # remove the block header
-        header, block = block.partition('\n')[::2]
-        self._parseHeader(header)
-
-        # remove indent from block
-        block = self._removeIndent(block)
-
-        # save attributes
-        self._raw = block
+        super(HairNode, self).__init__(block)
 
     #--------------------------------------------------------------------------
 
     def __str__(self):
         header = ("hair %s" % self.name) if self.name else "hair"
-        block  = self._raw
-        return "%s\n%s\n" % (header, self._addIndent(block))
+        block  = self._printRaw()
+        return "%s\n%s\n" % (header, block)
 
     #--------------------------------------------------------------------------
     # methods
@@ -1059,7 +985,7 @@ class HairNode(Block):
 # class BoneBlock
 #------------------------------------------------------------------------------
 
-class BoneBlock(Block):
+class BoneBlock(RawBlock):
     """Defines an agent bone.
     """
 
@@ -1077,24 +1003,14 @@ class BoneBlock(Block):
     def __init__(self, block):
         """Initialize self with agent data.
         """
-        super(BoneBlock, self).__init__()
-
-        # remove the block header
-        header, block = block.partition('\n')[::2]
-        self._parseHeader(header)
-
-        # remove indent from block
-        block = self._removeIndent(block)
-
-        # save attributes
-        self._raw = block
+        super(BoneBlock, self).__init__(block)
 
     #--------------------------------------------------------------------------
 
     def __str__(self):
         header = "bone %s" % self.name
-        block  = self._raw
-        return "%s\n%s" % (header, self._addIndent(block))
+        block  = self._printRaw()
+        return "%s\n%s" % (header, block)
 
     #--------------------------------------------------------------------------
     # methods
@@ -1110,7 +1026,7 @@ class BoneBlock(Block):
 # class FuzzyNode
 #------------------------------------------------------------------------------
 
-class FuzzyNode(Block):
+class FuzzyNode(RawBlock):
     """Defines an agent brain node.
     """
 
@@ -1128,24 +1044,14 @@ class FuzzyNode(Block):
     def __init__(self, block):
         """Initialize self with agent data.
         """
-        super(FuzzyNode, self).__init__()
-
-        # remove the block header
-        header, block = block.partition('\n')[::2]
-        self._parseHeader(header)
-
-        # remove indent from block
-        block = self._removeIndent(block)
-
-        # save attributes
-        self._raw = block
+        super(FuzzyNode, self).__init__(block)
 
     #--------------------------------------------------------------------------
 
     def __str__(self):
         header = "fuzzy %s" % self.type
-        block  = self._raw
-        return "%s\n%s" % (header, self._addIndent(block))
+        block  = self._printRaw()
+        return "%s\n%s" % (header, block)
 
     #--------------------------------------------------------------------------
     # methods
@@ -1161,7 +1067,7 @@ class FuzzyNode(Block):
 # class ActionBlock
 #------------------------------------------------------------------------------
 
-class ActionBlock(Block):
+class ActionBlock(RawBlock):
     """Defines an agent mocap animation.
     """
 
@@ -1179,24 +1085,14 @@ class ActionBlock(Block):
     def __init__(self, block):
         """Initialize self with agent data.
         """
-        super(ActionBlock, self).__init__()
-
-        # remove the block header
-        header, block = block.partition('\n')[::2]
-        self._parseHeader(header)
-
-        # remove indent from block
-        block = self._removeIndent(block)
-
-        # save attributes
-        self._raw = block
+        super(ActionBlock, self).__init__(block)
 
     #--------------------------------------------------------------------------
 
     def __str__(self):
         header = "action %s" % self.name
-        block  = self._raw
-        return "%s\n%s\n" % (header, self._addIndent(block))
+        block  = self._printRaw()
+        return "%s\n%s\n" % (header, block)
 
     #--------------------------------------------------------------------------
     # methods
@@ -1212,7 +1108,7 @@ class ActionBlock(Block):
 # class MotionTreeBlock
 #------------------------------------------------------------------------------
 
-class MotionTreeBlock(Block):
+class MotionTreeBlock(RawBlock):
     """Defines an agent motion tree.
     """
 
@@ -1230,23 +1126,13 @@ class MotionTreeBlock(Block):
     def __init__(self, block):
         """Initialize self with agent data.
         """
-        super(MotionTreeBlock, self).__init__()
-
-        # remove the block header
-        header, block = block.partition('\n')[::2]
-        self._parseHeader(header)
-
-        # remove indent from block
-        block = self._removeIndent(block)
-
-        # save attributes
-        self._raw = block
+        super(MotionTreeBlock, self).__init__(block)
 
     #--------------------------------------------------------------------------
 
     def __str__(self):
-        block  = self._raw
-        return "motion tree\n%s\n" % self._addIndent(block)
+        block  = self._printRaw()
+        return "motion tree\n%s\n" % block
 
     #--------------------------------------------------------------------------
     # methods
@@ -20,41 +20,1090 @@
 # common.py - Common objects found in Massive files.
 #------------------------------------------------------------------------------
 
+import bisect
+import contextlib
+import gzip
+import heapq
+import io
+import itertools
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+
+import numpy as np
+
 #------------------------------------------------------------------------------
 # class Variable
 #------------------------------------------------------------------------------
 
 class Variable(object):
     """Massive agent varaible.
+
+    Place group variables can carry extra trailing fields after the
+    expression, these are kept as is in extra.
     """
 
+    __slots__ = ('name', 'default', 'min', 'max', 'expr', 'extra')
+
     #--------------------------------------------------------------------------
     # methods
     #--------------------------------------------------------------------------
 
-    def __init__(self, name):
-        self.name    = name;
-        self.default = 0.0
-        self.min     = 0.0
-        self.max     = 1.0
-        self.expr    = ""
-
-    #--------------------------------------------------------------------------
-
-    def __init__(self, name, default, min, max, expr=""):
+    def __init__(self, name, default=0.0, min=0.0, max=1.0, expr="", *extra):
         self.name    = name
         self.default = default
-        self.max     = max
         self.min     = min
+        self.max     = max
         self.expr    = expr
+        self.extra   = extra
 
     #--------------------------------------------------------------------------
 
     def __str__(self):
-        if (self.expr == ""):
-            data = (self.name, self.default, self.min, self.max)
-            return "variable %s %f [%f %f]" % data
+        return Variable._format(self.name, self.default, self.min, self.max,
+                                self.expr, self.extra)
+
+    #--------------------------------------------------------------------------
+
+    def __repr__(self):
+        return "<Variable %s>" % self.name
+
+    #--------------------------------------------------------------------------
+    # helper methods
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    def _format(name, default, min, max, expr, extra):
+        """Variable line from its fields.
+        """
+        data = (name, default, min, max)
+        line = "variable %s %f [%f %f]" % data
+        if expr != "":
+            line = " ".join([line, str(expr)] + map(str, extra))
+        return line
+
+#------------------------------------------------------------------------------
+# class VariableTable
+#------------------------------------------------------------------------------
+
+class VariableTable(object):
+    """Agent variables stored as parallel arrays.
+
+    Defaults, mins and maxs are float64 arrays so whole tables can be
+    clamped or range checked at once, names, exprs and extras are lists.
+    Blocks keep their variables as Variable objects and build a table on
+    demand.  Entries are handed out as Variable copies, changes are made
+    by assigning them back or by editing the arrays directly, and update
+    copies them back into the variables.
+    """
+
+    #--------------------------------------------------------------------------
+    # methods
+    #--------------------------------------------------------------------------
+
+    def __init__(self, variables=()):
+        """Initialize self with an optional iterable of variables.
+        """
+        super(VariableTable, self).__init__()
+
+        self._names    = []
+        self._exprs    = []
+        self._extras   = []
+        self._index    = {}
+        self._size     = 0
+        self._defaults = np.zeros(0, dtype=np.float64)
+        self._mins     = np.zeros(0, dtype=np.float64)
+        self._maxs     = np.zeros(0, dtype=np.float64)
+
+        for variable in variables:
+            self.append(variable)
+
+    #--------------------------------------------------------------------------
+
+    def __str__(self):
+        return "\n".join(map(Variable._format, self._names,
+                             self.defaults.tolist(), self.mins.tolist(),
+                             self.maxs.tolist(), self._exprs, self._extras))
+
+    #--------------------------------------------------------------------------
+
+    def __len__(self):
+        return self._size
+
+    #--------------------------------------------------------------------------
+
+    def __iter__(self):
+        for index in xrange(self._size):
+            yield self._variable(index)
+
+    #--------------------------------------------------------------------------
+
+    def __contains__(self, name):
+        return name in self._index
+
+    #--------------------------------------------------------------------------
+
+    def __getitem__(self, key):
+        """Variable copy by index or name.
+        """
+        return self._variable(self._position(key))
+
+    #--------------------------------------------------------------------------
+
+    def __setitem__(self, key, variable):
+        """Replace the variable at the index or name.
+        """
+        index = self._position(key)
+        self._names[index]    = variable.name
+        self._exprs[index]    = variable.expr
+        self._extras[index]   = tuple(variable.extra)
+        self._defaults[index] = variable.default
+        self._mins[index]     = variable.min
+        self._maxs[index]     = variable.max
+        self._reindex()
+
+    #--------------------------------------------------------------------------
+
+    def __delitem__(self, key):
+        """Remove the variable at the index or name.
+        """
+        index = self._position(key)
+        for values in (self._names, self._exprs, self._extras):
+            del values[index]
+        for array in (self._defaults, self._mins, self._maxs):
+            array[index:self._size - 1] = array[index + 1:self._size]
+        self._size -= 1
+        self._reindex()
+
+    #--------------------------------------------------------------------------
+
+    @property
+    def defaults(self):
+        return self._defaults[:self._size]
+
+    #--------------------------------------------------------------------------
+
+    @property
+    def mins(self):
+        return self._mins[:self._size]
+
+    #--------------------------------------------------------------------------
+
+    @property
+    def maxs(self):
+        return self._maxs[:self._size]
+
+    #--------------------------------------------------------------------------
+
+    @property
+    def exprs(self):
+        return list(self._exprs)
+
+    #--------------------------------------------------------------------------
+
+    def append(self, variable):
+        """Add a variable to the end of the table.
+        """
+
+        # grow the arrays by doubling
+        if self._size == len(self._defaults):
+            capacity = max(8, 2 * self._size)
+            for name in ('_defaults', '_mins', '_maxs'):
+                array = np.zeros(capacity, dtype=np.float64)
+                array[:self._size] = getattr(self, name)[:self._size]
+                setattr(self, name, array)
+
+        index = self._size
+        self._names.append(variable.name)
+        self._exprs.append(variable.expr)
+        self._extras.append(tuple(variable.extra))
+        self._defaults[index] = variable.default
+        self._mins[index]     = variable.min
+        self._maxs[index]     = variable.max
+        self._index.setdefault(variable.name, index)
+        self._size += 1
+
+    #--------------------------------------------------------------------------
+
+    def update(self, variables):
+        """Copy the values of the table back into the variables, matched by
+        position, ie the variables the table was built from.  Names are left
+        as is.
+        """
+        variables = list(variables)
+        if len(variables) != self._size:
+            raise ValueError("Expected %d variables, got %d" % \
+                (self._size, len(variables)))
+
+        defaults = self.defaults.tolist()
+        mins     = self.mins.tolist()
+        maxs     = self.maxs.tolist()
+        for index, variable in enumerate(variables):
+            variable.default = defaults[index]
+            variable.min     = mins[index]
+            variable.max     = maxs[index]
+            variable.expr    = self._exprs[index]
+            variable.extra   = self._extras[index]
+
+    #--------------------------------------------------------------------------
+
+    def find(self, name, default=None):
+        """Returns a copy of the first variable with the name.
+        """
+        index = self._index.get(name)
+        return default if index == None else self._variable(index)
+
+    #--------------------------------------------------------------------------
+
+    def hasName(self, name):
+        return name in self._index
+
+    #--------------------------------------------------------------------------
+
+    def index(self, name):
+        """Position of the first variable with the name.
+        """
+        return self._index[name]
+
+    #--------------------------------------------------------------------------
+
+    def names(self):
+        """Returns the names of the variables in order.
+        """
+        return list(self._names)
+
+    #--------------------------------------------------------------------------
+
+    def clamp(self, values=None):
+        """Clamp values to the variable ranges.  Values are per variable
+        along the last axis, ie (n,) or (frames, n).  Without values the
+        defaults are clamped in place.
+        """
+        if values is None:
+            np.clip(self.defaults, self.mins, self.maxs, out=self.defaults)
+            return self.defaults
+        return np.clip(values, self.mins, self.maxs)
+
+    #--------------------------------------------------------------------------
+
+    def inRange(self, values=None):
+        """Boolean mask of values inside the variable ranges, the defaults
+        are checked without values.
+        """
+        values = self.defaults if values is None else np.asarray(values)
+        return (values >= self.mins) & (values <= self.maxs)
+
+    #--------------------------------------------------------------------------
+
+    def outOfRange(self):
+        """Names of the variables with defaults outside of their range.
+        """
+        return [self._names[i] for i in np.flatnonzero(~self.inRange())]
+
+    #--------------------------------------------------------------------------
+    # helper methods
+    #--------------------------------------------------------------------------
+
+    def _variable(self, index):
+        return Variable(self._names[index], self._defaults[index].item(),
+                        self._mins[index].item(), self._maxs[index].item(),
+                        self._exprs[index], *self._extras[index])
+
+    #--------------------------------------------------------------------------
+
+    def _position(self, key):
+        """Index for a name or an integer index.
+        """
+        if isinstance(key, basestring):
+            return self._index[key]
+        if key < 0:
+            key += self._size
+        if not 0 <= key < self._size:
+            raise IndexError("Variable index out of range")
+        return key
+
+    #--------------------------------------------------------------------------
+
+    def _reindex(self):
+        self._index = {}
+        for index, name in enumerate(self._names):
+            self._index.setdefault(name, index)
+
+#------------------------------------------------------------------------------
+# class RangeSet
+#------------------------------------------------------------------------------
+
+class RangeSet(object):
+    """Set of integer ids stored as sorted disjoint inclusive ranges.
+
+    Massive writes id lists (non_process, replay) using a range syntax, ie
+    '1-5 7 9-12'.  Ranges are kept as is instead of being expanded so huge
+    id lists stay small, membership is a binary search over the range starts.
+    """
+
+    #--------------------------------------------------------------------------
+    # statics
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    def fromString(block):
+        """Create a set from a block of text using the range syntax.
+        """
+        ranges = []
+        for entry in block.split():
+            start, _, end = entry.partition('-')
+            ranges.append((int(start), int(end if end else start)))
+        return RangeSet.fromRanges(ranges)
+
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    def fromRanges(ranges):
+        """Create a set from a list of inclusive (start, end) tuples.  The
+        ranges may be unsorted and overlapping.
+        """
+        id_set = RangeSet()
+        id_set._setRanges(sorted(ranges))
+        return id_set
+
+    #--------------------------------------------------------------------------
+    # methods
+    #--------------------------------------------------------------------------
+
+    def __init__(self, ids=None):
+        """Initialize self with an optional iterable of ids.
+        """
+        super(RangeSet, self).__init__()
+
+        self._starts = []
+        self._ends   = []
+
+        # group consecutive ids into ranges, ids can be a numpy array
+        if ids is not None:
+            isInRange = lambda n, c=itertools.count(): n - next(c)
+            groups    = itertools.groupby(sorted(set(ids)), isInRange)
+            for _, group in groups:
+                group = list(group)
+                self._starts.append(int(group[0]))
+                self._ends.append(int(group[-1]))
+
+    #--------------------------------------------------------------------------
+
+    def __str__(self):
+        makeRange = lambda (s, e): str(s) if s == e else "%s-%s" % (s, e)
+        return " ".join(map(makeRange, self.ranges()))
+
+    #--------------------------------------------------------------------------
+
+    def __repr__(self):
+        return "RangeSet('%s')" % str(self)
+
+    #--------------------------------------------------------------------------
+
+    def __contains__(self, id):
+        index = bisect.bisect_right(self._starts, id) - 1
+        return (index >= 0) and (id <= self._ends[index])
+
+    #--------------------------------------------------------------------------
+
+    def __iter__(self):
+        for start, end in self.ranges():
+            for id in xrange(start, end + 1):
+                yield id
+
+    #--------------------------------------------------------------------------
+
+    def __len__(self):
+        return sum([e - s + 1 for s, e in self.ranges()])
+
+    #--------------------------------------------------------------------------
+
+    def __nonzero__(self):
+        return len(self._starts) > 0
+
+    #--------------------------------------------------------------------------
+
+    def __eq__(self, other):
+        if not isinstance(other, RangeSet):
+            return NotImplemented
+        return (self._starts == other._starts) and (self._ends == other._ends)
+
+    #--------------------------------------------------------------------------
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    #--------------------------------------------------------------------------
+
+    def __or__(self, other):
+        return self.union(other)
+
+    #--------------------------------------------------------------------------
+
+    def __sub__(self, other):
+        return self.difference(other)
+
+    #--------------------------------------------------------------------------
+
+    def ranges(self):
+        """Iterate over the inclusive (start, end) ranges in order.
+        """
+        return itertools.izip(self._starts, self._ends)
+
+    #--------------------------------------------------------------------------
+
+    def union(self, other):
+        """Returns a new set with the ids from both sets.
+        """
+        other  = self._coerce(other)
+        id_set = RangeSet()
+        id_set._setRanges(heapq.merge(self.ranges(), other.ranges()))
+        return id_set
+
+    #--------------------------------------------------------------------------
+
+    def difference(self, other):
+        """Returns a new set with the ids not found in the other set.
+        """
+
+        other  = self._coerce(other)
+        ranges = []
+
+        # sweep both range lists at once, cutting holes out of each range
+        index = 0
+        count = len(other._starts)
+        for start, end in self.ranges():
+
+            # skip ranges completely before the current range
+            while (index < count) and (other._ends[index] < start):
+                index += 1
+
+            # cut out all overlapping ranges
+            current = start
+            overlap = index
+            while (overlap < count) and (other._starts[overlap] <= end):
+                if other._starts[overlap] > current:
+                    ranges.append((current, other._starts[overlap] - 1))
+                current  = max(current, other._ends[overlap] + 1)
+                overlap += 1
+
+            # add whats left of the range
+            if current <= end:
+                ranges.append((current, end))
+
+        id_set = RangeSet()
+        id_set._setRanges(ranges)
+        return id_set
+
+    #--------------------------------------------------------------------------
+
+    def add(self, id):
+        """Add a single id to the set, joining it to the neighbouring ranges.
+        """
+
+        index = bisect.bisect_right(self._starts, id) - 1
+        if (index >= 0) and (id <= self._ends[index]):
+            return
+
+        left  = (index >= 0) and (self._ends[index] == id - 1)
+        right = (index + 1 < len(self._starts)) and (self._starts[index + 1] == id + 1)
+        if left and right:
+            self._ends[index] = self._ends[index + 1]
+            del self._starts[index + 1]
+            del self._ends[index + 1]
+        elif left:
+            self._ends[index] = id
+        elif right:
+            self._starts[index + 1] = id
+        else:
+            self._starts.insert(index + 1, id)
+            self._ends.insert(index + 1, id)
+
+    #--------------------------------------------------------------------------
+
+    def discard(self, id):
+        """Remove a single id from the set if present, splitting its range.
+        """
+
+        index = bisect.bisect_right(self._starts, id) - 1
+        if (index < 0) or (id > self._ends[index]):
+            return
+
+        start, end = self._starts[index], self._ends[index]
+        if start == end:
+            del self._starts[index]
+            del self._ends[index]
+        elif id == start:
+            self._starts[index] = id + 1
+        elif id == end:
+            self._ends[index] = id - 1
+        else:
+            self._ends[index] = id - 1
+            self._starts.insert(index + 1, id + 1)
+            self._ends.insert(index + 1, end)
+
+    #--------------------------------------------------------------------------
+    # helper methods
+    #--------------------------------------------------------------------------
+
+    def _coerce(self, ids):
+        """Converts an iterable of ids into a set if required.
+        """
+        return ids if isinstance(ids, RangeSet) else RangeSet(ids)
+
+    #--------------------------------------------------------------------------
+
+    def _setRanges(self, ranges):
+        """Replaces the ranges, merging overlapping and adjacent ranges.  The
+        ranges are expected to be sorted.
+        """
+
+        starts = []
+        ends   = []
+        for start, end in ranges:
+            if ends and (start <= ends[-1] + 1):
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+
+        self._starts = starts
+        self._ends   = ends
+
+#------------------------------------------------------------------------------
+# class NamedList
+#------------------------------------------------------------------------------
+
+class NamedList(list):
+    """List of named entries with a dictionary index for lookups by name.
+
+    The list keeps the original order for writing.  The index maps each
+    name to the position of its first entry, appending, inserting and
+    removing single entries update it in place, any other change to the
+    list rebuilds it on the next lookup.  When names are duplicated the
+    first entry wins.  Renaming an entry in place requires a call to
+    reindex().
+    """
+
+    #--------------------------------------------------------------------------
+    # methods
+    #--------------------------------------------------------------------------
+
+    def __init__(self, entries=(), key='name'):
+        """Initialize self with optional entries, key is the attribute used
+        as the name.
+        """
+        super(NamedList, self).__init__(entries)
+        self._key   = key
+        self._index = None
+
+    #--------------------------------------------------------------------------
+
+    def find(self, name, default=None):
+        """Returns the first entry with the name.
+        """
+        position = self._getIndex().get(name)
+        return default if position == None else self[position]
+
+    #--------------------------------------------------------------------------
+
+    def hasName(self, name):
+        return name in self._getIndex()
+
+    #--------------------------------------------------------------------------
+
+    def names(self):
+        """Returns the names of the entries in order.
+        """
+        return [getattr(e, self._key) for e in self]
+
+    #--------------------------------------------------------------------------
+
+    def reindex(self):
+        """Forces the index to be rebuilt on the next lookup.
+        """
+        self._index = None
+
+    #--------------------------------------------------------------------------
+    # list methods
+    #--------------------------------------------------------------------------
+
+    def append(self, entry):
+        super(NamedList, self).append(entry)
+        if self._index != None:
+            self._index.setdefault(getattr(entry, self._key), len(self) - 1)
+
+    #--------------------------------------------------------------------------
+
+    def extend(self, entries):
+        super(NamedList, self).extend(entries)
+        self._index = None
+
+    #--------------------------------------------------------------------------
+
+    def insert(self, position, entry):
+
+        # clamp the position the way list.insert does
+        count    = len(self)
+        position = max(position + count, 0) if position < 0 else min(position, count)
+        super(NamedList, self).insert(position, entry)
+
+        if self._index != None:
+            self._shiftIndex(position, 1)
+            name = getattr(entry, self._key)
+            if self._index.get(name, position + 1) > position:
+                self._index[name] = position
+
+    #--------------------------------------------------------------------------
+
+    def remove(self, entry):
+        del self[self.index(entry)]
+
+    #--------------------------------------------------------------------------
+
+    def pop(self, position=-1):
+        entry = self[position]
+        del self[position]
+        return entry
+
+    #--------------------------------------------------------------------------
+
+    def sort(self, *args, **kwargs):
+        super(NamedList, self).sort(*args, **kwargs)
+        self._index = None
+
+    #--------------------------------------------------------------------------
+
+    def reverse(self):
+        super(NamedList, self).reverse()
+        self._index = None
+
+    #--------------------------------------------------------------------------
+
+    def __setitem__(self, index, entry):
+        super(NamedList, self).__setitem__(index, entry)
+        self._index = None
+
+    #--------------------------------------------------------------------------
+
+    def __delitem__(self, index):
+        if isinstance(index, slice) or self._index == None:
+            super(NamedList, self).__delitem__(index)
+            self._index = None
+            return
+
+        name     = getattr(self[index], self._key)
+        position = index + len(self) if index < 0 else index
+        super(NamedList, self).__delitem__(position)
+        self._shiftIndex(position + 1, -1)
+
+        # a removed first entry hands the name to the next duplicate
+        if self._index.get(name) == position:
+            del self._index[name]
+            for later in xrange(position, len(self)):
+                if getattr(self[later], self._key) == name:
+                    self._index[name] = later
+                    break
+
+    #--------------------------------------------------------------------------
+
+    def __setslice__(self, start, end, entries):
+        super(NamedList, self).__setslice__(start, end, entries)
+        self._index = None
+
+    #--------------------------------------------------------------------------
+
+    def __delslice__(self, start, end):
+        super(NamedList, self).__delslice__(start, end)
+        self._index = None
+
+    #--------------------------------------------------------------------------
+
+    def __iadd__(self, entries):
+        self.extend(entries)
+        return self
+
+    #--------------------------------------------------------------------------
+    # helper methods
+    #--------------------------------------------------------------------------
+
+    def _getIndex(self):
+        """Builds the name index if it is out of date.
+        """
+        if self._index == None:
+            self._index = {}
+            for position, entry in enumerate(self):
+                self._index.setdefault(getattr(entry, self._key), position)
+        return self._index
+
+    #--------------------------------------------------------------------------
+
+    def _shiftIndex(self, position, offset):
+        """Moves the indexed positions at or after the position.
+        """
+        index = self._index
+        for name, current in index.iteritems():
+            if current >= position:
+                index[name] = current + offset
+
+#------------------------------------------------------------------------------
+# class FloatFormat
+#------------------------------------------------------------------------------
+
+class FloatFormat(object):
+    """Float formatting used by the writers for %g values.
+
+    General writes 6 significant digits like massive does, which loses
+    precision over repeated read/write cycles.  Exact writes the shortest
+    text that reads back to the same value.  Fixed writes the given number
+    of significant digits.
+
+    A format is passed to a write, ie MasFile.write(float_format=...), and
+    is only active for the writing thread while that write runs.  Blocks
+    printed outside of a write use General.
+    """
+
+    #--------------------------------------------------------------------------
+    # enums
+    #--------------------------------------------------------------------------
+
+    General = 'general'
+    Exact   = 'exact'
+    Fixed   = 'fixed'
+
+    #--------------------------------------------------------------------------
+    # statics
+    #--------------------------------------------------------------------------
+
+    _sActive = threading.local()
+
+    _sConversion = re.compile(r'%(?:%|[-#0 +]*\d*(?:\.\d+)?[a-zA-Z])')
+
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    def current():
+        """Format active for the current thread.
+        """
+        return getattr(FloatFormat._sActive, 'format', FloatFormat._sDefault)
+
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    @contextlib.contextmanager
+    def use(float_format=None):
+        """Make the format active for the current thread within the with
+        block, None keeps the active one.
+        """
+        previous = FloatFormat.current()
+        FloatFormat._sActive.format = float_format or previous
+        try:
+            yield FloatFormat._sActive.format
+        finally:
+            FloatFormat._sActive.format = previous
+
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    def exact(value):
+        """Shortest text that reads back as the same float.  Integral values
+        are written without the trailing '.0' like %g does.
+        """
+        if isinstance(value, basestring):
+            raise TypeError("float argument required, not str")
+        text = repr(float(value))
+        return text[:-2] if text.endswith('.0') else text
+
+    #--------------------------------------------------------------------------
+    # methods
+    #--------------------------------------------------------------------------
+
+    def __init__(self, mode=General, precision=None):
+        """Initialize self with the mode, Fixed requires the precision.
+        """
+        super(FloatFormat, self).__init__()
+
+        if mode not in (FloatFormat.General, FloatFormat.Exact, FloatFormat.Fixed):
+            raise ValueError("Unknown float format mode '%s'" % mode)
+        if (mode == FloatFormat.Fixed) and not precision:
+            raise ValueError("Fixed float format requires a precision")
+
+        self.mode      = mode
+        self.precision = precision
+        self._compiled = {}
+
+    #--------------------------------------------------------------------------
+
+    def isGeneral(self):
+        return self.mode == FloatFormat.General
+
+    #--------------------------------------------------------------------------
+
+    def spec(self):
+        """Conversion used in place of %g.
+        """
+        if self.mode == FloatFormat.Exact:
+            return '%s'
+        if self.mode == FloatFormat.Fixed:
+            return '%%.%dg' % self.precision
+        return '%g'
+
+    #--------------------------------------------------------------------------
+
+    def compile(self, formatting):
+        """Returns the formatting with %g replaced for the mode, and the
+        value positions of the replaced conversions.
+        """
+        compiled = self._compiled.get(formatting)
+        if compiled == None:
+            spec      = self.spec()
+            positions = []
+            parts     = []
+            index     = 0
+            last      = 0
+            for match in FloatFormat._sConversion.finditer(formatting):
+                conversion = match.group(0)
+                if conversion == '%%':
+                    continue
+                if conversion == '%g':
+                    positions.append(index)
+                    parts.append(formatting[last:match.start()] + spec)
+                    last = match.end()
+                index += 1
+            parts.append(formatting[last:])
+            compiled = ("".join(parts), positions)
+            self._compiled[formatting] = compiled
+        return compiled
+
+    #--------------------------------------------------------------------------
+
+    def format(self, formatting, values):
+        """Same as formatting % values using the float formatting.
+        """
+
+        if self.mode == FloatFormat.General:
+            return formatting % values
+
+        formatting, positions = self.compile(formatting)
+        if self.mode == FloatFormat.Exact and positions:
+            single = not isinstance(values, tuple)
+            values = [values] if single else list(values)
+            for position in positions:
+                if position < len(values):
+                    values[position] = FloatFormat.exact(values[position])
+            values = tuple(values)
+        return formatting % values
+
+    #--------------------------------------------------------------------------
+
+    def text(self, value):
+        """Single value as text using the float formatting.
+        """
+        if self.mode == FloatFormat.Exact:
+            return FloatFormat.exact(value)
+        return self.spec() % value
+
+    #--------------------------------------------------------------------------
+
+    def convert(self, values):
+        """Batch convert values for a compiled formatting, only the exact mode
+        needs the values converted to text.
+        """
+        if self.mode == FloatFormat.Exact:
+            return map(FloatFormat.exact, values)
+        return values
+
+#------------------------------------------------------------------------------
+
+FloatFormat._sDefault = FloatFormat()
+
+#------------------------------------------------------------------------------
+# class Compression
+#------------------------------------------------------------------------------
+
+class Compression(object):
+    """Transparent gzip compression for massive files.
+
+    Paths ending in .gz are read and written through gzip as a stream, no
+    temporary files are used.  Everything else is opened as a plain file.
+    Zstandard isn't supported, only gzip is available everywhere.
+    """
+
+    #--------------------------------------------------------------------------
+    # statics
+    #--------------------------------------------------------------------------
+
+    _sExtension = '.gz'
+    _sLevel     = 6
+    _sBuffering = 1 << 20
+
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    def setLevel(level):
+        """Default compression level for writes, 1 (fast) to 9 (small).
+        """
+        Compression._sLevel = Compression._getLevel(level)
+
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    def isCompressed(path):
+        return path.endswith(Compression._sExtension)
+
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    def open(path, mode='r', level=None, buffering=-1):
+        """Open the path for reading or writing, decompressing or
+        compressing on the fly if it's a .gz path.  Compressed files are
+        always binary, 'U' is ignored for them.
+        """
+        if not Compression.isCompressed(path):
+            return open(path, mode, buffering)
+
+        mode = mode.replace('U', '').replace('b', '') + 'b'
+        if 'r' in mode:
+            return io.BufferedReader(gzip.open(path, mode), Compression._sBuffering)
+        gzip_file = gzip.open(path, mode, Compression._getLevel(level))
+        return io.BufferedWriter(gzip_file, Compression._sBuffering)
+
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    def wrap(stream, level=None):
+        """Compress everything written to an open binary stream.  Closing
+        the returned file finishes the gzip data but leaves the stream open.
+        """
+        level     = Compression._getLevel(level)
+        gzip_file = gzip.GzipFile('', 'wb', level, stream)
+        return io.BufferedWriter(gzip_file, Compression._sBuffering)
+
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    def read(path):
+        """Contents of the file with newlines made consistent, like reading
+        a plain file with 'rU'.
+        """
+        if not Compression.isCompressed(path):
+            with open(path, 'rU') as plain_file:
+                return plain_file.read()
+        with Compression.open(path, 'r') as gzip_file:
+            data = gzip_file.read()
+        return data.replace('\r\n', '\n').replace('\r', '\n')
+
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    def compressFiles(paths, level=None, processes=None, remove=True):
+        """Compress a set of files in parallel, ie the frames of a sim,
+        writing each to its path plus .gz.  Use processes=1 to run in
+        process.  Returns the compressed paths.
+        """
+        level = Compression._getLevel(level)
+        jobs  = [(path, path + Compression._sExtension, level, remove)
+                 for path in paths]
+
+        if processes == 1 or len(jobs) < 2:
+            return map(_compressFile, jobs)
+
+        pool = multiprocessing.Pool(processes)
+        try:
+            return pool.map(_compressFile, jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+    #--------------------------------------------------------------------------
+    # helper methods
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    def _getLevel(level):
+        if level == None:
+            return Compression._sLevel
+        if not 0 <= level <= 9:
+            raise ValueError("Compression level must be within 0-9: %s" % level)
+        return level
+
+#------------------------------------------------------------------------------
+# class AtomicFile
+#------------------------------------------------------------------------------
+
+class AtomicFile(object):
+    """Files replaced in a single step so readers never see them half
+    written, ie caches shared between processes.
+
+    Data goes to a temporary file next to the target which is renamed over
+    it once complete.  A replaced file keeps its permissions, new files get
+    the usual ones for the umask.
+    """
+
+    #--------------------------------------------------------------------------
+    # statics
+    #--------------------------------------------------------------------------
+
+    # the umask can only be read by setting it, which would race with other
+    #  threads creating files, so it is read once on import
+    _sUmask = os.umask(0)
+    os.umask(_sUmask)
+
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    @contextlib.contextmanager
+    def open(path):
+        """Binary file to write within the with block, it replaces the path
+        when the block finishes and is removed if the block raises.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        handle, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as temp_file:
+                yield temp_file
+            AtomicFile._replace(temp_path, path)
+        except:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    #--------------------------------------------------------------------------
+    # helper methods
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    def _replace(temp_path, path):
+
+        # keep the permissions of the file being replaced
+        if os.path.exists(path):
+            os.chmod(temp_path, os.stat(path).st_mode & 0777)
         else:
-            data = (self.name, self.default, self.min, self.max, self.expr)
-            return "variable %s %f [%f %f] %s" % data
+            os.chmod(temp_path, 0666 & ~AtomicFile._sUmask)
 
+        # windows can't rename over an existing file
+        if os.name == 'nt' and os.path.exists(path):
+            os.remove(path)
+        os.rename(temp_path, path)
+
+#------------------------------------------------------------------------------
+# helper functions
+#------------------------------------------------------------------------------
+
+def _compressFile(job):
+    """Compress a single file.  Module level so it can be sent to workers.
+    """
+    path, output_path, level, remove = job
+    with open(path, 'rb') as plain_file:
+        with Compression.open(output_path, 'wb', level) as gzip_file:
+            while True:
+                data = plain_file.read(Compression._sBuffering)
+                if not data:
+                    break
+                gzip_file.write(data)
+    if remove:
+        os.remove(path)
+    return output_path
@@ -20,11 +20,15 @@
 # mas.py - Massive scene file. (.mas)
 #------------------------------------------------------------------------------
 
-import re
-
 from scanf import sscanf
 from scanf import IncompleteCaptureError
 
+from block    import Block
+from common   import Compression
+from common   import FloatFormat
+from reader   import BlockReader
+from snapshot import Snapshot
+
 from mas_blocks import *
 
 #------------------------------------------------------------------------------
@@ -55,12 +59,26 @@ class MasFile(object):
         ("Place",           PlaceBlock)
     ]
 
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    def loadSnapshot(path, mmap=False):
+        """Load a parsed file from a binary snapshot.
+        """
+        mas_file = Snapshot.load(path, mmap)
+        if not isinstance(mas_file, MasFile):
+            raise TypeError("Snapshot doesn't contain a MasFile: %s" % path)
+        return mas_file
+
     #--------------------------------------------------------------------------
     # methods
     #--------------------------------------------------------------------------
 
-    def __init__(self, path):
-        """Open file at path, read contents into memory, and close.
+    def __init__(self, path, preserve=False, lazy=False):
+        """Open file at path, read contents into memory, and close.  With
+        preserve the source text is kept to write unchanged values back as
+        is, with lazy attributes are only parsed when first read, see
+        Block.parsing.
         """
         super(MasFile, self).__init__()
 
@@ -68,12 +86,15 @@ class MasFile(object):
         self._path = path
 
         # read in file contents
-        self._read(path)
+        with Block.parsing(preserve, lazy):
+            self._read(path)
 
     #--------------------------------------------------------------------------
 
-    def write(self, path=None):
-        """Write the file to the given path.
+    def write(self, path=None, level=None, float_format=None):
+        """Write the file to the given path, .gz paths are compressed using
+        the level or the Compression default.  Floats are written using the
+        float format, see FloatFormat.
         """
 
         # use read path if path not specified
@@ -81,7 +102,8 @@ class MasFile(object):
             path = self._path
 
         # open the file and write out scene
-        with open(path, 'w') as mas_file:
+        with Compression.open(path, 'w', level) as mas_file, \
+             FloatFormat.use(float_format):
 
             # version
             version = MasFile._sVersionFormatting % self.version
@@ -105,6 +127,13 @@ class MasFile(object):
                 # write block to file
                 mas_file.write("\n\n%s" % str(block))
 
+    #--------------------------------------------------------------------------
+
+    def saveSnapshot(self, path):
+        """Write the parsed file to a binary snapshot, see Snapshot.
+        """
+        Snapshot.save(self, path)
+
     #--------------------------------------------------------------------------
     # helper methods
     #--------------------------------------------------------------------------
@@ -118,59 +147,36 @@ class MasFile(object):
         """Parses the contents of the file at the given path.
         """
 
-        # parse the contents of the file ('U' deals with newlines cross-platformly)
-        with open(path, 'rU') as scene_file:
-            scene = scene_file.read()
-
-            # parse out the inital comment
-            version, scene = scene.partition('\n')[::2]
-            self.version   = sscanf(version, MasFile._sVersionFormatting);
-
-            # parse out the units specifier
-            units, scene = scene.partition('\n')[::2]
-            self.units   = sscanf(units, MasFile._sUnitsFormatting);
-
-            # read all of the available blocks
-            for block_name, cls in MasFile._sBlocks:
-
-                # extract the block from the file
-                block, scene = self._extractBlock(block_name, scene)
-
-                # get blocks attribute name
-                attribute_name = self._getAttrbuteName(block_name)
-
-                # set attribute with block
-                if block:
-                    setattr(self, attribute_name, cls(block))
-                else:
-                    setattr(self, attribute_name, None)
-
-    #--------------------------------------------------------------------------
-
-    def _extractBlock(self, block_name, scene):
-        """Parses a block of data from the scene data.
-        """
-
-        # matches entire text to allow extracting block from scene data
-        pattern = "(?P<start>.*)%s\n(?P<block>.*)%s\n?(?P<end>.*)"
+        # parse the contents of the file, newlines are made consistent
+        scene = Compression.read(path)
 
-        # use start/end tags for the block extraction
-        block_end     = "End %s" % block_name.lower()
-        block_pattern = pattern % (block_name, block_end)
+        # parse out the inital comment
+        version, scene = scene.partition('\n')[::2]
+        self.version   = sscanf(version, MasFile._sVersionFormatting);
 
-        # extract block from scene data
-        match = re.match(block_pattern, scene, re.S)
-        if match:
+        # parse out the units specifier
+        units, scene = scene.partition('\n')[::2]
+        self.units   = sscanf(units, MasFile._sUnitsFormatting);
 
-            # remove indent from block
-            block = re.compile(r"^    ", re.M).sub("", match.group('block'))
+        # split the rest of the scene into nested blocks in a single pass,
+        #  blocks are built from the nodes so each line is dedented once
+        reader = BlockReader(scene, len(version) + len(units) + 2)
+        nodes  = {}
+        for node in reader.nodes:
+            nodes.setdefault(node.header.strip(), node)
 
-            # compile rest of scene data
-            rest  = match.group('start') + match.group('end')
+        # read all of the available blocks
+        for block_name, cls in MasFile._sBlocks:
 
-            return (block, rest)
+            # extract the body of the block from the file
+            node  = nodes.get(block_name)
+            block = node.children if node != None else None
 
-        # block not found
-        else:
-            return (None, scene)
+            # get blocks attribute name
+            attribute_name = self._getAttrbuteName(block_name)
 
+            # set attribute with block
+            if block:
+                setattr(self, attribute_name, cls(block))
+            else:
+                setattr(self, attribute_name, None)
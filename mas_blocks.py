@@ -20,15 +20,21 @@
 # mas_blocks.py - Blocks found in Massive scene files. (.mas)
 #------------------------------------------------------------------------------
 
-import itertools
 import os
 import re
 
+import numpy as np
+
 from scanf import sscanf
 from scanf import IncompleteCaptureError
 
-from block  import Block
-from common import Variable
+from block   import Block
+from common  import FloatFormat
+from common  import NamedList
+from common  import RangeSet
+from common  import Variable
+from common  import VariableTable
+from spatial import SplineIndex
 
 #------------------------------------------------------------------------------
 # class DisplayOptionsBlock
@@ -197,13 +203,10 @@ class TerrainNode(Block):
         """
         super(TerrainNode, self).__init__()
 
-        # remove the block header
-        header, block = block.partition('\n')[::2]
+        # split off the block header, the body has its indent removed
+        header, block = self._splitHeader(block)
         self._parseHeader(header)
 
-        # remove indent from block
-        block = self._removeIndent(block)
-
         # setup special parse list
         special_list = {
             "render_pass"  : self._parseAttributeString,
@@ -332,16 +335,13 @@ class CameraNode(Block):
         """
         super(CameraNode, self).__init__()
 
-        # remove the block header
-        header, block = block.partition('\n')[::2]
+        # split off the block header, the body has its indent removed
+        header, block = self._splitHeader(block)
         self._parseHeader(header)
 
-        # remove indent from block
-        block = self._removeIndent(block)
-
         # first line contains node position for the ui, needs to be parsed
         #  seperately since the 'translate' tag is used twice
-        line, block = block.partition('\n')[::2]
+        line, block = self._splitLine(block)
         self.position = sscanf(line, CameraNode._sBlockFormatting[0])
 
         # setup special parse list
@@ -357,7 +357,8 @@ class CameraNode(Block):
 
     def __str__(self):
         header     = ("camera %s *" if self.selected else "camera %s") % self.name
-        position   = CameraNode._sBlockFormatting[0] % self.position
+        formatting = CameraNode._sBlockFormatting[0]
+        position   = FloatFormat.current().format(formatting, self.position)
         attributes = self.printAttributes(CameraNode._sBlockFormatting[1:])
         block      = "%s\n%s" % (position, attributes)
         return "%s\n%s" % (header, self._addIndent(block))
@@ -457,16 +458,13 @@ class LightNode(Block):
         """
         super(LightNode, self).__init__()
 
-        # remove the block header
-        header, block = block.partition('\n')[::2]
+        # split off the block header, the body has its indent removed
+        header, block = self._splitHeader(block)
         self._parseHeader(header)
 
-        # remove indent from block
-        block = self._removeIndent(block)
-
         # first line contains node position for the ui, needs to be parsed
         #  seperately since the 'translate' tag is used twice
-        line, block = block.partition('\n')[::2]
+        line, block = self._splitLine(block)
         self.position = sscanf(line, LightNode._sBlockFormatting[0])
 
         # parse the rest of the attributes
@@ -479,7 +477,8 @@ class LightNode(Block):
 
     def __str__(self):
         header     = "light %s" % self.name
-        position   = LightNode._sBlockFormatting[0] % self.position
+        formatting = LightNode._sBlockFormatting[0]
+        position   = FloatFormat.current().format(formatting, self.position)
         attributes = self.printAttributes(LightNode._sBlockFormatting[1:])
         block      = "%s\n%s%s" % (position, attributes, self._raw)
         return "%s\n%s" % (header, self._addIndent(block))
@@ -580,13 +579,10 @@ class RenderOption(Block):
         """
         super(RenderOption, self).__init__()
 
-        # remove the block header
-        header, block = block.partition('\n')[::2]
+        # split off the block header, the body has its indent removed
+        header, block = self._splitHeader(block)
         self._parseHeader(header)
 
-        # remove indent from block
-        block = self._removeIndent(block)
-
         # parse the attributes
         rest = self.parseAttributes(block, RenderOption._sBlockFormatting)
 
@@ -713,6 +709,14 @@ class FlowBlock(Block):
         block      = "%s%s\n%s" % (attributes, splines, gaps)
         return "Flow\n%sEnd flow" % self._addIndent(block)
 
+    #--------------------------------------------------------------------------
+
+    def spatialIndex(self, cell_size=None):
+        """Build a spatial index over the points of the splines.  Changed
+        splines have to be passed to its update method, see SplineIndex.
+        """
+        return SplineIndex(self.splines, cell_size)
+
     #--------------------------------------------------------------------------
     # helper methods
     #--------------------------------------------------------------------------
@@ -727,7 +731,8 @@ class FlowBlock(Block):
     def _printGaps(self):
         formatting = FlowBlock._sBlockFormatting[1]
         gaps       = [self.gap] if not isinstance(self.gap, list) else self.gap
-        return "\n".join([formatting % gap for gap in gaps]) + "\n"
+        format     = FloatFormat.current().format
+        return "\n".join([format(formatting, gap) for gap in gaps]) + "\n"
 
 #------------------------------------------------------------------------------
 # class FlowSpline
@@ -752,20 +757,17 @@ class FlowSpline(Block):
         """
         super(FlowSpline, self).__init__()
 
-        # remove the block header
-        header, block = block.partition('\n')[::2]
+        # split off the block header, the body has its indent removed
+        header, block = self._splitHeader(block)
         self._parseHeader(header)
 
-        # remove indent from block
-        block = self._removeIndent(block)
-
         # parse the points
-        self._parsePoints(block)
+        self._parsePoints(self._getText(block))
 
     #--------------------------------------------------------------------------
 
     def __str__(self):
-        header = FlowSpline._sSplineFormatting % self.spline
+        header = FloatFormat.current().format(FlowSpline._sSplineFormatting, self.spline)
         block  = self._printPoints()
         return "%s\n%s" % (header, self._addIndent(block))
 
@@ -782,19 +784,16 @@ class FlowSpline(Block):
     #--------------------------------------------------------------------------
 
     def _parsePoints(self, block):
-        """Points representing spline.
+        """Points representing spline, stored as a (n, 10) array.
         """
-        self.points = []
-        for line in block.strip('\n').split('\n'):
-            point = sscanf(line, "[%f %f %f %f %f %f %f %f %f %f]")
-            self.points.append(point)
+        self.points  = self._parseArray(block, 10)
+        self._points = self._keepArraySource(block, self.points)
 
     #--------------------------------------------------------------------------
 
     def _printPoints(self):
         formatting = "[%g %g %g %g %g %g %g %g %g %g]"
-        points     = "\n".join([formatting % point for point in self.points])
-        return points
+        return self._printArray(formatting, self.points, self._points)
 
 #------------------------------------------------------------------------------
 # class LaneBlock
@@ -830,6 +829,14 @@ class LaneBlock(Block):
         block = "".join(map(str, self.splines))
         return "Lane\n%sEnd lane" % self._addIndent(block)
 
+    #--------------------------------------------------------------------------
+
+    def spatialIndex(self, cell_size=None):
+        """Build a spatial index over the points of the splines.  Changed
+        splines have to be passed to its update method, see SplineIndex.
+        """
+        return SplineIndex(self.splines, cell_size)
+
     #--------------------------------------------------------------------------
     # helper methods
     #--------------------------------------------------------------------------
@@ -863,18 +870,17 @@ class LaneSpline(Block):
         super(LaneSpline, self).__init__()
 
         # initialize fields
-        self.points   = []
-        self.tangents = None
+        self.points    = None
+        self.tangents  = None
+        self._points   = None
+        self._tangents = None
 
-        # remove the block header
-        header, block = block.partition('\n')[::2]
+        # split off the block header, the body has its indent removed
+        header, block = self._splitHeader(block)
         self._parseHeader(header)
 
-        # remove indent from block
-        block = self._removeIndent(block)
-
         # parse the points
-        rest = self._parsePoints(block, self.count)
+        rest = self._parsePoints(self._getText(block), self.count)
 
         # parse tangents
         self.tangents = None
@@ -884,9 +890,10 @@ class LaneSpline(Block):
     #--------------------------------------------------------------------------
 
     def __str__(self):
-        header   = LaneSpline._sSplineFormatting % (self.count, self.hue, self.width)
+        header   = FloatFormat.current().format(LaneSpline._sSplineFormatting,
+                                                (self.count, self.hue, self.width))
         points   = self._printPoints()
-        tangents = self._printTangents() if self.tangents else ""
+        tangents = self._printTangents() if self.tangents is not None else ""
         block    = "%s\n%s" % (points, tangents)
         return "%s\n%s" % (header, self._addIndent(block))
 
@@ -903,36 +910,34 @@ class LaneSpline(Block):
     #--------------------------------------------------------------------------
 
     def _parsePoints(self, block, count):
-        """Points representing spline.
+        """Points representing spline, stored as a (n, 4) array.
         """
-        lines = block.strip('\n').split('\n')
-        for line in lines[:count]:
-            point = sscanf(line, "[%f %f %f %f]")
-            self.points.append(point)
+        lines        = block.strip('\n').split('\n')
+        block        = "\n".join(lines[:count])
+        self.points  = self._parseArray(block, 4)
+        self._points = self._keepArraySource(block, self.points)
         return "\n".join(lines[count:])
 
     #--------------------------------------------------------------------------
 
     def _printPoints(self):
         formatting = "[%g %g %g %g]"
-        points     = "\n".join([formatting % point for point in self.points])
-        return points
+        return self._printArray(formatting, self.points, self._points)
 
     #--------------------------------------------------------------------------
 
     def _parseTangents(self, block):
-        """Tangents representing spline.
+        """Tangents representing spline, stored as a (n, 6) array.
         """
-        self.tangents = []
-        for line in block.strip('\n').split('\n')[1:]:
-            tangent = sscanf(line, "[%f %f %f][%f %f %f]")
-            self.tangents.append(tangent)
+        block          = block.strip('\n').partition('\n')[2]
+        self.tangents  = self._parseArray(block, 6)
+        self._tangents = self._keepArraySource(block, self.tangents)
 
     #--------------------------------------------------------------------------
 
     def _printTangents(self):
         formatting = "[%g %g %g][%g %g %g]"
-        tangents   = "\n".join([formatting % tangent for tangent in self.tangents])
+        tangents   = self._printArray(formatting, self.tangents, self._tangents)
         return "tangents\n%s\n" % tangents
 
 #------------------------------------------------------------------------------
@@ -1000,13 +1005,10 @@ class SimOption(Block):
         self.input   = None
         self.output  = None
 
-        # remove the block header
-        header, block = block.partition('\n')[::2]
+        # split off the block header, the body has its indent removed
+        header, block = self._splitHeader(block)
         self._parseHeader(header)
 
-        # remove indent from block
-        block = self._removeIndent(block)
-
         # setup special parse list
         special_list = {
             "process" : self._parseProcess,
@@ -1109,7 +1111,7 @@ class SimOptionProcess(Block):
         """Initialize self with scene data.
         """
         super(SimOptionProcess, self).__init__()
-        block = self._removeIndent(block.partition('\n')[2])
+        block = self._splitHeader(block)[1]
         self.parseAttributes(block, SimOptionProcess._sBlockFormatting)
 
     #--------------------------------------------------------------------------
@@ -1145,7 +1147,7 @@ class SimOptionInput(Block):
         """Initialize self with scene data.
         """
         super(SimOptionInput, self).__init__()
-        block = self._removeIndent(block.partition('\n')[2])
+        block = self._splitHeader(block)[1]
         self.parseAttributes(block, SimOptionInput._sBlockFormatting)
 
     #--------------------------------------------------------------------------
@@ -1191,7 +1193,7 @@ class SimOptionOutput(Block):
         """Initialize self with scene data.
         """
         super(SimOptionOutput, self).__init__()
-        block = self._removeIndent(block.partition('\n')[2])
+        block = self._splitHeader(block)[1]
         self.parseAttributes(block, SimOptionOutput._sBlockFormatting)
 
     #--------------------------------------------------------------------------
@@ -1228,8 +1230,10 @@ class PlaceBlock(Block):
 
         # [moiz] need to hack this shit since massive files are the most fucked
         #   up files ever!!! argh wtf!!!
-        block = block.replace("\nnon_process\n", "\nnon_process\n    ")
-        block = block.replace("\nreplay\n", "\nreplay\n    ")
+        #   nodes already nest the ids under their end tagged sections
+        if isinstance(block, basestring):
+            block = block.replace("\nnon_process\n", "\nnon_process\n    ")
+            block = block.replace("\nreplay\n", "\nreplay\n    ")
 
         # initialize fields
         self.groups      = []
@@ -1287,7 +1291,8 @@ class PlaceBlock(Block):
     def _parseNonProcess(self, block):
         """Collate all of the non process ids in the scene.
         """
-        self.non_process = self._parseIds(self._removeIndent(block.partition('\n')[-1]))
+        ids = self._getText(self._splitHeader(block)[1])
+        self.non_process = self._parseIds(ids)
 
     #--------------------------------------------------------------------------
 
@@ -1300,7 +1305,8 @@ class PlaceBlock(Block):
     def _parseReplay(self, block):
         """Collate all of the replay ids in the scene.
         """
-        self.replay = self._parseIds(self._removeIndent(block.partition('\n')[-1]))
+        ids = self._getText(self._splitHeader(block)[1])
+        self.replay = self._parseIds(ids)
 
     #--------------------------------------------------------------------------
 
@@ -1311,18 +1317,14 @@ class PlaceBlock(Block):
     #--------------------------------------------------------------------------
 
     def _parseIds(self, block):
-        ranges    = [r.partition('-')[0::2] for r in block.split(' ')]
-        makeRange = lambda (s, f): range(int(s), int(s)+1 if f == '' else int(f)+1)
-        ids       = list(itertools.chain(*map(makeRange, ranges)))
-        return ids
+        return RangeSet.fromString(block)
 
     #--------------------------------------------------------------------------
 
     def _printIds(self, ids):
-        isInRange = lambda n, c=itertools.count(): n - next(c)
-        ranges    = [list(g) for _,g in itertools.groupby(sorted(ids), isInRange)]
-        makeRange = lambda l: str(l[0]) if len(l) < 2 else "%s-%s" % (l[0], l[-1])
-        return " ".join(map(makeRange, ranges))
+        if not isinstance(ids, RangeSet):
+            ids = RangeSet(ids)
+        return str(ids)
 
 #------------------------------------------------------------------------------
 # class PlaceGroup
@@ -1358,16 +1360,13 @@ class PlaceGroup(Block):
         """
         super(PlaceGroup, self).__init__()
 
-        # initialize fields
-        self.variables = []
+        # initialize fields, variables are indexed for lookups by name
+        self.variables = NamedList()
 
-        # remove the block header
-        header, block = block.partition('\n')[::2]
+        # split off the block header, the body has its indent removed
+        header, block = self._splitHeader(block)
         self._parseHeader(header)
 
-        # remove indent from block
-        block = self._removeIndent(block)
-
         # parse the attributes
         special_list = { "variable" : self._parseVariable }
         self.parseAttributes(block, PlaceGroup._sBlockFormatting, special_list)
@@ -1393,6 +1392,14 @@ class PlaceGroup(Block):
 
     #--------------------------------------------------------------------------
 
+    def variableTable(self):
+        """Build an array backed table of the group variables, see
+        VariableTable.update to apply changes made to it.
+        """
+        return VariableTable(self.variables)
+
+    #--------------------------------------------------------------------------
+
     def _parseVariable(self, block):
         """Collate all of the agent variables for the group.
         """
@@ -1445,13 +1452,10 @@ class PlaceGenerator(Block):
         """
         super(PlaceGenerator, self).__init__()
 
-        # remove the block header
-        header, block = block.partition('\n')[::2]
+        # split off the block header, the body has its indent removed
+        header, block = self._splitHeader(block)
         self._parseHeader(header)
 
-        # remove indent from block
-        block = self._removeIndent(block)
-
         # parse the attributes
         rest = self.parseAttributes(block, PlaceGenerator._sBlockFormatting)
 
@@ -0,0 +1,466 @@
+#------------------------------------------------------------------------------
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#                     Version 2, December 2004
+#
+#  Copyright (C) 2013 Electronic Dreams <maverick.babylon.drifter@gmail.com>
+#
+#  Everyone is permitted to copy and distribute verbatim or modified
+#  copies of this license document, and changing it is allowed as long
+#  as the name is changed.
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#    TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+#
+#   0. You just DO WHAT THE FUCK YOU WANT TO.
+#
+#------------------------------------------------------------------------------
+
+
+#------------------------------------------------------------------------------
+# reader.py - Stack based reader for nested blocks in Massive files.
+#------------------------------------------------------------------------------
+
+from scanf import sscanf
+
+from block  import FormatMatcher
+from common import Compression
+
+#------------------------------------------------------------------------------
+# class BlockNode
+#------------------------------------------------------------------------------
+
+class BlockNode(object):
+    """Line of a massive file along with the lines nested under it.
+
+    Nodes only hold indices into the lines of their reader, text is copied
+    out when it is asked for.  Blocks closed by an end tag, ie 'End place'
+    or 'end dynamics', include the tag line as their last line.
+    """
+
+    #--------------------------------------------------------------------------
+    # methods
+    #--------------------------------------------------------------------------
+
+    def __init__(self, reader, start, level, depth):
+        self.reader   = reader
+        self.start    = start
+        self.end      = start + 1
+        self.level    = level
+        self.depth    = depth
+        self.tag      = None
+        self.children = []
+
+    #--------------------------------------------------------------------------
+
+    def __repr__(self):
+        return "<BlockNode %s>" % self.header.strip()
+
+    #--------------------------------------------------------------------------
+
+    @property
+    def header(self):
+        return self.reader.lines[self.start]
+
+    #--------------------------------------------------------------------------
+
+    @property
+    def name(self):
+        return self.header.split(None, 1)[0]
+
+    #--------------------------------------------------------------------------
+
+    @property
+    def offset(self):
+        """Character offset of the header in the text read.
+        """
+        return self.reader.offsets[self.start]
+
+    #--------------------------------------------------------------------------
+
+    def find(self, name):
+        """First child with the name.
+        """
+        for child in self.children:
+            if child.name == name:
+                return child
+        return None
+
+    #--------------------------------------------------------------------------
+
+    def text(self):
+        """Header, nested lines and end tag with the header indent removed.
+        """
+        if self.end == self.start + 1:
+            return self.header.lstrip()
+        return self._dedent(self.start, self.end, self._indent())
+
+    #--------------------------------------------------------------------------
+
+    def body(self):
+        """Nested lines without the header and end tag, with one indent
+        removed, the way blocks expect their data.  Empty if there are no
+        nested lines.
+        """
+        end = self.end - 1 if self.tag else self.end
+        if end <= self.start + 1:
+            return ""
+        indent = self._indent()
+        return self._dedent(self.start + 1, end, indent + "    ", indent) + "\n"
+
+    #--------------------------------------------------------------------------
+    # helper methods
+    #--------------------------------------------------------------------------
+
+    def _indent(self):
+        header = self.header
+        return header[:len(header) - len(header.lstrip())]
+
+    #--------------------------------------------------------------------------
+
+    def _dedent(self, start, end, *prefixes):
+        """Joins the lines removing the first of the prefixes found.
+        """
+        lines = self.reader.lines[start:end]
+        if any(prefixes):
+            for index, line in enumerate(lines):
+                for prefix in prefixes:
+                    if prefix and line.startswith(prefix):
+                        lines[index] = line[len(prefix):]
+                        break
+        return "\n".join(lines)
+
+#------------------------------------------------------------------------------
+# class BlockReader
+#------------------------------------------------------------------------------
+
+class BlockReader(object):
+    """Single pass stack parser for the nested blocks of massive files.
+
+    Every non empty line becomes a node.  A line is nested under the closest
+    line above it with a smaller indent, indents are counted in tabs or 4
+    spaces.  Lines that have a matching end tag at the same indent somewhere
+    in the text open a block that is only closed by its tag, so the oddly
+    indented sections massive writes (ie non_process in Place) stay inside
+    their block.
+    """
+
+    #--------------------------------------------------------------------------
+    # methods
+    #--------------------------------------------------------------------------
+
+    def __init__(self, text, offset=0, depth=None):
+        """Read the text, offset is the position of the text in its file.
+        Depth limits how deep nodes are built, 0 only reads the top level
+        blocks.
+        """
+        super(BlockReader, self).__init__()
+
+        self.lines   = text.split('\n')
+        self.offsets = []
+        self.nodes   = []
+
+        # character offsets of the lines
+        for line in self.lines:
+            self.offsets.append(offset)
+            offset += len(line) + 1
+
+        self._parse(depth)
+
+    #--------------------------------------------------------------------------
+
+    def find(self, name):
+        """First top level node with the name.
+        """
+        for node in self.nodes:
+            if node.name == name:
+                return node
+        return None
+
+    #--------------------------------------------------------------------------
+
+    def walk(self):
+        """All nodes in file order.
+        """
+        stack = list(reversed(self.nodes))
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
+
+    #--------------------------------------------------------------------------
+    # helper methods
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    def _getLevel(line):
+        """Number of leading tabs or 4 space indents.
+        """
+        level = 0
+        index = 0
+        while True:
+            if line.startswith('\t', index):
+                index += 1
+            elif line.startswith('    ', index):
+                index += 4
+            else:
+                return level
+            level += 1
+
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    def _getTag(stripped, level, tags):
+        """End tag closing the block opened by the line, if there is one.
+        The whole line or its first word can be used in the tag, which has
+        to be at the same level as the line.  Attributes named like a block,
+        ie 'sims' in a sim input, don't open one that way.
+        """
+        lowered = stripped.lower()
+        for tag in ("end " + lowered, "end " + lowered.split(None, 1)[0]):
+            if (level, tag) in tags:
+                return tag
+        return None
+
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    def _addTag(line, tags):
+        """Adds the line to the (level, tag) set if it is an end tag.
+        """
+        stripped = line.lstrip()
+        if stripped[:4].lower() == 'end ':
+            tags.add((BlockReader._getLevel(line), stripped.rstrip().lower()))
+
+    #--------------------------------------------------------------------------
+
+    def _parse(self, depth):
+        """Build the node tree in one pass over the lines, nodes nested
+        deeper than depth aren't created.
+        """
+
+        # end tags present in the text along with their level, lowercased
+        tags = set()
+        for line in self.lines:
+            BlockReader._addTag(line, tags)
+
+        # stack of open nodes, the list of top level nodes is the root
+        stack = []
+        last  = -1
+        for index, line in enumerate(self.lines):
+
+            stripped = line.strip()
+            if not stripped:
+                continue
+
+            # end tag closes its block and any blocks left open inside it
+            if stripped[:4].lower() == 'end ':
+                lowered = stripped.lower()
+                level   = BlockReader._getLevel(line)
+                for position in xrange(len(stack) - 1, -1, -1):
+                    if stack[position].tag == lowered and \
+                       stack[position].level == level:
+                        for node in stack[position + 1:]:
+                            node.end = last + 1
+                        stack[position].end = index + 1
+                        del stack[position:]
+                        break
+                else:
+                    lowered = None
+                if lowered != None:
+                    last = index
+                    continue
+
+            # lines in a tagged block past the depth limit can be skipped
+            if depth != None and len(stack) > depth and stack[-1].tag != None:
+                last = index
+                continue
+
+            # indent closes the untagged blocks at the same or deeper level
+            level = BlockReader._getLevel(line)
+            while stack and (stack[-1].tag == None) and (stack[-1].level >= level):
+                stack.pop().end = last + 1
+            last = index
+
+            # only track nodes up to the depth limit
+            if depth != None and len(stack) > depth:
+                continue
+
+            # add the node to its parent, and open it for nested lines
+            node = BlockNode(self, index, level, len(stack))
+            (stack[-1].children if stack else self.nodes).append(node)
+            node.tag = BlockReader._getTag(stripped, level, tags)
+            stack.append(node)
+
+        # close the blocks left open at the end of the text
+        for node in stack:
+            node.end = last + 1
+
+#------------------------------------------------------------------------------
+# class BlockEvent
+#------------------------------------------------------------------------------
+
+class BlockEvent(tuple):
+    """Line of a massive file as a (depth, block_type, attribute, raw_line,
+    offset) tuple.
+
+    Block type is the block the line is nested in, None at the top level.
+    Offset is the byte offset of the line in the file.
+    """
+
+    __slots__ = ()
+
+    #--------------------------------------------------------------------------
+    # properties
+    #--------------------------------------------------------------------------
+
+    depth      = property(lambda self: self[0])
+    block_type = property(lambda self: self[1])
+    attribute  = property(lambda self: self[2])
+    raw_line   = property(lambda self: self[3])
+    offset     = property(lambda self: self[4])
+
+    #--------------------------------------------------------------------------
+    # methods
+    #--------------------------------------------------------------------------
+
+    def scan(self, formatting):
+        """Typed values of the line using a scanf format or a list of them,
+        %g is read as %f like the blocks do.
+        """
+        line = self[3].strip()
+
+        # single entry
+        if not isinstance(formatting, list):
+            return sscanf(line, formatting.replace('%g', '%f'))
+
+        # multiple entrys, pick the matching one up front
+        formatting = [entry.replace('%g', '%f') for entry in formatting]
+        return FormatMatcher.get(formatting).scan(line)
+
+#------------------------------------------------------------------------------
+# class BlockEvents
+#------------------------------------------------------------------------------
+
+class BlockEvents(object):
+    """Event reader for .mas and .cdl files.
+
+    Streams the file line by line and reports every non empty line as a
+    BlockEvent, nesting follows the same rules as BlockReader.  No blocks
+    are built and only the stack of open blocks is kept, the file is read
+    twice, once for the end tags and once for the events.
+
+    Events can be iterated over directly or dispatched to callbacks
+    registered by attribute, optionally scanning the line into values:
+
+        events = BlockEvents('scene.mas')
+        events.on('group', lambda event, (id, name): ..., "group %d %s")
+        events.run()
+    """
+
+    #--------------------------------------------------------------------------
+    # methods
+    #--------------------------------------------------------------------------
+
+    def __init__(self, path):
+        super(BlockEvents, self).__init__()
+
+        self.path       = path
+        self._callbacks = {}
+
+    #--------------------------------------------------------------------------
+
+    def __iter__(self):
+        """Generator over the events of the file.
+        """
+
+        tags  = self._readTags()
+        stack = []
+
+        with Compression.open(self.path, 'rb') as massive_file:
+            offset = 0
+            for raw_line in massive_file:
+
+                start   = offset
+                offset += len(raw_line)
+
+                line     = raw_line.rstrip('\r\n')
+                stripped = line.strip()
+                if not stripped:
+                    continue
+                attribute = stripped.split(None, 1)[0]
+
+                # end tag closes its block and any blocks left open inside it
+                if stripped[:4].lower() == 'end ':
+                    lowered = stripped.lower()
+                    level   = BlockReader._getLevel(line)
+                    for position in xrange(len(stack) - 1, -1, -1):
+                        if stack[position][1] == lowered and \
+                           stack[position][0] == level:
+                            block_type = stack[position][2]
+                            del stack[position:]
+                            yield BlockEvent((position, block_type, attribute, line, start))
+                            break
+                    else:
+                        lowered = None
+                    if lowered != None:
+                        continue
+
+                # indent closes the untagged blocks at the same or deeper level
+                level = BlockReader._getLevel(line)
+                while stack and (stack[-1][1] == None) and (stack[-1][0] >= level):
+                    stack.pop()
+
+                block_type = stack[-1][2] if stack else None
+                yield BlockEvent((len(stack), block_type, attribute, line, start))
+
+                # every line can have lines nested under it
+                tag = BlockReader._getTag(stripped, level, tags)
+                stack.append((level, tag, stripped[:len(tag) - 4] if tag else attribute))
+
+    #--------------------------------------------------------------------------
+
+    def on(self, attribute, callback, formatting=None, block_type=None):
+        """Register a callback for lines starting with the attribute.
+
+        The callback gets the event, and the scanned values if a scanf
+        formatting is given.  Block type limits the callback to lines
+        nested directly in blocks of that type.
+        """
+        entry = (block_type, formatting, callback)
+        self._callbacks.setdefault(attribute, []).append(entry)
+
+    #--------------------------------------------------------------------------
+
+    def run(self):
+        """Read the file dispatching the events to the callbacks.  Returns
+        the number of events read.
+        """
+        count     = 0
+        callbacks = self._callbacks
+        for event in self:
+            count += 1
+            entries = callbacks.get(event[2])
+            if not entries:
+                continue
+            for block_type, formatting, callback in entries:
+                if block_type != None and block_type != event[1]:
+                    continue
+                if formatting != None:
+                    callback(event, event.scan(formatting))
+                else:
+                    callback(event)
+        return count
+
+    #--------------------------------------------------------------------------
+    # helper methods
+    #--------------------------------------------------------------------------
+
+    def _readTags(self):
+        """End tags present in the file along with their level, lowercased.
+        """
+        tags = set()
+        with Compression.open(self.path, 'rb') as massive_file:
+            for line in massive_file:
+                BlockReader._addTag(line.rstrip('\r\n'), tags)
+        return tags
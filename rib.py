@@ -21,8 +21,18 @@
 #------------------------------------------------------------------------------
 
 import glob
+import itertools
+import mmap
+import multiprocessing
+import os
+import re
 
-from rib_blocks import *
+import numpy as np
+
+from common       import Compression
+from rib_blocks   import *
+from rib_pipeline import RibPipeline
+from snapshot     import Snapshot
 
 #------------------------------------------------------------------------------
 # class RibFile
@@ -63,33 +73,54 @@ class RibFile(object):
         if variables == None:
             return
 
-        # transfer the data to all paths provided
-        for ribPath in ribPaths:
+        # save current file if found
+        if ribFile._path in ribPaths:
+            ribFile.write()
 
-            # save current file if found
-            if ribPath == ribFile._path:
-                ribFile.write()
-                continue
+        # collect the values to transfer keyed by ant id
+        values = {}
+        for ant in ribFile.ants:
+            if ant.id in variables:
+                names          = variables[ant.id]
+                values[ant.id] = dict((n, ant.variables[n]) for n in names)
+
+        # transfer the data to all other paths provided
+        paths = [p for p in ribPaths if p != ribFile._path]
+        RibPipeline(paths).setAntVariables(values).run()
+
+    #--------------------------------------------------------------------------
 
-            # parse the rib file
-            ribFileInSet = RibFile(ribPath)
+    @staticmethod
+    def loadSnapshot(path, mmap=False):
+        """Load a parsed file from a binary snapshot.
+        """
+        rib_file = Snapshot.load(path, mmap)
+        if not isinstance(rib_file, RibFile):
+            raise TypeError("Snapshot doesn't contain a RibFile: %s" % path)
+        return rib_file
 
-            # it is assumed that the rib files belong to the same set hence
-            #  share the same and count and order
-            for ant, setAnt in zip(ribFiles.ants, ribFileInSet.ants):
-                if ant.id in variables:
-                    for variable in variables[ant.id]:
-                        setAnt.variables[variable] = ant.variables[variable]
+    #--------------------------------------------------------------------------
 
-            # write out the set file
-            ribFileInSet.write()
+    @staticmethod
+    def iterAnts(path, fields=None, predicate=None):
+        """Generator over the ants of the rib file at path, without keeping
+        the file in memory.  See AntReader for the fields and predicate.
+        """
+        reader = AntReader(fields, predicate)
+        with Compression.open(path, 'rU') as rib_file:
+            for entry in rib_file:
+                ant = reader.read(entry)
+                if ant != None:
+                    yield ant
 
     #--------------------------------------------------------------------------
     # methods
     #--------------------------------------------------------------------------
 
-    def __init__(self, path):
-        """Open file at path, read contents into memory, and close.
+    def __init__(self, path, predicate=None, preserve=False):
+        """Open file at path, read contents into memory, and close.  The
+        predicate limits the ants read, preserve keeps their source text,
+        see AntReader.
         """
         super(RibFile, self).__init__()
 
@@ -97,12 +128,14 @@ class RibFile(object):
         self._path = path
 
         # read in file contents
-        self._read(path)
+        self._read(path, predicate, preserve)
 
     #--------------------------------------------------------------------------
 
-    def write(self, path=None):
-        """Write the file to the given path.
+    def write(self, path=None, level=None, float_format=None):
+        """Write the file to the given path, .gz paths are compressed using
+        the level or the Compression default.  Floats are written using the
+        float format, see FloatFormat.
         """
 
         # use read path if path not specified
@@ -110,25 +143,336 @@ class RibFile(object):
             path = self._path
 
         # open the file and write out rib
-        with open(path, 'w') as rib_file:
-            rib_file.write("\n".join(map(str, self.ants)))
-            rib_file.write("\n")
+        with Compression.open(path, 'w', level, 1 << 20) as rib_file:
+            AntWriter(float_format).write(rib_file, self.ants)
+
+    #--------------------------------------------------------------------------
+
+    def saveSnapshot(self, path):
+        """Write the parsed file to a binary snapshot, see Snapshot.
+        """
+        Snapshot.save(self, path)
 
     #--------------------------------------------------------------------------
     # helper methods
     #--------------------------------------------------------------------------
 
-    def _read(self, path):
+    def _read(self, path, predicate=None, preserve=False):
         """Parses the contents of the file at the given path.
         """
 
         # parse the contents of the file ('U' deals with newlines cross-platformly)
-        with open(path, 'rU') as rib_file:
+        with Compression.open(path, 'rU') as rib_file:
             entries = rib_file.readlines()
 
             # read all of the available ants
             self.ants = []
+            reader    = AntReader(predicate=predicate, preserve=preserve)
             for entry in entries:
-                ant = AntBlock(entry)
-                self.ants.append(ant)
+                ant = reader.read(entry)
+                if ant != None:
+                    self.ants.append(ant)
+
+
+#------------------------------------------------------------------------------
+# class RibSequence
+#------------------------------------------------------------------------------
+
+class RibSequence(object):
+    """Per frame set of rib files with random access to single ants.
+
+    An index of the byte offset of every ant line, keyed by ant id, is built
+    once per file and saved next to the files.  Looking up an ant only maps
+    the file and parses the one line needed.
+    """
+
+    #--------------------------------------------------------------------------
+    # statics
+    #--------------------------------------------------------------------------
+
+    _sIndexVersion = 1
+
+    # ant id is the first entry of the data string
+    _sIdPattern = re.compile(r'^[^\n]*?\["[^"]*"\s+"(-?\d+)\s', re.M)
+
+    _sFramePattern = re.compile(r'\.(-?\d+)\.[^.\\/]*(?:\.gz)?$')
+
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    def fromRibFile(ribFile, index_path=None):
+        """Create the sequence from the frame set the rib file belongs to.
+        """
+        return RibSequence(RibFile.GetSimFrameSet(ribFile), index_path)
+
+    #--------------------------------------------------------------------------
+    # methods
+    #--------------------------------------------------------------------------
+
+    def __init__(self, paths, index_path=None):
+        """Initialize self with the rib paths of the frame set.  The index is
+        loaded from index_path if up to date, otherwise it is rebuilt and
+        saved there.  The default index path sits next to the first file.
+        """
+        super(RibSequence, self).__init__()
+
+        # order files by frame
+        self.paths  = sorted(paths, key=self._getFrame)
+        self.frames = map(self._getFrame, self.paths)
+
+        if index_path == None and self.paths:
+            index_path = self._getIndexPath(self.paths[0])
+        self._index_path = index_path
+
+        self._loadIndex()
+
+    #--------------------------------------------------------------------------
+
+    def __len__(self):
+        return len(self.paths)
+
+    #--------------------------------------------------------------------------
+
+    def ids(self, frame_index=0):
+        """Ant ids found in the file at the index, sorted.
+        """
+        return self._ids[frame_index]
+
+    #--------------------------------------------------------------------------
+
+    def antTrack(self, id):
+        """AntBlocks for the ant in every frame, None where the ant is
+        missing.  Returns a list of (frame, ant) tuples.
+        """
+        return self.antTracks([id])[id]
+
+    #--------------------------------------------------------------------------
+
+    def antTracks(self, ids):
+        """AntBlocks for multiple ants, each file is mapped once.  Returns a
+        dictionary of (frame, ant) lists keyed by ant id.
+        """
+
+        tracks = dict((id, []) for id in ids)
+        for index, path in enumerate(self.paths):
+            frame   = self.frames[index]
+            offsets = [(id, self._getOffset(index, id)) for id in ids]
+            found   = [(id, o) for id, o in offsets if o != None]
+
+            # skip mapping the file if none of the ants are in it
+            for id, offset in offsets:
+                if offset == None:
+                    tracks[id].append((frame, None))
+            if not found:
+                continue
+
+            for id, ant in self._readAnts(path, found):
+                tracks[id].append((frame, ant))
+
+        return tracks
+
+    #--------------------------------------------------------------------------
+
+    def trajectories(self, ids=None, path=None, processes=None):
+        """Transforms (tx, ty, tz, rx, ry, rz) of the ants over all frames as
+        a (frames, ants, 6) float32 array, along with the ant ids for the
+        second axis.  Ants missing from a frame are filled with nan.
+
+        ids limits the ants extracted, all ants in the sequence by default.
+        If path is given the array is streamed into a memory mapped .npy file
+        at that path instead of being held in memory.  Frames are read in
+        parallel by a pool of processes, processes=1 reads them in process.
+        """
+
+        # align ants by sorted id
+        if ids is None:
+            ids = np.unique(np.concatenate(self._ids)) if self._ids else []
+        ids = np.unique(np.asarray(ids, dtype=np.int64))
+
+        shape = (len(self.paths), len(ids), 6)
+        if path != None:
+            array = np.lib.format.open_memmap(path, 'w+', np.float32, shape)
+            array[:] = np.nan
+        else:
+            array = np.full(shape, np.nan, dtype=np.float32)
+
+        # frames are returned in order, only a few are held at once
+        pool = None
+        if processes != 1 and len(self.paths) > 1:
+            pool   = multiprocessing.Pool(processes)
+            frames = pool.imap(_readTransforms, self.paths)
+        else:
+            frames = itertools.imap(_readTransforms, self.paths)
+
+        try:
+            for index, (frame_ids, transforms) in enumerate(frames):
+                positions = np.searchsorted(ids, frame_ids)
+                positions = np.minimum(positions, max(len(ids) - 1, 0))
+                found     = (ids[positions] == frame_ids) if len(ids) else \
+                            np.zeros(len(frame_ids), dtype=bool)
+                array[index, positions[found]] = transforms[found]
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+        if path != None:
+            array.flush()
+        return array, ids
+
+    #--------------------------------------------------------------------------
+    # helper methods
+    #--------------------------------------------------------------------------
+
+    def _getFrame(self, path):
+        match = RibSequence._sFramePattern.search(path)
+        return int(match.group(1)) if match else 0
+
+    #--------------------------------------------------------------------------
+
+    def _getIndexPath(self, path):
+        """Sidecar path shared by all the frames, ie x.0001.rib -> x.ribidx
+        """
+        directory, name = os.path.split(path)
+        name = RibSequence._sFramePattern.sub('', name)
+        return os.path.join(directory, "%s.ribidx" % name)
+
+    #--------------------------------------------------------------------------
+
+    def _getOffset(self, index, id):
+        ids      = self._ids[index]
+        position = np.searchsorted(ids, id)
+        if position < len(ids) and ids[position] == id:
+            return int(self._offsets[index][position])
+        return None
+
+    #--------------------------------------------------------------------------
+
+    def _getStamp(self, path):
+        stat = os.stat(path)
+        return (stat.st_size, stat.st_mtime)
+
+    #--------------------------------------------------------------------------
+
+    def _readAnts(self, path, found):
+        """AntBlocks at the (id, offset) entries of a file.  Plain files are
+        memory mapped, compressed ones have to be decompressed.
+        """
+
+        if Compression.isCompressed(path):
+            with Compression.open(path, 'rb') as rib_file:
+                return self._getAnts(rib_file.read(), found)
+
+        with open(path, 'rb') as rib_file:
+            data = mmap.mmap(rib_file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                return self._getAnts(data, found)
+            finally:
+                data.close()
+
+    #--------------------------------------------------------------------------
+
+    def _getAnts(self, data, found):
+        ants = []
+        for id, offset in found:
+            end = data.find('\n', offset)
+            end = len(data) if end < 0 else end
+            ants.append((id, AntBlock(data[offset:end])))
+        return ants
+
+    #--------------------------------------------------------------------------
+
+    def _indexFile(self, path):
+        """Scan the file for the byte offset of every ant line, offsets are
+        into the decompressed data for .gz files.
+        """
+
+        with Compression.open(path, 'rb') as rib_file:
+            data = rib_file.read()
+
+        ids     = []
+        offsets = []
+        for match in RibSequence._sIdPattern.finditer(data):
+            ids.append(int(match.group(1)))
+            offsets.append(match.start())
+
+        # sort by id for binary search lookups
+        ids     = np.array(ids, dtype=np.int64)
+        offsets = np.array(offsets, dtype=np.int64)
+        order   = np.argsort(ids, kind='mergesort')
+        return ids[order], offsets[order]
+
+    #--------------------------------------------------------------------------
+
+    def _loadIndex(self):
+        """Load the saved index, re-indexing files that changed since.
+        """
+
+        # reuse entries from the saved index that are still valid, a damaged
+        #  or unreadable index is rebuilt
+        saved = {}
+        if self._index_path and os.path.exists(self._index_path):
+            try:
+                index = Snapshot.load(self._index_path)
+                if isinstance(index, dict) and \
+                   index.get('version') == RibSequence._sIndexVersion:
+                    for path, stamp, ids, offsets in zip(index['paths'],
+                            index['stamps'], index['ids'], index['offsets']):
+                        if len(ids) != len(offsets):
+                            raise ValueError("Corrupt index")
+                        saved[path] = (tuple(stamp), ids, offsets)
+            except (ValueError, TypeError, KeyError, EnvironmentError):
+                saved = {}
+
+        self._ids     = []
+        self._offsets = []
+        stamps        = []
+        dirty         = False
+        for path in self.paths:
+            stamp = self._getStamp(path)
+            entry = saved.get(path)
+            if entry and entry[0] == stamp:
+                ids, offsets = entry[1:]
+            else:
+                ids, offsets = self._indexFile(path)
+                dirty        = True
+            self._ids.append(ids)
+            self._offsets.append(offsets)
+            stamps.append(stamp)
+
+        # save the updated index, kept in memory only if it can't be written
+        if self._index_path and (dirty or len(saved) != len(self.paths)):
+            try:
+                Snapshot.save({
+                    'version' : RibSequence._sIndexVersion,
+                    'paths'   : self.paths,
+                    'stamps'  : stamps,
+                    'ids'     : self._ids,
+                    'offsets' : self._offsets,
+                }, self._index_path)
+            except (IOError, OSError):
+                pass
+
+#------------------------------------------------------------------------------
+# helper functions
+#------------------------------------------------------------------------------
+
+_sTransformPattern = re.compile(
+    r'^[^\n]*?\["[^"]*"\s+"(-?\d+)\s[^\n]*?"\]\s*\[([^\]\n]*)\]', re.M)
+
+def _readTransforms(path):
+    """Read the ant ids and (n, 6) transforms from a rib file without parsing
+    the ants.  Module level so it can be sent to pool workers.
+    """
+
+    with Compression.open(path, 'rb') as rib_file:
+        data = rib_file.read()
 
+    matches    = _sTransformPattern.findall(data)
+    ids        = np.array([int(m[0]) for m in matches], dtype=np.int64)
+    transforms = np.fromstring(" ".join([m[1] for m in matches]),
+                               dtype=np.float64, sep=' ')
+    if transforms.size != 6 * len(ids):
+        raise ValueError("Expected %d transform values, read %d: %s" %
+                         (6 * len(ids), transforms.size, path))
+    return ids, transforms.reshape(-1, 6).astype(np.float32)
@@ -25,6 +25,8 @@ import re
 from scanf import sscanf
 from scanf import IncompleteCaptureError
 
+from common import FloatFormat
+
 #------------------------------------------------------------------------------
 # class AntBlock
 #------------------------------------------------------------------------------
@@ -47,8 +49,9 @@ class AntBlock(object):
     # methods
     #--------------------------------------------------------------------------
 
-    def __init__(self, block):
-        """Initialize self with scene data.
+    def __init__(self, block, preserve=False):
+        """Initialize self with scene data.  With preserve the source text is
+        kept to write unchanged values back as is.
         """
         super(AntBlock, self).__init__()
 
@@ -68,8 +71,9 @@ class AntBlock(object):
         values       = variableData[1::2]
 
         # use dictionary to manage variables
-        self.variables = {}
-        self._varOrder = names
+        self.variables    = {}
+        self._varOrder    = names
+        self._varOrderSet = frozenset(names)
         for name, value in zip(names, values):
             if name not in self.variables:
                 self.variables[name], = sscanf(value, "%f")
@@ -84,56 +88,255 @@ class AntBlock(object):
         self.tx, self.ty, self.tz = tx, ty, tz
         self.rx, self.ry, self.rz = rx, ry, rz
 
+        # keep the source text to write back unchanged values as is
+        self._source = None
+        if preserve:
+            parsed       = map(self.variables.get, names)
+            variables    = dict(zip(names, zip(values, parsed)))
+            transform    = zip(transform[1:-1].split(), (tx, ty, tz, rx, ry, rz))
+            self._source = (variables, transform)
+
     #--------------------------------------------------------------------------
 
     def __str__(self):
-        data      = self._dataStr()
-        transform = AntBlock._sTransformFormatting % \
-                    (self.tx, self.ty, self.tz, self.rx, self.ry, self.rz)
-        block     = '%s "%s" %s %s' % (self.type, self.mode, data, transform)
-        return block
+        return AntWriter._sDefault.format(self)
 
     #--------------------------------------------------------------------------
     # methods
     #--------------------------------------------------------------------------
 
-    def _variablesStr(self):
-        """Convert dictionary of data into a string. Making sure order is
-        preserved.
+    def _variableNames(self):
+        """Variable names in write order, the originally parsed variables
+        followed by the new ones.
+        """
+
+        # common case, variables untouched since parsing
+        variables = self.variables
+        if variables.viewkeys() == self._varOrderSet:
+            return self._varOrder
+
+        order = [name for name in self._varOrder if name in variables]
+        order.extend([name for name in variables if name not in self._varOrder])
+        return order
+
+
+#------------------------------------------------------------------------------
+# class AntWriter
+#------------------------------------------------------------------------------
+
+class AntWriter(object):
+    """Writes ants using format strings compiled per variable schema.
+
+    Everything that is shared by ants with the same type, mode, program, cdl
+    and variable names is baked into a single format string, each ant then
+    only needs one format operation.
+    """
+
+    #--------------------------------------------------------------------------
+    # methods
+    #--------------------------------------------------------------------------
+
+    def __init__(self, float_format=None):
+        """Initialize self with the float format, the format active when
+        writing is used if not given.
+        """
+        super(AntWriter, self).__init__()
+        self.float_format = float_format
+        self._formats     = {}
+
+    #--------------------------------------------------------------------------
+
+    def format(self, ant):
+        """Convert the ant into its rib line.
+        """
+        float_format = self.float_format or FloatFormat.current()
+        names        = ant._variableNames()
+        source       = getattr(ant, '_source', None)
+        formatting   = self._getFormat(ant, names, float_format, source != None)
+        values       = tuple(map(ant.variables.__getitem__, names))
+        transform    = (ant.tx, ant.ty, ant.tz, ant.rx, ant.ry, ant.rz)
+
+        # floats are converted to text up front unless written with %g
+        if source != None:
+            values    = self._getSourceValues(names, values, source[0], float_format)
+            transform = self._getSourceTransform(transform, source[1], float_format)
+        elif not float_format.isGeneral():
+            values    = tuple(float_format.convert(values))
+            transform = tuple(float_format.convert(transform))
+
+        return formatting % ((ant.id, ant.apf, ant.frame) + values + transform)
+
+    #--------------------------------------------------------------------------
+
+    def write(self, stream, ants):
+        """Write the ants to the stream, one per line.
+        """
+        write  = stream.write
+        format = self.format
+        for ant in ants:
+            write(format(ant))
+            write('\n')
+
+    #--------------------------------------------------------------------------
+    # helper methods
+    #--------------------------------------------------------------------------
+
+    def _getFormat(self, ant, names, float_format, preserve=False):
+        """Look up or compile the format string for the ant's schema.
+        """
+
+        # floats are passed in as text when preserving the source
+        spec       = '%s' if preserve else float_format.spec()
+        key        = (ant.type, ant.mode, ant.program, ant.cdl, tuple(names), spec)
+        formatting = self._formats.get(key)
+        if formatting == None:
+            escape     = lambda value: str(value).replace('%', '%%')
+            variables  = " ".join(["%s %s" % (escape(name), spec) for name in names])
+            transform  = AntBlock._sTransformFormatting.replace('%g', spec)
+            formatting = '%s "%s" ["%s" "%%s %s %%s %%s %s"] %s' % \
+                (escape(ant.type), escape(ant.mode), escape(ant.program),
+                 escape(ant.cdl), variables, transform)
+            self._formats[key] = formatting
+        return formatting
+
+    #--------------------------------------------------------------------------
+
+    def _getSourceValues(self, names, values, source, float_format):
+        """Variable values as text, using the source text if unchanged.
         """
+        texts = []
+        for name, value in zip(names, values):
+            text, parsed = source.get(name, (None, None))
+            texts.append(text if (text != None and value == parsed) else \
+                         float_format.text(value))
+        return tuple(texts)
+
+    #--------------------------------------------------------------------------
+
+    def _getSourceTransform(self, transform, source, float_format):
+        """Transform values as text, using the source text if unchanged.
+        """
+        if len(source) != len(transform):
+            return tuple(map(float_format.text, transform))
+        return tuple([text if value == parsed else float_format.text(value)
+                      for value, (text, parsed) in zip(transform, source)])
 
-        order = []
+#------------------------------------------------------------------------------
 
-        # add all the originally parsed variables
-        for name in self._varOrder:
-            if name in self.variables:
-                order.append(name)
+AntWriter._sDefault = AntWriter()
 
-        # add all the new variables
-        for name in self.variables.keys():
-            if name not in self._varOrder:
-                order.append(name)
+#------------------------------------------------------------------------------
+# class AntReader
+#------------------------------------------------------------------------------
 
-        # join together
-        return " ".join(["%s %g" % (name, self.variables[name]) for name in order])
+class AntReader(object):
+    """Reads ant lines with an optional projection and predicate.
 
+    The predicate is called with the fields in front of the variables, as
+    a dictionary of type, mode, program, id, cdl, apf and frame, before
+    anything else is parsed.  Lines it rejects are skipped.
+
+    Without fields full AntBlocks are read, keeping their source text with
+    preserve.  With fields each ant becomes a tuple of just those fields,
+    which can be any of the prefix fields, 'transform', 'variables' for a
+    dictionary of all variables, or the name of a variable (None if the
+    ant doesn't have it).  Fields that aren't asked for are never
+    converted.
+    """
+
+    #--------------------------------------------------------------------------
+    # statics
+    #--------------------------------------------------------------------------
+
+    _sPrefixPattern = re.compile(
+        r'(\w+)\s"(\w+)"\s\["([^\s]+)"\s"(\d+)\s([^\s]+)\s([^\s]+)\s(-?\d+)\s')
+
+    _sPrefixFields = ('type', 'mode', 'program', 'id', 'cdl', 'apf', 'frame')
+
+    #--------------------------------------------------------------------------
+    # methods
     #--------------------------------------------------------------------------
 
-    def _dataStr(self):
-        """Convert data section into a string.
+    def __init__(self, fields=None, predicate=None, preserve=False):
+        super(AntReader, self).__init__()
+
+        self.fields    = list(fields) if fields != None else None
+        self.predicate = predicate
+        self.preserve  = preserve
+
+        # variables asked for by name
+        if self.fields != None:
+            special        = frozenset(AntReader._sPrefixFields + ('transform', 'variables'))
+            self._names    = frozenset([f for f in self.fields if f not in special])
+            self._allVars  = 'variables' in self.fields
+            self._needVars = bool(self._names) or self._allVars
+
+    #--------------------------------------------------------------------------
+
+    def read(self, line):
+        """Read the ant on the line, None if the predicate rejects it.
         """
 
-        # setup args for template
-        args = {
-            'program' : self.program,
-            'id'      : self.id,
-            'cdl'     : self.cdl,
-            'apf'     : self.apf,
-            'frame'   : self.frame,
-            'vars'    : self._variablesStr()
-        }
+        # plain read
+        if self.fields == None and self.predicate == None:
+            return AntBlock(line, self.preserve)
+
+        # scan the fields in front of the variables
+        match = AntReader._sPrefixPattern.match(line)
+        if match == None:
+            raise ValueError("Invalid ant entry: %s" % line.rstrip())
+
+        # filter on the prefix before parsing anything else
+        if self.predicate != None:
+            if not self.predicate(self._getPrefix(match)):
+                return None
+            if self.fields == None:
+                return AntBlock(line, self.preserve)
+
+        return self._project(line, match)
+
+    #--------------------------------------------------------------------------
+    # helper methods
+    #--------------------------------------------------------------------------
 
-        # replace args in template
-        template = '["%(program)s" "%(id)s %(cdl)s %(apf)s %(frame)s %(vars)s"]'
-        return template % args
+    def _getPrefix(self, match):
+        prefix          = dict(zip(AntReader._sPrefixFields, match.groups()))
+        prefix['id']    = int(prefix['id'])
+        prefix['frame'] = int(prefix['frame'])
+        return prefix
 
+    #--------------------------------------------------------------------------
+
+    def _project(self, line, match):
+        """Tuple of the projected fields.
+        """
+
+        # only split out the variables if any are needed
+        end       = line.index('"]', match.end())
+        variables = None
+        if self._needVars:
+            data = line[match.end():end].split(' ')
+            if self._allVars:
+                variables = dict(zip(data[0::2], map(float, data[1::2])))
+            else:
+                variables = {}
+                for name, value in zip(data[0::2], data[1::2]):
+                    if name in self._names:
+                        variables[name] = float(value)
+
+        values = []
+        for field in self.fields:
+            if field == 'id':
+                values.append(int(match.group(4)))
+            elif field == 'frame':
+                values.append(int(match.group(7)))
+            elif field == 'transform':
+                start = line.index('[', end + 2) + 1
+                values.append(tuple(map(float, line[start:line.index(']', start)].split())))
+            elif field == 'variables':
+                values.append(variables)
+            elif field in AntReader._sPrefixFields:
+                values.append(match.group(AntReader._sPrefixFields.index(field) + 1))
+            else:
+                values.append(variables.get(field))
+        return tuple(values)
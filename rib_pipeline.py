@@ -0,0 +1,277 @@
+#------------------------------------------------------------------------------
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#                     Version 2, December 2004
+#
+#  Copyright (C) 2013 Electronic Dreams <maverick.babylon.drifter@gmail.com>
+#
+#  Everyone is permitted to copy and distribute verbatim or modified
+#  copies of this license document, and changing it is allowed as long
+#  as the name is changed.
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#    TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+#
+#   0. You just DO WHAT THE FUCK YOU WANT TO.
+#
+#------------------------------------------------------------------------------
+
+
+#------------------------------------------------------------------------------
+# rib_pipeline.py - Streaming rewrites of per frame rib file sets.
+#------------------------------------------------------------------------------
+
+import multiprocessing
+import re
+
+from common     import AtomicFile
+from common     import Compression
+from rib_blocks import AntBlock
+from rib_blocks import AntReader
+from rib_blocks import AntWriter
+
+#------------------------------------------------------------------------------
+# class RibPipeline
+#------------------------------------------------------------------------------
+
+class RibPipeline(object):
+    """Declarative read-modify-write job over a set of rib files.
+
+    The source is a list of rib paths, stages are applied to every ant in
+    order and the sink writes each file back in place or under a new prefix.
+    Files are streamed a line at a time, so only one ant per file is held in
+    memory, and are replaced atomically once fully written.  Files are
+    processed in parallel by a pool of worker processes, stages and any
+    functions they use must therefore be picklable (module level).
+
+        RibPipeline(paths).keepIds(ids).deleteVariables(['foo']).run()
+    """
+
+    #--------------------------------------------------------------------------
+    # statics
+    #--------------------------------------------------------------------------
+
+    _sFramePattern = re.compile(r'\.-?\d+\.[^.\\/]*(?:\.gz)?$')
+
+    #--------------------------------------------------------------------------
+    # methods
+    #--------------------------------------------------------------------------
+
+    def __init__(self, paths):
+        """Initialize self with the rib paths to process.
+        """
+        super(RibPipeline, self).__init__()
+        self.paths  = list(paths)
+        self.stages = []
+
+    #--------------------------------------------------------------------------
+
+    def add(self, stage):
+        """Append a stage, any callable taking an AntBlock and returning the
+        ant to write or None to drop it.
+        """
+        self.stages.append(stage)
+        return self
+
+    #--------------------------------------------------------------------------
+
+    def map(self, function):
+        """Modify each ant with the function, which returns the ant.
+        """
+        return self.add(MapStage(function))
+
+    #--------------------------------------------------------------------------
+
+    def filter(self, predicate):
+        """Only keep ants the predicate is true for.
+        """
+        return self.add(FilterStage(predicate))
+
+    #--------------------------------------------------------------------------
+
+    def keepIds(self, ids):
+        return self.add(IdFilterStage(ids, True))
+
+    #--------------------------------------------------------------------------
+
+    def dropIds(self, ids):
+        return self.add(IdFilterStage(ids, False))
+
+    #--------------------------------------------------------------------------
+
+    def setVariables(self, values):
+        """Set the variables in the dictionary on every ant.
+        """
+        return self.add(SetVariablesStage(values))
+
+    #--------------------------------------------------------------------------
+
+    def setAntVariables(self, values):
+        """Set variables per ant, values is a dictionary of variable
+        dictionaries keyed by ant id.
+        """
+        return self.add(SetVariablesStage(values, per_ant=True))
+
+    #--------------------------------------------------------------------------
+
+    def deleteVariables(self, names):
+        return self.add(DeleteVariablesStage(names))
+
+    #--------------------------------------------------------------------------
+
+    def run(self, prefix=None, processes=None, level=None, float_format=None):
+        """Run the pipeline over all the files.
+
+        Files are rewritten in place unless a prefix is given, in which case
+        the part of the path before the frame number is replaced, ie
+        /a/b.0001.rib with prefix /c/d is written to /c/d.0001.rib.  Use
+        processes=1 to run in process.  Returns a list of (output path, ants
+        written) tuples.
+
+        Outputs ending in .gz are compressed in the worker processes, using
+        the level or the Compression default.  Floats are written using the
+        float format, see FloatFormat.
+        """
+
+        jobs = [(self.stages, path, self._getOutputPath(path, prefix), level,
+                 float_format) for path in self.paths]
+
+        if processes == 1 or len(jobs) < 2:
+            return map(_runJob, jobs)
+
+        pool = multiprocessing.Pool(processes)
+        try:
+            return pool.map(_runJob, jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+    #--------------------------------------------------------------------------
+    # helper methods
+    #--------------------------------------------------------------------------
+
+    def _getOutputPath(self, path, prefix):
+        if prefix == None:
+            return path
+        match = RibPipeline._sFramePattern.search(path)
+        if not match:
+            raise ValueError("No frame number found in %s" % path)
+        return prefix + match.group(0)
+
+#------------------------------------------------------------------------------
+# class MapStage
+#------------------------------------------------------------------------------
+
+class MapStage(object):
+    """Applies a function to each ant.
+    """
+
+    def __init__(self, function):
+        self.function = function
+
+    def __call__(self, ant):
+        return self.function(ant)
+
+#------------------------------------------------------------------------------
+# class FilterStage
+#------------------------------------------------------------------------------
+
+class FilterStage(object):
+    """Drops ants the predicate is false for.
+    """
+
+    def __init__(self, predicate):
+        self.predicate = predicate
+
+    def __call__(self, ant):
+        return ant if self.predicate(ant) else None
+
+#------------------------------------------------------------------------------
+# class IdFilterStage
+#------------------------------------------------------------------------------
+
+class IdFilterStage(object):
+    """Keeps or drops ants by id.  ids can be any container, ie a RangeSet.
+    """
+
+    def __init__(self, ids, keep=True):
+        self.ids  = ids if hasattr(ids, '__contains__') else set(ids)
+        self.keep = keep
+
+    def __call__(self, ant):
+        return ant if (ant.id in self.ids) == self.keep else None
+
+#------------------------------------------------------------------------------
+# class SetVariablesStage
+#------------------------------------------------------------------------------
+
+class SetVariablesStage(object):
+    """Sets variable values on all ants, or per ant keyed by id.
+    """
+
+    def __init__(self, values, per_ant=False):
+        self.values  = values
+        self.per_ant = per_ant
+
+    def __call__(self, ant):
+        values = self.values.get(ant.id, {}) if self.per_ant else self.values
+        ant.variables.update(values)
+        return ant
+
+#------------------------------------------------------------------------------
+# class DeleteVariablesStage
+#------------------------------------------------------------------------------
+
+class DeleteVariablesStage(object):
+    """Removes variables from every ant.
+    """
+
+    def __init__(self, names):
+        self.names = list(names)
+
+    def __call__(self, ant):
+        for name in self.names:
+            ant.variables.pop(name, None)
+        return ant
+
+#------------------------------------------------------------------------------
+# helper functions
+#------------------------------------------------------------------------------
+
+def _runJob(job):
+    """Stream a single file through the stages into a temporary file next to
+    the output and swap it in.  Module level so it can be sent to workers.
+    """
+
+    stages, path, output_path, level, float_format = job
+
+    count  = 0
+    writer = AntWriter(float_format)
+    with AtomicFile.open(output_path) as temp_file:
+        output_file = temp_file
+        if Compression.isCompressed(output_path):
+            output_file = Compression.wrap(temp_file, level)
+        with Compression.open(path, 'rU') as rib_file:
+            for line in rib_file:
+
+                # pass through anything that isn't an ant unchanged
+                if AntReader._sPrefixPattern.match(line) == None:
+                    output_file.write(line)
+                    continue
+
+                ant = AntBlock(line)
+                for stage in stages:
+                    ant = stage(ant)
+                    if ant == None:
+                        break
+
+                if ant != None:
+                    output_file.write(writer.format(ant))
+                    output_file.write('\n')
+                    count += 1
+
+        # finish the compressed data before the file is closed
+        if output_file is not temp_file:
+            output_file.close()
+
+    return output_path, count
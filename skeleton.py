@@ -0,0 +1,352 @@
+#------------------------------------------------------------------------------
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#                     Version 2, December 2004
+#
+#  Copyright (C) 2013 Electronic Dreams <maverick.babylon.drifter@gmail.com>
+#
+#  Everyone is permitted to copy and distribute verbatim or modified
+#  copies of this license document, and changing it is allowed as long
+#  as the name is changed.
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#    TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+#
+#   0. You just DO WHAT THE FUCK YOU WANT TO.
+#
+#------------------------------------------------------------------------------
+
+
+#------------------------------------------------------------------------------
+# skeleton.py - Array backed agent skeleton built from cdl segments.
+#------------------------------------------------------------------------------
+
+import math
+
+import numpy as np
+
+from common import FloatFormat
+
+#------------------------------------------------------------------------------
+# class Skeleton
+#------------------------------------------------------------------------------
+
+class Skeleton(object):
+    """Compact tree of agent segments.
+
+    Segment names are held in a table, the hierarchy in a parent index array
+    (-1 for roots) and the transforms in (n, 3) translate, rotate and scale
+    arrays.  Changes to the arrays can be written back into the segments
+    they were built from, untouched segments keep their original text.
+    """
+
+    #--------------------------------------------------------------------------
+    # statics
+    #--------------------------------------------------------------------------
+
+    _sTransformFormatting = "%s %g %g %g"
+
+    _sTransforms = { 'translate' : 0, 'rotate' : 1, 'scale' : 2 }
+
+    _sAngleScales = {
+        'degrees'     : math.pi / 180.0,
+        'radians'     : 1.0,
+        'revolutions' : math.pi * 2.0,
+    }
+
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    def fromSegments(segments, order=None, angles=None):
+        """Parse the skeleton out of a list of SegmentNodes.
+
+        order is the rotation order (ie 'xyz'), angles the rotation units
+        (degrees, radians, revolutions), as found on the ObjectBlock.
+        """
+
+        count     = len(segments)
+        names     = []
+        parents   = []
+        transform = np.zeros((3, count, 3), dtype=np.float64)
+        transform[2, :, :] = 1.0
+        channels  = []
+
+        # only the unindented lines in the body are segment attributes
+        for index, segment in enumerate(segments):
+            names.append(segment.name)
+            parent = None
+            chans  = []
+            for line in segment._raw.split('\n'):
+                if line[:1] in ('', ' ', '\t'):
+                    continue
+                tokens = line.split()
+                key    = tokens[0]
+                if key == 'parent' and len(tokens) > 1:
+                    parent = tokens[1]
+                elif key in Skeleton._sTransforms and len(tokens) > 3:
+                    axis = Skeleton._sTransforms[key]
+                    transform[axis, index] = map(float, tokens[1:4])
+                elif key == 'channels':
+                    chans = tokens[1:]
+            parents.append(parent)
+            channels.append(chans)
+
+        # resolve parent names into indices, unknown parents become roots
+        lookup  = dict((n, i) for i, n in reversed(list(enumerate(names))))
+        parents = [lookup.get(p, -1) for p in parents]
+
+        return Skeleton(names, parents, transform[0], transform[1],
+            transform[2], channels, order, angles, segments)
+
+
+    #--------------------------------------------------------------------------
+    # methods
+    #--------------------------------------------------------------------------
+
+    def __init__(self, names, parents, translates, rotates, scales,
+                 channels=None, order=None, angles=None, segments=None):
+        """Initialize self with the skeleton tables.
+        """
+        super(Skeleton, self).__init__()
+
+        self.names      = list(names)
+        self.parents    = np.asarray(parents, dtype=np.int32)
+        self.translates = np.array(translates, dtype=np.float64).reshape(-1, 3)
+        self.rotates    = np.array(rotates, dtype=np.float64).reshape(-1, 3)
+        self.scales     = np.array(scales, dtype=np.float64).reshape(-1, 3)
+        self.channels   = channels if channels != None else [[] for n in names]
+        self.order      = order if self._isOrder(order) else 'xyz'
+        self.angles     = angles if angles in Skeleton._sAngleScales else 'degrees'
+
+        # keep the source segments and their parsed state for writing back
+        self._segments = segments
+        self._parsed   = (self.parents.copy(), self.translates.copy(),
+                          self.rotates.copy(), self.scales.copy())
+
+        self._buildTopology()
+
+    #--------------------------------------------------------------------------
+
+    def __len__(self):
+        return len(self.names)
+
+    #--------------------------------------------------------------------------
+
+    def index(self, name):
+        """Index of the named segment.
+        """
+        return self._lookup[name]
+
+    #--------------------------------------------------------------------------
+
+    def roots(self):
+        return np.flatnonzero(self.parents < 0)
+
+    #--------------------------------------------------------------------------
+
+    def children(self, index):
+        """Indices of the direct children of the segment.
+        """
+        start, end = self._childOffsets[index], self._childOffsets[index + 1]
+        return self._children[start:end]
+
+    #--------------------------------------------------------------------------
+
+    def traverse(self, root=None):
+        """Segment indices in depth first order, parents before children.
+        """
+        if root == None:
+            return self._preorder
+        if not isinstance(root, (int, long, np.integer)):
+            root = self.index(root)
+        start = self._preorderPosition[root]
+        return self._preorder[start:start + self._subtreeSizes[root]]
+
+    #--------------------------------------------------------------------------
+
+    def subtree(self, root):
+        """Extract the segment and all of its descendants as a new skeleton.
+        """
+
+        indices = self.traverse(root)
+
+        # remap the parent indices into the new tables
+        remap          = np.full(len(self), -1, dtype=np.int32)
+        remap[indices] = np.arange(len(indices), dtype=np.int32)
+        parents        = self.parents[indices]
+        parents        = np.where(parents < 0, -1, remap[np.maximum(parents, 0)])
+        parents[0]     = -1
+
+        segments = None
+        if self._segments != None:
+            segments = [self._segments[i] for i in indices]
+
+        return Skeleton([self.names[i] for i in indices], parents,
+            self.translates[indices], self.rotates[indices],
+            self.scales[indices], [self.channels[i] for i in indices],
+            self.order, self.angles, segments)
+
+    #--------------------------------------------------------------------------
+
+    def localMatrices(self):
+        """Local (n, 4, 4) transform matrices, translate * rotate * scale
+        acting on column vectors.
+        """
+
+        count   = len(self)
+        angles  = self.rotates * Skeleton._sAngleScales[self.angles]
+        cos     = np.cos(angles)
+        sin     = np.sin(angles)
+
+        # build the per axis rotations
+        axes = {}
+        for axis, (a, b) in zip('xyz', ((1, 2), (2, 0), (0, 1))):
+            i = 'xyz'.index(axis)
+            rotation = np.zeros((count, 3, 3))
+            rotation[:, i, i] = 1.0
+            rotation[:, a, a] = cos[:, i]
+            rotation[:, a, b] = -sin[:, i]
+            rotation[:, b, a] = sin[:, i]
+            rotation[:, b, b] = cos[:, i]
+            axes[axis] = rotation
+
+        # first axis in the order is applied first
+        rotation = axes[self.order[0]]
+        for axis in self.order[1:]:
+            rotation = np.einsum('nij,njk->nik', axes[axis], rotation)
+
+        matrices = np.zeros((count, 4, 4))
+        matrices[:, :3, :3] = rotation * self.scales[:, np.newaxis, :]
+        matrices[:, :3, 3]  = self.translates
+        matrices[:, 3, 3]   = 1.0
+        return matrices
+
+    #--------------------------------------------------------------------------
+
+    def worldMatrices(self):
+        """World (n, 4, 4) transform matrices, computed a depth level at a
+        time.
+        """
+        matrices = self.localMatrices()
+        for level in self._levels[1:]:
+            parents         = self.parents[level]
+            matrices[level] = np.einsum('nij,njk->nik', matrices[parents],
+                                        matrices[level])
+        return matrices
+
+    #--------------------------------------------------------------------------
+
+    def write(self, float_format=None):
+        """Write changed parents and transforms back into the segments the
+        skeleton was built from, using the float format or the active one.
+        """
+
+        if self._segments == None:
+            raise ValueError("Skeleton was not built from segments.")
+
+        float_format = float_format or FloatFormat.current()
+        parents, translates, rotates, scales = self._parsed
+        for index, segment in enumerate(self._segments):
+
+            # collect the lines that need updating
+            changes = {}
+            if self.parents[index] != parents[index]:
+                parent = self.parents[index]
+                changes['parent'] = None if parent < 0 else \
+                                    "parent %s" % self.names[parent]
+            for key, values, old in (('translate', self.translates, translates),
+                                     ('rotate',    self.rotates,    rotates),
+                                     ('scale',     self.scales,     scales)):
+                if not np.array_equal(values[index], old[index]):
+                    data         = (key,) + tuple(values[index])
+                    changes[key] = float_format.format(Skeleton._sTransformFormatting, data)
+
+            if changes:
+                segment._raw = self._updateLines(segment._raw, changes)
+
+        self._parsed = (self.parents.copy(), self.translates.copy(),
+                        self.rotates.copy(), self.scales.copy())
+
+    #--------------------------------------------------------------------------
+    # helper methods
+    #--------------------------------------------------------------------------
+
+    def _isOrder(self, order):
+        return isinstance(order, basestring) and sorted(order) == list('xyz')
+
+    #--------------------------------------------------------------------------
+
+    def _buildTopology(self):
+        """Builds the child lists, depth first order and depth levels.
+        """
+
+        count = len(self)
+
+        self._lookup = {}
+        for index, name in enumerate(self.names):
+            self._lookup.setdefault(name, index)
+
+        # child lists stored compressed, children of i are found between
+        #  offsets i and i + 1
+        parents             = np.where(self.parents < 0, count, self.parents)
+        self._children      = np.argsort(parents, kind='mergesort').astype(np.int32)
+        self._childOffsets  = np.searchsorted(parents[self._children],
+                                              np.arange(count + 2))
+        self._rootOffsets   = self._childOffsets[count:count + 2]
+
+        # depth first order with subtree sizes for slicing out subtrees
+        preorder = []
+        depths   = np.zeros(count, dtype=np.int32)
+        start, end = self._rootOffsets
+        stack    = list(reversed(self._children[start:end]))
+        while stack:
+            index = stack.pop()
+            preorder.append(index)
+            children = self.children(index)
+            depths[children] = depths[index] + 1
+            stack.extend(reversed(children))
+
+        # segments in a parent cycle are never reached from a root
+        if len(preorder) != count:
+            reached = set(preorder)
+            cyclic  = [n for i, n in enumerate(self.names) if i not in reached]
+            raise ValueError("Segments with cyclic parents: %s" %
+                             " ".join(cyclic))
+
+        self._preorder         = np.array(preorder, dtype=np.int32)
+        self._preorderPosition = np.zeros(count, dtype=np.int32)
+        self._preorderPosition[self._preorder] = np.arange(len(preorder))
+
+        # subtree sizes accumulated bottom up
+        sizes = np.ones(count, dtype=np.int32)
+        for index in preorder[::-1]:
+            if self.parents[index] >= 0:
+                sizes[self.parents[index]] += sizes[index]
+        self._subtreeSizes = sizes
+
+        # segment indices grouped by depth
+        self._levels = [np.flatnonzero(depths == d)
+                        for d in xrange(depths.max() + 1 if count else 0)]
+
+    #--------------------------------------------------------------------------
+
+    def _updateLines(self, raw, changes):
+        """Replace or add unindented attribute lines in a segment body.
+        """
+
+        lines = raw.split('\n')
+        for index, line in enumerate(lines):
+            if line[:1] in ('', ' ', '\t'):
+                continue
+            key = line.split(None, 1)[0]
+            if key in changes:
+                lines[index] = changes.pop(key)
+
+        # drop removed lines and add new ones after the existing attributes
+        lines = [l for l in lines if l != None]
+        while lines and lines[-1] == '':
+            lines.pop()
+        for key in ('parent', 'translate', 'rotate', 'scale'):
+            if changes.get(key) != None:
+                lines.append(changes[key])
+        return "\n".join(lines) + ("\n" if raw.endswith('\n') else "")
@@ -0,0 +1,465 @@
+#------------------------------------------------------------------------------
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#                     Version 2, December 2004
+#
+#  Copyright (C) 2013 Electronic Dreams <maverick.babylon.drifter@gmail.com>
+#
+#  Everyone is permitted to copy and distribute verbatim or modified
+#  copies of this license document, and changing it is allowed as long
+#  as the name is changed.
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#    TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+#
+#   0. You just DO WHAT THE FUCK YOU WANT TO.
+#
+#------------------------------------------------------------------------------
+
+
+#------------------------------------------------------------------------------
+# snapshot.py - Binary snapshots of parsed Massive files.
+#------------------------------------------------------------------------------
+
+import mmap
+import struct
+
+import numpy as np
+
+from common import AtomicFile
+
+#------------------------------------------------------------------------------
+# class Snapshot
+#------------------------------------------------------------------------------
+
+class Snapshot(object):
+    """Versioned binary snapshot of a parsed file's object graph.
+
+    Layout, all little endian:
+
+        header   magic, version, section offsets
+        strings  u64 length, u32 count, u32 lengths[count], bytes
+        objects  u64 length, tagged value stream
+        arrays   u64 length, raw array data, each array 8 byte aligned
+
+    Every string is stored once in the string table and referenced by index.
+    Only classes defined in this package can be restored so loading never
+    runs arbitrary code, unlike pickle.  Numeric arrays are stored raw and
+    can be mapped straight out of the file.
+    """
+
+    #--------------------------------------------------------------------------
+    # statics
+    #--------------------------------------------------------------------------
+
+    _sMagic   = 'MASSNAP\0'
+    _sVersion = 2
+
+    _sHeader = struct.Struct('<8sIIQQQ')
+
+    # modules whose classes may be stored in a snapshot
+    _sModules = [
+        'block', 'common', 'skeleton',
+        'mas', 'mas_blocks', 'cdl', 'cdl_blocks', 'rib', 'rib_blocks',
+    ]
+
+    _sInt64 = (-2 ** 63, 2 ** 63 - 1)
+
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    def save(obj, path):
+        """Write the object graph to a snapshot file.
+        """
+        Snapshot()._save(obj, path)
+
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    def load(path, mmap=False):
+        """Read an object graph from a snapshot file.
+
+        With mmap the file is mapped instead of read and arrays reference the
+        mapping directly, they are read only in that case.
+        """
+        return Snapshot()._load(path, mmap)
+
+    #--------------------------------------------------------------------------
+    # methods
+    #--------------------------------------------------------------------------
+
+    def __init__(self):
+        super(Snapshot, self).__init__()
+
+        self._strings = []
+        self._lookup  = {}
+        self._refs    = {}
+        self._arrays  = []
+        self._size    = 0
+
+    #--------------------------------------------------------------------------
+    # save helper methods
+    #--------------------------------------------------------------------------
+
+    def _save(self, obj, path):
+
+        # encode the object graph, collecting strings and arrays
+        chunks = []
+        self._encode(obj, chunks)
+        objects = "".join(chunks)
+
+        # string table
+        strings = [struct.pack('<I', len(self._strings)),
+                   struct.pack('<%dI' % len(self._strings),
+                               *map(len, self._strings))]
+        strings = "".join(strings + self._strings)
+
+        # lay out the sections
+        header_size     = Snapshot._sHeader.size
+        strings_offset  = header_size
+        objects_offset  = strings_offset + 8 + len(strings)
+        arrays_offset   = self._align(objects_offset + 8 + len(objects))
+
+        # written to a temporary file first, readers may be mapping the
+        #  file being replaced
+        with AtomicFile.open(path) as snapshot_file:
+            snapshot_file.write(Snapshot._sHeader.pack(Snapshot._sMagic,
+                Snapshot._sVersion, 0, strings_offset, objects_offset,
+                arrays_offset))
+            snapshot_file.write(struct.pack('<Q', len(strings)))
+            snapshot_file.write(strings)
+            snapshot_file.write(struct.pack('<Q', len(objects)))
+            snapshot_file.write(objects)
+
+            # pad so the array data, which follows the length, is aligned
+            padding = arrays_offset - (objects_offset + 8 + len(objects))
+            snapshot_file.write('\0' * padding)
+            snapshot_file.write(struct.pack('<Q', self._size))
+            position = 0
+            for offset, data in self._arrays:
+                snapshot_file.write('\0' * (offset - position))
+                snapshot_file.write(data)
+                position = offset + len(data)
+
+    #--------------------------------------------------------------------------
+
+    def _align(self, offset):
+        """Align so data following an 8 byte length is 8 byte aligned.
+        """
+        return offset + (-offset % 8)
+
+    #--------------------------------------------------------------------------
+
+    def _string(self, value):
+        """Index of the string in the string table.
+        """
+        index = self._lookup.get(value)
+        if index == None:
+            index = len(self._strings)
+            self._strings.append(value)
+            self._lookup[value] = index
+        return index
+
+    #--------------------------------------------------------------------------
+
+    def _className(self, cls):
+        module = cls.__module__.rpartition('.')[2]
+        if module not in Snapshot._sModules:
+            raise TypeError("Can't snapshot instances of %s.%s" % \
+                (cls.__module__, cls.__name__))
+        return "%s.%s" % (module, cls.__name__)
+
+    #--------------------------------------------------------------------------
+
+    def _state(self, obj):
+        """Attributes of an object, from its dictionary and slots.
+        """
+        state = dict(getattr(obj, '__dict__', {}))
+        for cls in type(obj).__mro__:
+            for slot in cls.__dict__.get('__slots__', ()):
+                if hasattr(obj, slot):
+                    state[slot] = getattr(obj, slot)
+        return state
+
+    #--------------------------------------------------------------------------
+
+    def _encode(self, value, chunks):
+        """Append the tagged encoding of the value to chunks.
+        """
+
+        pack = struct.pack
+        kind = type(value)
+
+        if value is None:
+            chunks.append('N')
+        elif kind is bool:
+            chunks.append('T' if value else 'F')
+        elif kind is int:
+            chunks.append(pack('<cq', 'i', value))
+        elif kind is long:
+            if Snapshot._sInt64[0] <= value <= Snapshot._sInt64[1]:
+                chunks.append(pack('<cq', 'l', value))
+            else:
+                chunks.append(pack('<cI', 'B', self._string(str(value))))
+        elif kind is float:
+            chunks.append(pack('<cd', 'f', value))
+        elif kind is str:
+            chunks.append(pack('<cI', 's', self._string(value)))
+        elif kind is unicode:
+            chunks.append(pack('<cI', 'u', self._string(value.encode('utf-8'))))
+        elif kind is list:
+            chunks.append(pack('<cI', 'L', len(value)))
+            for entry in value:
+                self._encode(entry, chunks)
+        elif kind is tuple:
+            chunks.append(pack('<cI', 't', len(value)))
+            for entry in value:
+                self._encode(entry, chunks)
+        elif kind is set or kind is frozenset:
+            chunks.append(pack('<cI', 'S' if kind is set else 'z', len(value)))
+            for entry in value:
+                self._encode(entry, chunks)
+        elif kind is dict:
+            chunks.append(pack('<cI', 'd', len(value)))
+            for key, entry in value.iteritems():
+                self._encode(key, chunks)
+                self._encode(entry, chunks)
+        elif isinstance(value, np.ndarray):
+            self._encodeArray(value, chunks)
+        elif isinstance(value, np.generic):
+            self._encode(value.item(), chunks)
+        else:
+            self._encodeObject(value, chunks)
+
+    #--------------------------------------------------------------------------
+
+    def _encodeArray(self, array, chunks):
+        if array.dtype.hasobject:
+            raise TypeError("Can't snapshot object arrays.")
+
+        data   = np.ascontiguousarray(array).tostring()
+        offset = self._size + (-self._size % 8)
+        self._arrays.append((offset, data))
+        self._size = offset + len(data)
+
+        chunks.append(struct.pack('<cIB', 'a', self._string(array.dtype.str),
+                                  array.ndim))
+        chunks.append(struct.pack('<%dQ' % array.ndim, *array.shape))
+        chunks.append(struct.pack('<Q', offset))
+
+    #--------------------------------------------------------------------------
+
+    def _encodeObject(self, obj, chunks):
+
+        # shared objects are stored once and referenced afterwards
+        if id(obj) in self._refs:
+            chunks.append(struct.pack('<cI', 'R', self._refs[id(obj)][0]))
+            return
+        self._refs[id(obj)] = (len(self._refs), obj)
+
+        # list subclasses carry their entries as well as their attributes
+        tag   = 'O' if isinstance(obj, list) else 'o'
+        state = self._state(obj)
+        chunks.append(struct.pack('<cII', tag,
+            self._string(self._className(type(obj))), len(state)))
+        for key, value in state.iteritems():
+            chunks.append(struct.pack('<I', self._string(key)))
+            self._encode(value, chunks)
+
+        if tag == 'O':
+            chunks.append(struct.pack('<I', len(obj)))
+            for entry in obj:
+                self._encode(entry, chunks)
+
+    #--------------------------------------------------------------------------
+    # load helper methods
+    #--------------------------------------------------------------------------
+
+    def _load(self, path, use_mmap):
+
+        with open(path, 'rb') as snapshot_file:
+            if use_mmap:
+                data = mmap.mmap(snapshot_file.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+            else:
+                data = snapshot_file.read()
+
+        # validate the header
+        if len(data) < Snapshot._sHeader.size:
+            raise ValueError("Not a snapshot file: %s" % path)
+        magic, version, _, strings_offset, objects_offset, arrays_offset = \
+            Snapshot._sHeader.unpack_from(data, 0)
+        if magic != Snapshot._sMagic:
+            raise ValueError("Not a snapshot file: %s" % path)
+        if version != Snapshot._sVersion:
+            raise ValueError("Unsupported snapshot version %d: %s" % \
+                (version, path))
+
+        # each section must lie within the file, so a truncated file fails
+        # here instead of part way through decoding
+        sections = [strings_offset, objects_offset, arrays_offset, len(data)]
+        for start, stop in zip(sections[:-1], sections[1:]):
+            if start + 8 > min(stop, len(data)) or \
+               start + 8 + struct.unpack_from('<Q', data, start)[0] > stop:
+                raise ValueError("Truncated snapshot file: %s" % path)
+
+        # string table
+        offset   = strings_offset + 8
+        count,   = struct.unpack_from('<I', data, offset)
+        if offset + 4 + 4 * count > objects_offset:
+            raise ValueError("Corrupt snapshot file: %s" % path)
+        lengths  = struct.unpack_from('<%dI' % count, data, offset + 4)
+        position = offset + 4 + 4 * count
+        strings  = []
+        for length in lengths:
+            strings.append(data[position:position + length])
+            position += length
+
+        self._data      = data
+        self._strings   = strings
+        self._objects   = []
+        self._arrayBase = arrays_offset + 8
+        self._copy      = not use_mmap
+        self._classes   = self._getClasses()
+
+        # section lengths check out but the contents may still be damaged
+        try:
+            value, _ = self._decode(objects_offset + 8)
+        except (struct.error, IndexError):
+            raise ValueError("Corrupt snapshot file: %s" % path)
+        return value
+
+    #--------------------------------------------------------------------------
+
+    def _getClasses(self):
+        """Classes that may be restored, keyed by module and class name.
+        """
+        package = __name__.rpartition('.')[0]
+        classes = {}
+        for module_name in Snapshot._sModules:
+            name   = "%s.%s" % (package, module_name) if package else module_name
+            module = __import__(name, fromlist=['*'])
+            for attribute, cls in vars(module).iteritems():
+                if isinstance(cls, type) and \
+                   cls.__module__.rpartition('.')[2] == module_name:
+                    classes["%s.%s" % (module_name, attribute)] = cls
+        return classes
+
+    #--------------------------------------------------------------------------
+
+    def _decode(self, offset):
+        """Decode the value at the offset, returns the value and the offset
+        of the next value.
+        """
+
+        data   = self._data
+        unpack = struct.unpack_from
+        tag    = data[offset]
+        offset += 1
+
+        if tag == 'N':
+            return None, offset
+        if tag == 'T':
+            return True, offset
+        if tag == 'F':
+            return False, offset
+        if tag == 'i':
+            return int(unpack('<q', data, offset)[0]), offset + 8
+        if tag == 'l':
+            return long(unpack('<q', data, offset)[0]), offset + 8
+        if tag == 'f':
+            return unpack('<d', data, offset)[0], offset + 8
+        if tag == 's':
+            return self._strings[unpack('<I', data, offset)[0]], offset + 4
+        if tag == 'u':
+            value = self._strings[unpack('<I', data, offset)[0]]
+            return value.decode('utf-8'), offset + 4
+        if tag == 'B':
+            return long(self._strings[unpack('<I', data, offset)[0]]), offset + 4
+        if tag in ('L', 't'):
+            count, = unpack('<I', data, offset)
+            offset += 4
+            values = []
+            for index in xrange(count):
+                value, offset = self._decode(offset)
+                values.append(value)
+            return (values if tag == 'L' else tuple(values)), offset
+        if tag in ('S', 'z'):
+            count, = unpack('<I', data, offset)
+            offset += 4
+            values = []
+            for index in xrange(count):
+                value, offset = self._decode(offset)
+                values.append(value)
+            return (set(values) if tag == 'S' else frozenset(values)), offset
+        if tag == 'd':
+            count, = unpack('<I', data, offset)
+            offset += 4
+            values = {}
+            for index in xrange(count):
+                key, offset   = self._decode(offset)
+                value, offset = self._decode(offset)
+                values[key] = value
+            return values, offset
+        if tag == 'a':
+            return self._decodeArray(offset)
+        if tag in ('o', 'O'):
+            return self._decodeObject(tag, offset)
+        if tag == 'R':
+            return self._objects[unpack('<I', data, offset)[0]], offset + 4
+
+        raise ValueError("Corrupt snapshot, unknown tag %r" % tag)
+
+    #--------------------------------------------------------------------------
+
+    def _decodeArray(self, offset):
+        dtype_index, ndim = struct.unpack_from('<IB', self._data, offset)
+        offset += 5
+        shape   = struct.unpack_from('<%dQ' % ndim, self._data, offset)
+        offset += 8 * ndim
+        start,  = struct.unpack_from('<Q', self._data, offset)
+        offset += 8
+
+        dtype = np.dtype(self._strings[dtype_index])
+        count = int(np.prod(shape)) if ndim else 1
+        array = np.frombuffer(self._data, dtype, count, self._arrayBase + start)
+        array = array.reshape(shape)
+        return (array.copy() if self._copy else array), offset
+
+    #--------------------------------------------------------------------------
+
+    def _decodeObject(self, tag, offset):
+        class_index, count = struct.unpack_from('<II', self._data, offset)
+        offset += 8
+
+        name = self._strings[class_index]
+        if name not in self._classes:
+            raise TypeError("Unknown class in snapshot: %s" % name)
+
+        # register before decoding attributes so cycles resolve
+        cls = self._classes[name]
+        obj = cls.__new__(cls)
+        self._objects.append(obj)
+
+        state = {}
+        for index in xrange(count):
+            key, = struct.unpack_from('<I', self._data, offset)
+            value, offset = self._decode(offset + 4)
+            state[self._strings[key]] = value
+
+        if hasattr(obj, '__dict__'):
+            obj.__dict__.update(state)
+        else:
+            for key, value in state.iteritems():
+                setattr(obj, key, value)
+
+        if tag == 'O':
+            count, = struct.unpack_from('<I', self._data, offset)
+            offset += 4
+            entries = []
+            for index in xrange(count):
+                value, offset = self._decode(offset)
+                entries.append(value)
+            list.extend(obj, entries)
+
+        return obj, offset
@@ -0,0 +1,729 @@
+#------------------------------------------------------------------------------
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#                     Version 2, December 2004
+#
+#  Copyright (C) 2013 Electronic Dreams <maverick.babylon.drifter@gmail.com>
+#
+#  Everyone is permitted to copy and distribute verbatim or modified
+#  copies of this license document, and changing it is allowed as long
+#  as the name is changed.
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#    TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+#
+#   0. You just DO WHAT THE FUCK YOU WANT TO.
+#
+#------------------------------------------------------------------------------
+
+
+#------------------------------------------------------------------------------
+# spatial.py - Spatial lookups over parsed Massive data.
+#------------------------------------------------------------------------------
+
+import itertools
+import math
+import multiprocessing
+import operator
+
+import numpy as np
+
+from common     import Compression
+from rib        import RibFile
+from rib_blocks import AntWriter
+
+#------------------------------------------------------------------------------
+# class SplineIndex
+#------------------------------------------------------------------------------
+
+class SplineIndex(object):
+    """Uniform grid over the points of flow or lane splines.
+
+    Points are bucketed by their x/z position (massive is y up), distances
+    are measured in 3d.  Splines can be added and removed at any time, only
+    the cells touched by the spline are updated.
+
+    The index holds a copy of the spline positions, it isn't told when the
+    points of a spline change so call update with the edited splines.
+    """
+
+    #--------------------------------------------------------------------------
+    # methods
+    #--------------------------------------------------------------------------
+
+    def __init__(self, splines=None, cell_size=None):
+        """Initialize self with an optional list of splines.
+
+        If the cell size isn't specified it is derived from the first batch
+        of splines added to the index.
+        """
+        super(SplineIndex, self).__init__()
+
+        if cell_size != None and not cell_size > 0:
+            raise ValueError("Cell size must be positive: %s" % cell_size)
+        self.cell_size = cell_size
+
+        self._cells     = {}
+        self._positions = {}
+        self._keys      = {}
+        self._bounds    = None
+
+        if splines:
+            self.add(*splines)
+
+    #--------------------------------------------------------------------------
+
+    def __len__(self):
+        return len(self._positions)
+
+    #--------------------------------------------------------------------------
+
+    def __contains__(self, spline):
+        return spline in self._positions
+
+    #--------------------------------------------------------------------------
+
+    def add(self, *splines):
+        """Add splines to the index.
+        """
+
+        # size cells so each holds a handful of points
+        if self.cell_size == None:
+            self.cell_size = self._estimateCellSize(splines)
+
+        for spline in splines:
+
+            # replace splines already indexed
+            if spline in self._positions:
+                self.remove(spline)
+
+            positions = self._getPositions(spline)
+            keys      = self._getCellKeys(positions)
+
+            self._positions[spline] = positions
+            self._keys[spline]      = keys
+
+            for index, key in enumerate(keys):
+                self._cells.setdefault(key, []).append((spline, index))
+
+            # grow the occupied cell bounds, used to limit searches
+            if keys:
+                self._growBounds(keys)
+
+    #--------------------------------------------------------------------------
+
+    def remove(self, *splines):
+        """Remove splines from the index.
+        """
+        for spline in splines:
+            del self._positions[spline]
+            for key in set(self._keys.pop(spline)):
+                entries = [e for e in self._cells[key] if e[0] is not spline]
+                if entries:
+                    self._cells[key] = entries
+                else:
+                    del self._cells[key]
+
+        # bounds are only ever grown, reset them once everything is removed
+        if not self._cells:
+            self._bounds = None
+
+    #--------------------------------------------------------------------------
+
+    def update(self, *splines):
+        """Re-index splines whose points have changed.
+        """
+        self.add(*splines)
+
+    #--------------------------------------------------------------------------
+
+    def nearestPoint(self, position):
+        """Find the spline point closest to the position.
+
+        Returns a (spline, point index, distance) tuple, None if the index is
+        empty.
+        """
+
+        if not self._cells:
+            return None
+
+        position = np.asarray(position, dtype=np.float64)[:3]
+        cx, cz   = self._getCellKey(position)
+        limit    = self._getRingLimit(cx, cz)
+
+        # search outwards ring by ring, a point in ring r is at least (r - 1)
+        #  cells away so stop once the best match is closer than that
+        best = None
+        ring = 0
+        while ring <= limit:
+            if best and (best[2] <= (ring - 1) * self.cell_size):
+                break
+            match = self._closest(position, self._getRing(cx, cz, ring))
+            if match and ((best == None) or (match[2] < best[2])):
+                best = match
+            ring += 1
+
+        return best
+
+    #--------------------------------------------------------------------------
+
+    def nearestSpline(self, position):
+        """Find the spline closest to the position, measured to the spline
+        points.
+
+        Returns a (spline, distance) tuple, None if the index is empty.
+        """
+        match = self.nearestPoint(position)
+        return (match[0], match[2]) if match else None
+
+    #--------------------------------------------------------------------------
+
+    def radius(self, position, radius):
+        """Find all of the spline points within the radius of the position.
+
+        Returns a list of (spline, point index, distance) tuples sorted by
+        distance.
+        """
+
+        if not self._cells:
+            return []
+
+        position = np.asarray(position, dtype=np.float64)[:3]
+        cx, cz   = self._getCellKey(position)
+        reach    = int(math.ceil(radius / self.cell_size))
+
+        # only the cells overlapped by the radius within the occupied bounds
+        #  can hold points
+        minx, minz, maxx, maxz = self._bounds
+        xs = xrange(max(cx - reach, minx), min(cx + reach, maxx) + 1)
+        zs = xrange(max(cz - reach, minz), min(cz + reach, maxz) + 1)
+
+        # look the cells up, or go over the occupied cells if there are fewer
+        #  of them, both in the same order
+        entries = []
+        if len(xs) * len(zs) <= len(self._cells):
+            for x in xs:
+                for z in zs:
+                    entries.extend(self._cells.get((x, z), []))
+        elif xs and zs:
+            for key in sorted(self._cells):
+                if (xs[0] <= key[0] <= xs[-1]) and (zs[0] <= key[1] <= zs[-1]):
+                    entries.extend(self._cells[key])
+
+        if not entries:
+            return []
+
+        distances = self._getDistances(position, entries)
+        inside    = np.flatnonzero(distances <= radius)
+        inside    = inside[np.argsort(distances[inside], kind='mergesort')]
+        return [entries[i] + (float(distances[i]),) for i in inside]
+
+    #--------------------------------------------------------------------------
+
+    def splinesInRadius(self, position, radius):
+        """Find all of the splines with a point within the radius of the
+        position, closest first.
+        """
+        splines = []
+        for spline, _, _ in self.radius(position, radius):
+            if spline not in splines:
+                splines.append(spline)
+        return splines
+
+    #--------------------------------------------------------------------------
+    # helper methods
+    #--------------------------------------------------------------------------
+
+    def _getPositions(self, spline):
+        """Spline points start with their x, y, z position.
+        """
+        points = np.asarray(spline.points, dtype=np.float64)
+        return points.reshape(-1, points.shape[-1] if points.size else 3)[:, :3]
+
+    #--------------------------------------------------------------------------
+
+    def _estimateCellSize(self, splines):
+        """Use the average spacing of the points across their bounds.
+        """
+
+        positions = [self._getPositions(s) for s in splines]
+        positions = [p for p in positions if len(p)]
+        if not positions:
+            return 1.0
+
+        positions = np.concatenate(positions)
+        extent    = positions.max(axis=0) - positions.min(axis=0)
+        area      = max(extent[0], 1e-6) * max(extent[2], 1e-6)
+        size      = math.sqrt(area / len(positions))
+        return size if size > 1e-6 else 1.0
+
+    #--------------------------------------------------------------------------
+
+    def _getCellKey(self, position):
+        if self.cell_size == None:
+            raise ValueError("Cell size isn't known until splines are added")
+        return (int(math.floor(position[0] / self.cell_size)),
+                int(math.floor(position[2] / self.cell_size)))
+
+    #--------------------------------------------------------------------------
+
+    def _getCellKeys(self, positions):
+        cells = np.floor(positions[:, (0, 2)] / self.cell_size).astype(np.int64)
+        return [tuple(cell) for cell in cells.tolist()]
+
+    #--------------------------------------------------------------------------
+
+    def _growBounds(self, keys):
+        xs, zs = zip(*keys)
+        bounds = [min(xs), min(zs), max(xs), max(zs)]
+        if self._bounds:
+            bounds[:2] = map(min, bounds[:2], self._bounds[:2])
+            bounds[2:] = map(max, bounds[2:], self._bounds[2:])
+        self._bounds = bounds
+
+    #--------------------------------------------------------------------------
+
+    def _getRingLimit(self, cx, cz):
+        """Furthest ring that could still contain occupied cells.
+        """
+        minx, minz, maxx, maxz = self._bounds
+        return max(abs(cx - minx), abs(cx - maxx), abs(cz - minz), abs(cz - maxz))
+
+    #--------------------------------------------------------------------------
+
+    def _getRing(self, cx, cz, ring):
+        """All the entries in the square ring of cells around the cell.
+        """
+
+        if ring == 0:
+            return list(self._cells.get((cx, cz), []))
+
+        entries = []
+        for x in xrange(cx - ring, cx + ring + 1):
+            entries.extend(self._cells.get((x, cz - ring), []))
+            entries.extend(self._cells.get((x, cz + ring), []))
+        for z in xrange(cz - ring + 1, cz + ring):
+            entries.extend(self._cells.get((cx - ring, z), []))
+            entries.extend(self._cells.get((cx + ring, z), []))
+        return entries
+
+    #--------------------------------------------------------------------------
+
+    def _getDistances(self, position, entries):
+        points = np.array([self._positions[s][i] for s, i in entries])
+        return np.sqrt(((points - position) ** 2).sum(axis=1))
+
+    #--------------------------------------------------------------------------
+
+    def _closest(self, position, entries):
+        if not entries:
+            return None
+        distances = self._getDistances(position, entries)
+        index     = int(distances.argmin())
+        return entries[index] + (float(distances[index]),)
+
+#------------------------------------------------------------------------------
+# class Frustum
+#------------------------------------------------------------------------------
+
+class Frustum(object):
+    """View frustum of a scene camera, used to cull ants outside the shot.
+
+    The camera looks down its local -z axis with y up.  The fov is taken as
+    the horizontal angle of view in degrees and the filmback sets the
+    aspect, zrange gives the near and far clipping distances.  Rotations
+    are in degrees and applied in the camera order, xyz if not set.
+    """
+
+    #--------------------------------------------------------------------------
+    # statics
+    #--------------------------------------------------------------------------
+
+    _sPosition = operator.attrgetter('tx', 'ty', 'tz')
+
+    #--------------------------------------------------------------------------
+    # methods
+    #--------------------------------------------------------------------------
+
+    def __init__(self, camera):
+        """Initialize self from a CameraNode.
+        """
+        super(Frustum, self).__init__()
+
+        translate = np.array(camera.translate or (0.0, 0.0, 0.0), dtype=np.float64)
+        pivot     = np.array(camera.pivot or (0.0, 0.0, 0.0), dtype=np.float64)
+        rotation  = self._getRotation(camera.rotate or (0.0, 0.0, 0.0),
+                                      camera.order)
+
+        # row vectors, world = (local - pivot) * rotation + pivot + translate
+        self.rotation = rotation
+        self.position = translate + pivot - pivot.dot(rotation)
+
+        self.near, self.far = camera.zrange or (0.1, 10000.0)
+
+        # half angles of the view, the film aspect gives the vertical one
+        filmback     = camera.filmback or (1.0, 1.0)
+        tangent      = math.tan(math.radians(camera.fov) / 2.0)
+        self._width  = math.atan(tangent)
+        self._height = math.atan(tangent * filmback[1] / filmback[0])
+
+    #--------------------------------------------------------------------------
+
+    def test(self, positions, radius=0.0):
+        """Test (n, 3) world positions against the frustum, treating them as
+        spheres of the radius, a scalar or one per position.
+
+        Returns a (visible mask, distances to the camera) tuple.
+        """
+
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        radius    = np.asarray(radius, dtype=np.float64)
+
+        # into camera space, depth is along -z
+        offsets = positions - self.position
+        local   = offsets.dot(self.rotation.T)
+        depth   = -local[:, 2]
+
+        # distance of the sphere centers outside each pair of side planes
+        width  = np.abs(local[:, 0]) * math.cos(self._width) - \
+                 depth * math.sin(self._width)
+        height = np.abs(local[:, 1]) * math.cos(self._height) - \
+                 depth * math.sin(self._height)
+
+        visible  = (depth >= self.near - radius) & (depth <= self.far + radius)
+        visible &= (width <= radius) & (height <= radius)
+
+        distances = np.sqrt((offsets ** 2).sum(axis=1))
+        return visible, distances
+
+    #--------------------------------------------------------------------------
+
+    def cull(self, rib_file, radius=0.0):
+        """Ants of the rib file inside the frustum.
+
+        Returns a (visible ids, distances) tuple of arrays in file order.
+        """
+        ids, visible, distances = self._testAnts(rib_file.ants, radius)
+        return ids[visible], distances[visible]
+
+    #--------------------------------------------------------------------------
+
+    def write(self, rib_file, path, radius=0.0, level=None, float_format=None):
+        """Write the ants of the rib file inside the frustum to path, .gz
+        paths are compressed using the level or the Compression default.
+        Floats are written using the float format, see FloatFormat.
+        """
+        _, visible, _ = self._testAnts(rib_file.ants, radius)
+        ants = [rib_file.ants[i] for i in np.flatnonzero(visible)]
+        with Compression.open(path, 'w', level, 1 << 20) as rib_file:
+            AntWriter(float_format).write(rib_file, ants)
+
+    #--------------------------------------------------------------------------
+
+    def setLodVariable(self, rib_file, distances, name='lod', radius=0.0):
+        """Store a level of detail in the named variable of every ant, the
+        number of the ascending distances the ant is further than.  Ants
+        outside the frustum get the coarsest level, len(distances).
+        """
+
+        _, visible, ant_distances = self._testAnts(rib_file.ants, radius)
+        levels = np.searchsorted(np.asarray(distances, dtype=np.float64),
+                                 ant_distances, side='right')
+        levels[~visible] = len(distances)
+
+        for ant, level in zip(rib_file.ants, levels.tolist()):
+            ant.variables[name] = float(level)
+
+    #--------------------------------------------------------------------------
+    # helper methods
+    #--------------------------------------------------------------------------
+
+    def _testAnts(self, ants, radius):
+        ids       = np.fromiter((ant.id for ant in ants), np.int64, len(ants))
+        positions = np.array(map(Frustum._sPosition, ants), dtype=np.float64)
+        visible, distances = self.test(positions, radius)
+        return ids, visible, distances
+
+    #--------------------------------------------------------------------------
+
+    def _getRotation(self, rotate, order):
+        """Row vector rotation matrix, rotating about each axis in order.
+        """
+
+        order = order if order and sorted(order) == ['x', 'y', 'z'] else 'xyz'
+        rotation = np.identity(3)
+        for axis in order:
+            angle    = math.radians(rotate['xyz'.index(axis)])
+            cos, sin = math.cos(angle), math.sin(angle)
+            if axis == 'x':
+                matrix = [[1, 0, 0], [0, cos, sin], [0, -sin, cos]]
+            elif axis == 'y':
+                matrix = [[cos, 0, -sin], [0, 1, 0], [sin, 0, cos]]
+            else:
+                matrix = [[cos, sin, 0], [-sin, cos, 0], [0, 0, 1]]
+            rotation = rotation.dot(np.array(matrix, dtype=np.float64))
+        return rotation
+
+#------------------------------------------------------------------------------
+# class AntIndex
+#------------------------------------------------------------------------------
+
+class AntIndex(object):
+    """Uniform grid over the positions of the ants of a frame.
+
+    Ants are bucketed by their x/z position, or x/y/z with use_3d, and
+    distances are measured in the same dimensions.  The grid is held as
+    ants sorted by cell so every query is a handful of array operations,
+    it isn't updated once built.
+    """
+
+    #--------------------------------------------------------------------------
+    # statics
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    def fromRibFile(rib_file, cell_size, use_3d=False):
+        """Index the ants of a rib file.
+        """
+        ants      = rib_file.ants
+        ids       = np.fromiter((ant.id for ant in ants), np.int64, len(ants))
+        positions = np.array(map(Frustum._sPosition, ants), dtype=np.float64)
+        return AntIndex(ids, positions, cell_size, use_3d)
+
+    #--------------------------------------------------------------------------
+
+    @staticmethod
+    def scanSequence(sequence, radius, cell_size=None, use_3d=False,
+                     processes=None):
+        """Proximity report for every frame of a RibSequence, frames are
+        read and indexed in parallel by a pool of processes, processes=1
+        runs them in process.
+
+        Returns a list of per frame dictionaries of the frame, the ant
+        count, the number of close pairs within the radius, the highest
+        neighbour count and the id of that ant, and the highest number of
+        ants per unit area (or volume) of a cell.  The cell size defaults to
+        the radius.
+        """
+
+        if radius <= 0:
+            raise ValueError("Radius must be positive: %s" % radius)
+        if cell_size != None and cell_size <= 0:
+            raise ValueError("Cell size must be positive: %s" % cell_size)
+
+        jobs = [(path, radius, cell_size, use_3d) for path in sequence.paths]
+
+        pool = None
+        if processes != 1 and len(jobs) > 1:
+            pool    = multiprocessing.Pool(processes)
+            reports = pool.imap(_scanFrame, jobs)
+        else:
+            reports = itertools.imap(_scanFrame, jobs)
+
+        try:
+            results = []
+            for frame, report in zip(sequence.frames, reports):
+                report['frame'] = frame
+                results.append(report)
+            return results
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+    #--------------------------------------------------------------------------
+    # methods
+    #--------------------------------------------------------------------------
+
+    def __init__(self, ids, positions, cell_size, use_3d=False):
+        """Initialize self with the ant ids and their (n, 3) positions.
+        """
+        super(AntIndex, self).__init__()
+
+        if cell_size <= 0:
+            raise ValueError("Cell size must be positive: %s" % cell_size)
+
+        self.cell_size = float(cell_size)
+        self.use_3d    = use_3d
+
+        axes      = [0, 1, 2] if use_3d else [0, 2]
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        self.ids  = np.asarray(ids, dtype=np.int64)
+
+        # sort ants by cell, the cells of each ant are contiguous
+        self._positions = positions[:, axes]
+        cells           = np.floor(self._positions / self.cell_size).astype(np.int64)
+        self._origin    = cells.min(axis=0) if len(cells) else np.zeros(len(axes), np.int64)
+        self._cells     = cells - self._origin
+        self._shape     = self._cells.max(axis=0) + 1 if len(cells) else \
+                          np.ones(len(axes), np.int64)
+
+        keys         = self._getKeys(self._cells, self._shape)
+        self._order  = np.argsort(keys, kind='mergesort')
+        self._keys   = keys[self._order]
+        self._sorted = self._positions[self._order]
+
+    #--------------------------------------------------------------------------
+
+    def __len__(self):
+        return len(self.ids)
+
+    #--------------------------------------------------------------------------
+
+    def pairs(self, radius):
+        """Every pair of ants within the radius of each other.
+
+        Returns a ((m, 2) id pairs, distances) tuple, each pair once.
+        """
+        first, second, distances = self._getPairs(radius)
+        pairs = np.column_stack((self.ids[first], self.ids[second]))
+        return pairs, distances
+
+    #--------------------------------------------------------------------------
+
+    def radius(self, position, radius):
+        """Ants within the radius of the position.
+
+        Returns an (ids, distances) tuple sorted by distance.
+        """
+
+        position = np.asarray(position, dtype=np.float64)[:3]
+        position = position if self.use_3d else position[[0, 2]]
+        reach    = int(math.ceil(radius / self.cell_size))
+
+        # all the cells overlapped by the radius, clamped to the grid per
+        #  axis before building them so a large radius stays cheap
+        center = np.floor(position / self.cell_size).astype(np.int64) - self._origin
+        lows   = np.maximum(center - reach, 0)
+        highs  = np.minimum(center + reach, self._shape - 1)
+        if (lows > highs).any():
+            return self.ids[:0], np.zeros(0)
+        axes   = np.meshgrid(*[np.arange(low, high + 1, dtype=np.int64)
+                               for low, high in zip(lows, highs)], indexing='ij')
+        cells  = np.column_stack([axis.ravel() for axis in axes])
+        keys   = self._getKeys(cells, self._shape)
+
+        starts  = np.searchsorted(self._keys, keys, 'left')
+        stops   = np.searchsorted(self._keys, keys, 'right')
+        indices = self._getRanges(starts, stops - starts)
+
+        distances = np.sqrt(((self._sorted[indices] - position) ** 2).sum(axis=1))
+        found     = np.flatnonzero(distances <= radius)
+        found     = found[np.argsort(distances[found], kind='mergesort')]
+        return self.ids[self._order[indices[found]]], distances[found]
+
+    #--------------------------------------------------------------------------
+
+    def neighbourCounts(self, radius):
+        """Number of other ants within the radius of each ant, in the order
+        the ants were given.
+        """
+        first, second, _ = self._getPairs(radius)
+        return np.bincount(np.concatenate((first, second)), minlength=len(self.ids))
+
+    #--------------------------------------------------------------------------
+
+    def cellDensity(self):
+        """Highest number of ants per unit area (or volume) over the cells.
+        """
+        if not len(self._keys):
+            return 0.0
+        _, counts = np.unique(self._keys, return_counts=True)
+        return counts.max() / self.cell_size ** self._cells.shape[1]
+
+    #--------------------------------------------------------------------------
+    # helper methods
+    #--------------------------------------------------------------------------
+
+    def _getKeys(self, cells, shape):
+        """Single integer key per cell, row major over the grid shape.
+        """
+        keys = np.zeros(len(cells), dtype=np.int64)
+        for axis in xrange(cells.shape[1]):
+            keys = keys * shape[axis] + cells[:, axis]
+        return keys
+
+    #--------------------------------------------------------------------------
+
+    def _getRanges(self, starts, counts):
+        """Concatenated aranges of the counts from each start.
+        """
+        counts = np.maximum(counts, 0)
+        total  = counts.sum()
+        bases  = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        return bases + np.arange(total, dtype=np.int64)
+
+    #--------------------------------------------------------------------------
+
+    def _getPairs(self, radius):
+        """Input indices of the pairs within the radius and their distances.
+        """
+
+        if not len(self._keys):
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0)
+
+        reach = int(math.ceil(radius / self.cell_size))
+        cells = self._cells[self._order]
+        first, second, found = [], [], []
+
+        # half of the neighbouring cells so each pair of cells is only seen
+        #  once, ants sharing a cell are paired with the ones sorted after,
+        #  offsets reaching past the grid can't find any
+        zero    = (0,) * cells.shape[1]
+        reaches = [min(reach, int(size) - 1) for size in self._shape]
+        for offset in itertools.product(*[xrange(-r, r + 1) for r in reaches]):
+            if offset < zero:
+                continue
+
+            targets = cells + offset
+            inside  = np.flatnonzero(((targets >= 0) & (targets < self._shape)).all(axis=1))
+            keys    = self._getKeys(targets[inside], self._shape)
+            stops   = np.searchsorted(self._keys, keys, 'right')
+            if offset == zero:
+                starts = inside + 1
+            else:
+                starts = np.searchsorted(self._keys, keys, 'left')
+
+            counts  = np.maximum(stops - starts, 0)
+            sources = np.repeat(inside, counts)
+            targets = self._getRanges(starts, counts)
+            offsets = self._sorted[sources] - self._sorted[targets]
+            lengths = np.sqrt((offsets ** 2).sum(axis=1))
+            close   = lengths <= radius
+
+            first.append(sources[close])
+            second.append(targets[close])
+            found.append(lengths[close])
+
+        first  = self._order[np.concatenate(first)]
+        second = self._order[np.concatenate(second)]
+        return first, second, np.concatenate(found)
+
+#------------------------------------------------------------------------------
+# helper functions
+#------------------------------------------------------------------------------
+
+def _scanFrame(job):
+    """Proximity report of a single rib file.  Module level so it can be
+    sent to pool workers.
+    """
+
+    path, radius, cell_size, use_3d = job
+
+    ids, positions = [], []
+    for id, transform in RibFile.iterAnts(path, ('id', 'transform')):
+        ids.append(id)
+        positions.append(transform[:3])
+
+    index  = AntIndex(ids, np.array(positions, dtype=np.float64).reshape(-1, 3),
+                      radius if cell_size == None else cell_size, use_3d)
+    counts = index.neighbourCounts(radius)
+    most   = int(counts.argmax()) if len(counts) else None
+    return {
+        'ants'       : len(index),
+        'pairs'      : int(counts.sum() // 2),
+        'neighbours' : int(counts[most]) if most != None else 0,
+        'busiest'    : int(index.ids[most]) if most != None else None,
+        'density'    : float(index.cellDensity()),
+    }
@@ -0,0 +1,97 @@
+#------------------------------------------------------------------------------
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#                     Version 2, December 2004
+#
+#  Copyright (C) 2013 Electronic Dreams <maverick.babylon.drifter@gmail.com>
+#
+#  Everyone is permitted to copy and distribute verbatim or modified
+#  copies of this license document, and changing it is allowed as long
+#  as the name is changed.
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#    TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+#
+#   0. You just DO WHAT THE FUCK YOU WANT TO.
+#
+#------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------
+# test_apf.py - Agent playback files and their channel cache.
+#------------------------------------------------------------------------------
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from apf import ApfFile
+
+#------------------------------------------------------------------------------
+# class TestApfFile
+#------------------------------------------------------------------------------
+
+class TestApfFile(unittest.TestCase):
+
+    _sApf = \
+        ': channels\n' \
+        '1\n' \
+        'root 0 1 2\n' \
+        'head 3 4\n' \
+        '2\n' \
+        'root 5 6 7\n' \
+        'head 8 9\n'
+
+    #--------------------------------------------------------------------------
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._path      = os.path.join(self._directory, 'a.apf')
+        with open(self._path, 'w') as apf_file:
+            apf_file.write(TestApfFile._sApf)
+
+    #--------------------------------------------------------------------------
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    #--------------------------------------------------------------------------
+
+    def testRead(self):
+        apf_file = ApfFile(self._path, False)
+        self.assertEqual(apf_file.frames.tolist(), [1, 2])
+        self.assertEqual(apf_file['head'].tolist(), [[3, 4], [8, 9]])
+        self.assertEqual(apf_file.frame(2).tolist(), range(5, 10))
+
+    #--------------------------------------------------------------------------
+
+    def testBadValues(self):
+        with open(self._path, 'w') as apf_file:
+            apf_file.write(TestApfFile._sApf.replace('8 9', '8 x'))
+        self.assertRaises(ValueError, ApfFile, self._path, False)
+
+    #--------------------------------------------------------------------------
+
+    def testTruncatedCache(self):
+        ApfFile(self._path)
+        cache = self._path + ApfFile._sCacheExtension
+        with open(cache, 'rb') as cache_file:
+            data = cache_file.read()
+
+        for size in (0, 16, len(data) / 2, len(data) - 1):
+            with open(cache, 'wb') as cache_file:
+                cache_file.write(data[:size])
+            apf_file = ApfFile(self._path)
+            self.assertEqual(apf_file['root'].tolist(),
+                             [[0, 1, 2], [5, 6, 7]])
+
+        # the reparsed file replaced the damaged cache
+        with open(cache, 'rb') as cache_file:
+            self.assertEqual(len(cache_file.read()), len(data))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+#------------------------------------------------------------------------------
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#                     Version 2, December 2004
+#
+#  Copyright (C) 2013 Electronic Dreams <maverick.babylon.drifter@gmail.com>
+#
+#  Everyone is permitted to copy and distribute verbatim or modified
+#  copies of this license document, and changing it is allowed as long
+#  as the name is changed.
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#    TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+#
+#   0. You just DO WHAT THE FUCK YOU WANT TO.
+#
+#------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------
+# test_block.py - Shared block parsing helpers.
+#------------------------------------------------------------------------------
+
+import itertools
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scanf import sscanf
+from scanf import IncompleteCaptureError
+
+from block import FormatMatcher
+
+#------------------------------------------------------------------------------
+# class TestFormatMatcher
+#------------------------------------------------------------------------------
+
+class TestFormatMatcher(unittest.TestCase):
+
+    _sFormats = [
+        "%d", "%i", "%f", "%s", "%f %f", "%f%d", "%i%i", "%d-%d", "%f+%f",
+        "%fe", "%i.%f", "%%%d", "size %f %f",
+    ]
+
+    #--------------------------------------------------------------------------
+
+    def _scan(self, line, scanf_format):
+        try:
+            return sscanf(line, scanf_format)
+        except IncompleteCaptureError:
+            return None
+
+    #--------------------------------------------------------------------------
+
+    def testSameAsScanf(self):
+        tokens = ['0', '1', '8', 'b', 'x', 'e', '.', '+', '-', ' ']
+        lines  = [""]
+        for count in xrange(1, 4):
+            lines.extend("".join(entry)
+                         for entry in itertools.product(tokens, repeat=count))
+        lines.extend(["size 1.5 -2e3", "size 0x1f 2", "0X1F", "-0b101",
+                      "007", "08", "1.5.", "1.55", "1e5.5", "1ee5", "1.e5",
+                      "\t-.5e-3 7", "1.5+2", "0xx1", "00x1", "0b102"])
+
+        for scanf_format in TestFormatMatcher._sFormats:
+            matcher = FormatMatcher([scanf_format])
+            for line in lines:
+                matched = matcher.select(line) != None
+                self.assertEqual(matched, self._scan(line, scanf_format) != None,
+                                 "%r %r" % (scanf_format, line))
+
+    #--------------------------------------------------------------------------
+
+    def testFirstMatch(self):
+        matcher = FormatMatcher(["mode %d %d", "mode %d", "mode %s"])
+        self.assertEqual(matcher.scan("mode 1 2"), (1, 2))
+        self.assertEqual(matcher.scan("mode 1 x"), (1,))
+        self.assertEqual(matcher.scan("mode x"), ("x",))
+        self.assertRaises(IncompleteCaptureError, matcher.scan, "size 1")
+
+    #--------------------------------------------------------------------------
+
+    def testUntranslated(self):
+        matcher = FormatMatcher(["%2d%d", "%d"])
+        self.assertEqual(matcher.regex, None)
+        self.assertEqual(matcher.select("123"), None)
+        self.assertEqual(matcher.scan("123"), (12, 3))
+        self.assertRaises(IncompleteCaptureError, matcher.scan, "x")
+
+
+if __name__ == '__main__':
+    unittest.main()
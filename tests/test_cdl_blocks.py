@@ -0,0 +1,151 @@
+#------------------------------------------------------------------------------
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#                     Version 2, December 2004
+#
+#  Copyright (C) 2013 Electronic Dreams <maverick.babylon.drifter@gmail.com>
+#
+#  Everyone is permitted to copy and distribute verbatim or modified
+#  copies of this license document, and changing it is allowed as long
+#  as the name is changed.
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#    TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+#
+#   0. You just DO WHAT THE FUCK YOU WANT TO.
+#
+#------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------
+# test_cdl_blocks.py - Blocks of .cdl files.
+#------------------------------------------------------------------------------
+
+import os
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cdl_blocks import ObjectBlock
+
+#------------------------------------------------------------------------------
+# helper functions
+#------------------------------------------------------------------------------
+
+def _processBlock(block, mode):
+    """Original line by line indent fixing of ObjectBlock, kept to check the
+    single pass version against.
+    """
+
+    addIndent    = lambda b: re.compile(r"^((?!$))", re.M).sub("    ", b)
+    removeIndent = lambda b: re.compile(r"^    ", re.M).sub("", b)
+    if mode == "post":
+        addIndent, removeIndent = removeIndent, addIndent
+
+    lines         = block.split('\n')
+    in_main_block = True
+    in_dynamics   = False
+    in_motiontree = True
+    skip_count    = 0
+    for index in range(len(lines)):
+        line = lines[index]
+
+        if line.startswith("    dynamics"):
+            in_dynamics = True
+        elif line.startswith("    end dynamics"):
+            in_dynamics = False
+        elif line.startswith("motion tree"):
+            in_motiontree = True
+        elif in_main_block and (line == ''):
+            in_main_block = False
+
+        if skip_count > 0:
+            skip_count -= 1
+        elif line.startswith("object"):
+            pass
+        elif in_main_block:
+            stripped = line.lstrip(' ')
+            if in_dynamics:
+                if stripped.startswith("rbd_solver"):
+                    lines[index] = addIndent(line)
+            elif stripped.startswith("variable"):
+                lines[index] = removeIndent(line)
+            elif stripped.startswith("end dynamics"):
+                pass
+            elif stripped.startswith("translate"):
+                pass
+            elif stripped.startswith("transform"):
+                skip_count = 4
+            else:
+                lines[index] = addIndent(line)
+        elif in_motiontree and (line == ''):
+            if mode == "pre":
+                lines[index] = "        "
+            in_motiontree = False
+        elif line.startswith("end object"):
+            pass
+        elif (mode == "post") and line.lstrip(' ').startswith('\t'):
+            lines[index] = line.lstrip(' ')
+        else:
+            lines[index] = addIndent(line)
+
+    return "\n".join(lines)
+
+#------------------------------------------------------------------------------
+# class TestObjectBlock
+#------------------------------------------------------------------------------
+
+class TestObjectBlock(unittest.TestCase):
+
+    _sData = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+    #--------------------------------------------------------------------------
+
+    def _readObject(self, name):
+        with open(os.path.join(TestObjectBlock._sData, name)) as cdl_file:
+            text = cdl_file.read()
+        return text[text.index('object'):]
+
+    #--------------------------------------------------------------------------
+
+    def setUp(self):
+        self._object = self._readObject('agent.cdl')
+
+    #--------------------------------------------------------------------------
+
+    def testProcessBlock(self):
+        block  = ObjectBlock(self._object)
+        edge   = "object x\n        variable a\n    \tcolour 1\n\n\n    node\n\nend object"
+        for text in (self._object, edge, ""):
+            for mode in ("pre", "post"):
+                self.assertEqual(block._processBlock(text, mode),
+                                 _processBlock(text, mode))
+
+        pre = _processBlock(self._object, "pre")
+        self.assertEqual(block._processBlock(pre, "post"), _processBlock(pre, "post"))
+
+    #--------------------------------------------------------------------------
+
+    def testRoundTrip(self):
+        block = ObjectBlock(self._object)
+        self.assertEqual(str(block), self._readObject('agent_out.cdl'))
+        self.assertEqual(block.segments.find('spine').name, 'spine')
+        self.assertEqual(block.variables.names(), ['foo', 'bar'])
+
+    #--------------------------------------------------------------------------
+
+    def testVariableTable(self):
+        block = ObjectBlock(self._object)
+        table = block.variableTable()
+        self.assertEqual(str(table), "\n".join(map(str, block.variables)))
+
+        table.defaults[:] = [0.75, 1.5]
+        table.update(block.variables)
+        self.assertEqual([v.default for v in block.variables], [0.75, 1.5])
+        self.assertIn("variable bar 1.500000 [0.000000 2.000000] rand",
+                      str(block))
+
+
+if __name__ == '__main__':
+    unittest.main()
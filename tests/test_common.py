@@ -0,0 +1,282 @@
+#------------------------------------------------------------------------------
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#                     Version 2, December 2004
+#
+#  Copyright (C) 2013 Electronic Dreams <maverick.babylon.drifter@gmail.com>
+#
+#  Everyone is permitted to copy and distribute verbatim or modified
+#  copies of this license document, and changing it is allowed as long
+#  as the name is changed.
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#    TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+#
+#   0. You just DO WHAT THE FUCK YOU WANT TO.
+#
+#------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------
+# test_common.py - Shared containers used by the parsers.
+#------------------------------------------------------------------------------
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common   import AtomicFile
+from common   import NamedList
+from common   import RangeSet
+from common   import Variable
+from common   import VariableTable
+from snapshot import Snapshot
+
+#------------------------------------------------------------------------------
+# class TestRangeSet
+#------------------------------------------------------------------------------
+
+class TestRangeSet(unittest.TestCase):
+
+    def testFromString(self):
+        ids = RangeSet.fromString("9-12 1-5\n    7 4")
+        self.assertEqual(list(ids.ranges()), [(1, 5), (7, 7), (9, 12)])
+        self.assertEqual(str(ids), "1-5 7 9-12")
+        self.assertEqual(RangeSet.fromString(str(ids)), ids)
+        self.assertEqual(len(ids), 10)
+
+    #--------------------------------------------------------------------------
+
+    def testSnapshot(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'ids.snap')
+            ids  = RangeSet.fromString("1-5 7 9-200000")
+            Snapshot.save(ids, path)
+            self.assertEqual(Snapshot.load(path), ids)
+        finally:
+            shutil.rmtree(directory)
+
+    #--------------------------------------------------------------------------
+
+    def testNumpyIds(self):
+        ids = RangeSet(np.array([3, 1, 2, 7], dtype=np.int64))
+        self.assertEqual(str(ids), "1-3 7")
+        self.assertFalse(RangeSet(np.array([], dtype=np.int64)))
+
+    #--------------------------------------------------------------------------
+
+    def testAddDiscard(self):
+        ids = RangeSet([1, 2, 4])
+        ids.add(3)
+        self.assertEqual(list(ids.ranges()), [(1, 4)])
+        ids.add(6)
+        ids.discard(2)
+        ids.discard(5)
+        self.assertEqual(str(ids), "1 3-4 6")
+        ids.discard(1)
+        ids.discard(6)
+        self.assertEqual(str(ids), "3-4")
+
+    #--------------------------------------------------------------------------
+
+    def testAgainstSet(self):
+        rand     = random.Random(7)
+        ids      = RangeSet()
+        expected = set()
+        for _ in xrange(2000):
+            id = rand.randint(0, 60)
+            if rand.random() < 0.6:
+                ids.add(id)
+                expected.add(id)
+            else:
+                ids.discard(id)
+                expected.discard(id)
+            self.assertEqual(ids, RangeSet(expected))
+        self.assertEqual(list(ids), sorted(expected))
+
+    #--------------------------------------------------------------------------
+
+    def testUnionDifference(self):
+        a = RangeSet.fromString("1-5 10-12")
+        b = RangeSet.fromString("4-8 12 20")
+        self.assertEqual(str(a | b), "1-8 10-12 20")
+        self.assertEqual(str(a - b), "1-3 10-11")
+        self.assertEqual(str(a.union([6, 9])), "1-6 9-12")
+        self.assertTrue(11 in a and 13 not in a)
+
+
+#------------------------------------------------------------------------------
+# class TestNamedList
+#------------------------------------------------------------------------------
+
+class TestNamedList(unittest.TestCase):
+
+    def _checkIndex(self, entries):
+        expected = {}
+        for position, entry in enumerate(entries):
+            expected.setdefault(entry.name, position)
+        self.assertEqual(entries._index, expected)
+        for name, position in expected.iteritems():
+            self.assertTrue(entries.find(name) is entries[position])
+
+    #--------------------------------------------------------------------------
+
+    def testDuplicates(self):
+        a, b, c = Variable('a'), Variable('b'), Variable('a')
+        entries = NamedList([a, b, c])
+        self.assertTrue(entries.find('a') is a)
+        entries.remove(a)
+        self.assertTrue(entries.find('a') is c)
+        entries.insert(0, a)
+        self.assertTrue(entries.find('a') is a)
+        self.assertEqual(entries.find('missing', 1), 1)
+        self.assertEqual(entries.names(), ['a', 'b', 'a'])
+
+    #--------------------------------------------------------------------------
+
+    def testIndexInPlace(self):
+        rand    = random.Random(11)
+        entries = NamedList([Variable(n) for n in 'abcab'])
+        entries.find('a')
+        for _ in xrange(500):
+            action = rand.random()
+            if action < 0.3 or not entries:
+                entries.insert(rand.randint(-8, 8), Variable(rand.choice('abcdef')))
+            elif action < 0.5:
+                entries.append(Variable(rand.choice('abcdef')))
+            elif action < 0.7:
+                entries.remove(rand.choice(entries))
+            elif action < 0.85:
+                entries.pop(rand.randint(-len(entries), len(entries) - 1))
+            else:
+                del entries[rand.randint(-len(entries), len(entries) - 1)]
+            self._checkIndex(entries)
+
+    #--------------------------------------------------------------------------
+
+    def testRebuild(self):
+        entries = NamedList([Variable('a'), Variable('b')])
+        entries.find('a')
+        entries.sort(key=lambda v: v.name, reverse=True)
+        self.assertEqual(entries.find('b'), entries[0])
+        entries[0].name = 'c'
+        entries.reindex()
+        self.assertTrue(entries.hasName('c') and not entries.hasName('b'))
+        self.assertRaises(IndexError, entries.pop, 5)
+
+
+#------------------------------------------------------------------------------
+# class TestVariableTable
+#------------------------------------------------------------------------------
+
+class TestVariableTable(unittest.TestCase):
+
+    def setUp(self):
+        self._variables = [
+            Variable('foo', 0.5, 0.0, 1.0),
+            Variable('bar', 3.0, 0.0, 2.0, 'rand'),
+            Variable('baz', -1.0, -2.0, 2.0, 'noise', 0.5, 1),
+        ]
+
+    #--------------------------------------------------------------------------
+
+    def testRoundTrip(self):
+        table = VariableTable(self._variables)
+        text  = "\n".join(map(str, self._variables))
+        self.assertEqual(str(table), text)
+        self.assertEqual(map(str, table), map(str, self._variables))
+
+        # unchanged values copy back as they were
+        table.update(self._variables)
+        self.assertEqual("\n".join(map(str, self._variables)), text)
+
+    #--------------------------------------------------------------------------
+
+    def testEdit(self):
+        table = VariableTable(self._variables)
+        self.assertEqual(table.outOfRange(), ['bar'])
+        table.clamp()
+        table.defaults[0] = 0.75
+        table['baz'] = Variable('baz', 1.0, 0.0, 4.0, 'ramp', 2)
+
+        table.update(self._variables)
+        self.assertEqual([v.default for v in self._variables], [0.75, 2.0, 1.0])
+        self.assertEqual(self._variables[2].max, 4.0)
+        self.assertEqual(str(self._variables[2]),
+                         "variable baz 1.000000 [0.000000 4.000000] ramp 2")
+        self.assertEqual(str(table), "\n".join(map(str, self._variables)))
+
+    #--------------------------------------------------------------------------
+
+    def testGrowDelete(self):
+        table = VariableTable()
+        for index in xrange(20):
+            table.append(Variable('v%d' % index, index, 0.0, 10.0))
+        del table[0]
+        del table['v10']
+        self.assertEqual(len(table), 18)
+        self.assertEqual(table.index('v11'), 9)
+        self.assertEqual(table.defaults.tolist(),
+                         range(1, 10) + range(11, 20))
+        self.assertEqual(table.outOfRange(), ['v%d' % i for i in xrange(11, 20)])
+        self.assertRaises(ValueError, table.update, self._variables)
+
+#------------------------------------------------------------------------------
+# class TestAtomicFile
+#------------------------------------------------------------------------------
+
+class TestAtomicFile(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._path      = os.path.join(self._directory, 'data.txt')
+
+    #--------------------------------------------------------------------------
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    #--------------------------------------------------------------------------
+
+    def testReplace(self):
+        with AtomicFile.open(self._path) as atomic_file:
+            atomic_file.write("first")
+        os.chmod(self._path, 0640)
+
+        with AtomicFile.open(self._path) as atomic_file:
+            atomic_file.write("second")
+            with open(self._path) as data_file:
+                self.assertEqual(data_file.read(), "first")
+
+        with open(self._path) as data_file:
+            self.assertEqual(data_file.read(), "second")
+        self.assertEqual(os.stat(self._path).st_mode & 0777, 0640)
+        self.assertEqual(os.listdir(self._directory), ['data.txt'])
+
+    #--------------------------------------------------------------------------
+
+    def testFailedWrite(self):
+        with open(self._path, 'w') as data_file:
+            data_file.write("kept")
+
+        try:
+            with AtomicFile.open(self._path) as atomic_file:
+                atomic_file.write("partial")
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+
+        with open(self._path) as data_file:
+            self.assertEqual(data_file.read(), "kept")
+        self.assertEqual(os.listdir(self._directory), ['data.txt'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+#------------------------------------------------------------------------------
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#                     Version 2, December 2004
+#
+#  Copyright (C) 2013 Electronic Dreams <maverick.babylon.drifter@gmail.com>
+#
+#  Everyone is permitted to copy and distribute verbatim or modified
+#  copies of this license document, and changing it is allowed as long
+#  as the name is changed.
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#    TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+#
+#   0. You just DO WHAT THE FUCK YOU WANT TO.
+#
+#------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------
+# test_mas_blocks.py - Blocks of .mas files.
+#------------------------------------------------------------------------------
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mas_blocks import FlowSpline
+from mas_blocks import LaneSpline
+
+#------------------------------------------------------------------------------
+# class TestSplines
+#------------------------------------------------------------------------------
+
+class TestSplines(unittest.TestCase):
+
+    def testPoints(self):
+        spline = LaneSpline(
+            "spline 2 0.5 1\n"
+            "    [0 0 0 1]\n"
+            "    [1 2 0 1]\n"
+            "    tangents\n"
+            "        [1 0 0][0 1 0]\n"
+            "        [1 0 0][0 1 0]\n")
+        self.assertEqual(spline.points.shape, (2, 4))
+        self.assertEqual(spline.points[1].tolist(), [1, 2, 0, 1])
+        self.assertEqual(spline.tangents.shape, (2, 6))
+
+    #--------------------------------------------------------------------------
+
+    def testMalformedRow(self):
+        self.assertRaises(ValueError, FlowSpline,
+            "spline 0.5 1 2 3 2\n"
+            "    [1 2 3 4 5 6 7 8 9 10]\n"
+            "    [1 2 3 4 5 x 7 8 9 10]\n")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+#------------------------------------------------------------------------------
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#                     Version 2, December 2004
+#
+#  Copyright (C) 2013 Electronic Dreams <maverick.babylon.drifter@gmail.com>
+#
+#  Everyone is permitted to copy and distribute verbatim or modified
+#  copies of this license document, and changing it is allowed as long
+#  as the name is changed.
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#    TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+#
+#   0. You just DO WHAT THE FUCK YOU WANT TO.
+#
+#------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------
+# test_reader.py - Blocks built from the nodes of a BlockReader.
+#------------------------------------------------------------------------------
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common     import Compression
+from mas        import MasFile
+from mas_blocks import PlaceBlock
+from mas_blocks import SimsBlock
+from reader     import BlockReader
+
+#------------------------------------------------------------------------------
+# class TestNodeBlocks
+#------------------------------------------------------------------------------
+
+class TestNodeBlocks(unittest.TestCase):
+
+    _sMas = \
+        '# Massive 5.0 setup file.\n' \
+        'units cm\n' \
+        '\n' \
+        'Sims\n' \
+        '    sim s1 *\n' \
+        '        frames 1 100 1\n' \
+        '        input\n' \
+        '            sims apf /tmp/in\n' \
+        '            camera cam1\n' \
+        '        output\n' \
+        '            statistics /tmp/stats\n' \
+        '    end sim\n' \
+        'End sims\n' \
+        '\n' \
+        'Place\n' \
+        '    group 1 grp\n' \
+        '        translate 0 0\n' \
+        '        colour 3\n' \
+        '        cdl agent.cdl 1 1\n' \
+        '        variable foo 0.500000 [0.000000 1.000000]\n' \
+        '\n' \
+        '\n' \
+        'non_process\n' \
+        '    1-5 7 9-12\n' \
+        'end non_process\n' \
+        'replay\n' \
+        '    3 100-200\n' \
+        'end replay\n' \
+        'End place\n'
+
+    #--------------------------------------------------------------------------
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._path      = os.path.join(self._directory, 'scene.mas')
+        with open(self._path, 'w') as mas_file:
+            mas_file.write(TestNodeBlocks._sMas)
+
+    #--------------------------------------------------------------------------
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    #--------------------------------------------------------------------------
+
+    def testAttributeNamedLikeBlock(self):
+        sim = MasFile(self._path).sims_block.sims[0]
+        self.assertEqual(sim.input.sims, ('apf', '/tmp/in'))
+        self.assertEqual(sim.input.camera, 'cam1')
+        self.assertEqual(sim.output.statistics, '/tmp/stats')
+
+    #--------------------------------------------------------------------------
+
+    def testSameAsText(self):
+        reader = BlockReader(TestNodeBlocks._sMas)
+        for cls, name in ((SimsBlock, 'Sims'), (PlaceBlock, 'Place')):
+            node = reader.find(name)
+            self.assertEqual(str(cls(node.children)), str(cls(node.body())))
+
+    #--------------------------------------------------------------------------
+
+    def testRoundTrip(self):
+        output = os.path.join(self._directory, 'out.mas')
+        MasFile(self._path).write(output)
+        with open(output) as out_file:
+            self.assertEqual(out_file.read(), TestNodeBlocks._sMas)
+
+
+#------------------------------------------------------------------------------
+# class TestNodeScene
+#------------------------------------------------------------------------------
+
+class TestNodeScene(unittest.TestCase):
+    """Every block of a full scene, scene_out.mas is the output of the text
+    based parsing the reader nodes replaced.
+    """
+
+    _sData = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+    #--------------------------------------------------------------------------
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._path      = os.path.join(TestNodeScene._sData, 'scene.mas')
+        self._expected  = Compression.read(
+            os.path.join(TestNodeScene._sData, 'scene_out.mas'))
+
+    #--------------------------------------------------------------------------
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    #--------------------------------------------------------------------------
+
+    def testSameAsText(self):
+        scene  = Compression.read(self._path).split('\n', 2)[2]
+        nodes  = dict((node.header.strip(), node)
+                      for node in BlockReader(scene).nodes)
+        self.assertEqual(sorted(nodes),
+                         sorted(name for name, cls in MasFile._sBlocks))
+
+        for name, cls in MasFile._sBlocks:
+            node = nodes[name]
+            self.assertEqual(str(cls(node.children)), str(cls(node.body())),
+                             name)
+
+    #--------------------------------------------------------------------------
+
+    def testRoundTrip(self):
+        output = os.path.join(self._directory, 'out.mas')
+        MasFile(self._path).write(output)
+        self.assertEqual(Compression.read(output), self._expected)
+
+        MasFile(output).write(output)
+        self.assertEqual(Compression.read(output), self._expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+#------------------------------------------------------------------------------
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#                     Version 2, December 2004
+#
+#  Copyright (C) 2013 Electronic Dreams <maverick.babylon.drifter@gmail.com>
+#
+#  Everyone is permitted to copy and distribute verbatim or modified
+#  copies of this license document, and changing it is allowed as long
+#  as the name is changed.
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#    TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+#
+#   0. You just DO WHAT THE FUCK YOU WANT TO.
+#
+#------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------
+# test_rib.py - Rib frame sequences and their ant index.
+#------------------------------------------------------------------------------
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rib      import RibSequence
+from snapshot import Snapshot
+
+#------------------------------------------------------------------------------
+# class TestRibSequence
+#------------------------------------------------------------------------------
+
+class TestRibSequence(unittest.TestCase):
+
+    _sRib = \
+        'Procedural "DynamicLoad" ["run_program" "10 agent.cdl a.apf 1 foo %d"] [%d 2 3 0 90 0]\n' \
+        'Procedural "DynamicLoad" ["run_program" "7 other.cdl b.apf 1 foo 0.5"] [-4 0 -6 0 45 0]\n'
+
+    #--------------------------------------------------------------------------
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._paths     = []
+        for frame in (1, 2):
+            path = os.path.join(self._directory, 'scene.%04d.rib' % frame)
+            with open(path, 'w') as rib_file:
+                rib_file.write(TestRibSequence._sRib % (frame, frame))
+            self._paths.append(path)
+        self._index = os.path.join(self._directory, 'scene.ribidx')
+
+    #--------------------------------------------------------------------------
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    #--------------------------------------------------------------------------
+
+    def _checkSequence(self, sequence):
+        self.assertEqual(sequence.frames, [1, 2])
+        self.assertEqual(sequence.ids(1).tolist(), [7, 10])
+        track = sequence.antTrack(10)
+        self.assertEqual([frame for frame, ant in track], [1, 2])
+        self.assertEqual([ant.variables['foo'] for frame, ant in track],
+                         [1, 2])
+
+    #--------------------------------------------------------------------------
+
+    def testIndex(self):
+        self._checkSequence(RibSequence(self._paths))
+        self.assertTrue(os.path.exists(self._index))
+        self._checkSequence(RibSequence(self._paths))
+
+    #--------------------------------------------------------------------------
+
+    def testCorruptIndex(self):
+        RibSequence(self._paths)
+        with open(self._index, 'rb') as index_file:
+            data = index_file.read()
+
+        # truncated
+        for size in (0, 16, len(data) / 2, len(data) - 1):
+            with open(self._index, 'wb') as index_file:
+                index_file.write(data[:size])
+            self._checkSequence(RibSequence(self._paths))
+
+        # not a dictionary, or entries of the wrong shape
+        for index in ([1, 2], {'version' : 1, 'paths' : self._paths,
+                               'stamps' : [None, None], 'ids' : [[1], [2]],
+                               'offsets' : [[], []]}):
+            Snapshot.save(index, self._index)
+            self._checkSequence(RibSequence(self._paths))
+
+        # the rebuilt index was saved
+        self.assertEqual(len(Snapshot.load(self._index)['ids']), 2)
+
+    #--------------------------------------------------------------------------
+
+    def testTrajectories(self):
+        array, ids = RibSequence(self._paths).trajectories(processes=1)
+        self.assertEqual(ids.tolist(), [7, 10])
+        self.assertEqual(array[:, 0, 0].tolist(), [-4, -4])
+        self.assertEqual(array[:, 1, 0].tolist(), [1, 2])
+
+    #--------------------------------------------------------------------------
+
+    def testBadTransform(self):
+        with open(self._paths[1], 'w') as rib_file:
+            rib_file.write((TestRibSequence._sRib % (2, 2)).replace('45 0]', '45]'))
+        sequence = RibSequence(self._paths)
+        self.assertRaises(ValueError, sequence.trajectories, processes=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
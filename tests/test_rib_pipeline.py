@@ -0,0 +1,143 @@
+#------------------------------------------------------------------------------
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#                     Version 2, December 2004
+#
+#  Copyright (C) 2013 Electronic Dreams <maverick.babylon.drifter@gmail.com>
+#
+#  Everyone is permitted to copy and distribute verbatim or modified
+#  copies of this license document, and changing it is allowed as long
+#  as the name is changed.
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#    TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+#
+#   0. You just DO WHAT THE FUCK YOU WANT TO.
+#
+#------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------
+# test_rib_pipeline.py - Streaming rewrites of rib files.
+#------------------------------------------------------------------------------
+
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common       import Compression
+from rib_blocks   import AntBlock
+from rib_pipeline import RibPipeline
+
+#------------------------------------------------------------------------------
+# class TestRibPipeline
+#------------------------------------------------------------------------------
+
+class TestRibPipeline(unittest.TestCase):
+
+    _sRib = \
+        '##RenderMan RIB\n' \
+        'version 3.04\n' \
+        '\n' \
+        'Procedural "DynamicLoad" ["run_program" "10 agent.cdl a.apf 1 foo 0.5 bar 1.25"] [1 2 3 0 90 0]\n' \
+        '\n' \
+        'Procedural "DynamicLoad" ["run_program" "7 other.cdl b.apf 1 foo 0.125 bar 2"] [-4 0 -6 0 45 0]\n' \
+        'Procedural "DynamicLoad" ["run_program" "3 other.cdl b.apf 1 foo 1 bar 3"] [0 0 0 0 0 0]\n'
+
+    #--------------------------------------------------------------------------
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._path      = os.path.join(self._directory, 'scene.0001.rib')
+        with open(self._path, 'w') as rib_file:
+            rib_file.write(TestRibPipeline._sRib)
+
+    #--------------------------------------------------------------------------
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    #--------------------------------------------------------------------------
+
+    def _checkOutput(self, path):
+        lines = Compression.read(path).split('\n')
+        self.assertEqual(len(lines), 7)
+
+        # blank and other lines are written through unchanged
+        self.assertEqual(lines[:3], TestRibPipeline._sRib.split('\n')[:3])
+        self.assertEqual(lines[4:], ['', lines[5], ''])
+
+        ants = [AntBlock(lines[3]), AntBlock(lines[5])]
+        self.assertEqual([ant.id for ant in ants], [10, 7])
+        self.assertEqual([ant.variables for ant in ants],
+                         [{'foo' : 2.0}, {'foo' : 0.125}])
+
+    #--------------------------------------------------------------------------
+
+    def _getPipeline(self, paths):
+        pipeline = RibPipeline(paths).dropIds([3])
+        pipeline.setAntVariables({10 : {'foo' : 2.0}})
+        return pipeline.deleteVariables(['bar'])
+
+    #--------------------------------------------------------------------------
+
+    def testInPlace(self):
+        os.chmod(self._path, 0640)
+        result = self._getPipeline([self._path]).run(processes=1)
+        self.assertEqual(result, [(self._path, 2)])
+        self._checkOutput(self._path)
+        self.assertEqual(stat.S_IMODE(os.stat(self._path).st_mode), 0640)
+        self.assertEqual(os.listdir(self._directory), ['scene.0001.rib'])
+
+    #--------------------------------------------------------------------------
+
+    def testPrefix(self):
+        gz_path = self._path + '.gz'
+        with Compression.open(gz_path, 'wb') as gz_file:
+            gz_file.write(TestRibPipeline._sRib)
+
+        prefix = os.path.join(self._directory, 'out')
+        result = self._getPipeline([self._path, gz_path]).run(prefix,
+                                                               processes=1)
+        outputs = [prefix + '.0001.rib', prefix + '.0001.rib.gz']
+        self.assertEqual(result, [(outputs[0], 2), (outputs[1], 2)])
+        for output in outputs:
+            self._checkOutput(output)
+        self.assertTrue(Compression.isCompressed(outputs[1]))
+        self.assertEqual(Compression.read(self._path), TestRibPipeline._sRib)
+
+    #--------------------------------------------------------------------------
+
+    def testFailedStage(self):
+        pipeline = RibPipeline([self._path]).map(_failOnOther)
+        self.assertRaises(ValueError, pipeline.run, processes=1)
+
+        # the original is untouched and the temporary file removed
+        self.assertEqual(Compression.read(self._path), TestRibPipeline._sRib)
+        self.assertEqual(os.listdir(self._directory), ['scene.0001.rib'])
+
+    #--------------------------------------------------------------------------
+
+    def testBadAnt(self):
+        with open(self._path, 'a') as rib_file:
+            rib_file.write('Procedural "DynamicLoad" ["run_program" "4 a.cdl a.apf 1 foo"]\n')
+        self.assertRaises(AttributeError, RibPipeline([self._path]).run,
+                          processes=1)
+        self.assertEqual(os.listdir(self._directory), ['scene.0001.rib'])
+
+#------------------------------------------------------------------------------
+# helper functions
+#------------------------------------------------------------------------------
+
+def _failOnOther(ant):
+    if ant.cdl == 'other.cdl':
+        raise ValueError("Stage failed on ant %d" % ant.id)
+    return ant
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+#------------------------------------------------------------------------------
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#                     Version 2, December 2004
+#
+#  Copyright (C) 2013 Electronic Dreams <maverick.babylon.drifter@gmail.com>
+#
+#  Everyone is permitted to copy and distribute verbatim or modified
+#  copies of this license document, and changing it is allowed as long
+#  as the name is changed.
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#    TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+#
+#   0. You just DO WHAT THE FUCK YOU WANT TO.
+#
+#------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------
+# test_skeleton.py - Array backed agent skeletons.
+#------------------------------------------------------------------------------
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from skeleton import Skeleton
+
+#------------------------------------------------------------------------------
+# class TestSkeleton
+#------------------------------------------------------------------------------
+
+class TestSkeleton(unittest.TestCase):
+
+    def _skeleton(self, parents):
+        count = len(parents)
+        names = ['s%d' % i for i in xrange(count)]
+        zeros = [(0, 0, 0)] * count
+        return Skeleton(names, parents, zeros, zeros, [(1, 1, 1)] * count)
+
+    #--------------------------------------------------------------------------
+
+    def testTraverse(self):
+        skeleton = self._skeleton([-1, 0, 1, 0, 3])
+        self.assertEqual(skeleton.traverse().tolist(), [0, 1, 2, 3, 4])
+        self.assertEqual(skeleton.traverse('s3').tolist(), [3, 4])
+        subtree = skeleton.subtree(1)
+        self.assertEqual(subtree.names, ['s1', 's2'])
+        self.assertEqual(subtree.parents.tolist(), [-1, 0])
+
+    #--------------------------------------------------------------------------
+
+    def testCyclicParents(self):
+        self.assertRaises(ValueError, self._skeleton, [-1, 2, 1])
+        self.assertRaises(ValueError, self._skeleton, [-1, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+#------------------------------------------------------------------------------
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#                     Version 2, December 2004
+#
+#  Copyright (C) 2013 Electronic Dreams <maverick.babylon.drifter@gmail.com>
+#
+#  Everyone is permitted to copy and distribute verbatim or modified
+#  copies of this license document, and changing it is allowed as long
+#  as the name is changed.
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#    TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+#
+#   0. You just DO WHAT THE FUCK YOU WANT TO.
+#
+#------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------
+# test_snapshot.py - Snapshot round trips of parsed files.
+#------------------------------------------------------------------------------
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mas      import MasFile
+from rib      import RibFile
+from snapshot import Snapshot
+
+#------------------------------------------------------------------------------
+# class TestRibSnapshot
+#------------------------------------------------------------------------------
+
+class TestRibSnapshot(unittest.TestCase):
+
+    _sRib = \
+        'Procedural "DynamicLoad" ["run_program" "10 agent.cdl a.apf 1 foo 0.5 bar 1.25"] [1 2 3 0 90 0]\n' \
+        'Procedural "DynamicLoad" ["run_program" "7 other.cdl b.apf 1 foo 0.125 bar 2"] [-4 0 -6 0 45 0]\n'
+
+    #--------------------------------------------------------------------------
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._path      = os.path.join(self._directory, 'scene.0001.rib')
+        with open(self._path, 'w') as rib_file:
+            rib_file.write(TestRibSnapshot._sRib)
+
+    #--------------------------------------------------------------------------
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    #--------------------------------------------------------------------------
+
+    def testRoundTrip(self):
+        snapshot = os.path.join(self._directory, 'scene.snap')
+        RibFile(self._path).saveSnapshot(snapshot)
+
+        for mmap in (False, True):
+            rib_file = RibFile.loadSnapshot(snapshot, mmap)
+            output   = os.path.join(self._directory, 'out.rib')
+            rib_file.write(output)
+            with open(output) as out_file:
+                self.assertEqual(out_file.read(), TestRibSnapshot._sRib)
+
+    #--------------------------------------------------------------------------
+
+    def testEditAfterLoad(self):
+        snapshot = os.path.join(self._directory, 'scene.snap')
+        RibFile(self._path).saveSnapshot(snapshot)
+
+        rib_file = RibFile.loadSnapshot(snapshot)
+        rib_file.ants[0].variables['baz'] = 3.0
+        del rib_file.ants[1].variables['foo']
+        self.assertIn(' baz 3"]', str(rib_file.ants[0]))
+        self.assertNotIn('foo', str(rib_file.ants[1]))
+
+    #--------------------------------------------------------------------------
+
+    def testReplaceWhileMapped(self):
+        snapshot = os.path.join(self._directory, 'arrays.snap')
+        Snapshot.save({'values' : np.arange(4.0)}, snapshot)
+        mapped = Snapshot.load(snapshot, True)
+
+        Snapshot.save({'values' : np.zeros(4)}, snapshot)
+        self.assertEqual(mapped['values'].tolist(), [0, 1, 2, 3])
+        self.assertEqual(Snapshot.load(snapshot)['values'].tolist(), [0] * 4)
+        self.assertEqual(sorted(os.listdir(self._directory)),
+                         ['arrays.snap', 'scene.0001.rib'])
+
+    #--------------------------------------------------------------------------
+
+    def testTruncated(self):
+        snapshot = os.path.join(self._directory, 'arrays.snap')
+        Snapshot.save({'values' : np.arange(4.0), 'name' : 'foo'}, snapshot)
+        with open(snapshot, 'rb') as snapshot_file:
+            data = snapshot_file.read()
+
+        for size in xrange(len(data)):
+            with open(snapshot, 'wb') as snapshot_file:
+                snapshot_file.write(data[:size])
+            self.assertRaises(ValueError, Snapshot.load, snapshot)
+
+
+#------------------------------------------------------------------------------
+# class TestLazySnapshot
+#------------------------------------------------------------------------------
+
+class TestLazySnapshot(unittest.TestCase):
+
+    _sMas = \
+        '# Massive 5.0 setup file.\n' \
+        'units cm\n' \
+        '\n' \
+        'Display options\n' \
+        '    shadows 0\n' \
+        '    grid 1 10 1\n' \
+        'End display options'
+
+    #--------------------------------------------------------------------------
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._path      = os.path.join(self._directory, 'scene.mas')
+        with open(self._path, 'w') as mas_file:
+            mas_file.write(TestLazySnapshot._sMas)
+
+    #--------------------------------------------------------------------------
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    #--------------------------------------------------------------------------
+
+    def testUnreadAttributes(self):
+        snapshot = os.path.join(self._directory, 'scene.snap')
+        MasFile(self._path, lazy=True).saveSnapshot(snapshot)
+
+        mas_file = MasFile.loadSnapshot(snapshot)
+        output   = os.path.join(self._directory, 'out.mas')
+        mas_file.write(output)
+        with open(output) as out_file:
+            self.assertEqual(out_file.read(), TestLazySnapshot._sMas)
+
+        block = mas_file.display_options_block
+        self.assertEqual(block.grid, (1, 10.0, 1.0))
+        self.assertEqual(block.shadows, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,201 @@
+#------------------------------------------------------------------------------
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#                     Version 2, December 2004
+#
+#  Copyright (C) 2013 Electronic Dreams <maverick.babylon.drifter@gmail.com>
+#
+#  Everyone is permitted to copy and distribute verbatim or modified
+#  copies of this license document, and changing it is allowed as long
+#  as the name is changed.
+#
+#             DO WHAT THE FUCK YOU WANT TO PUBLIC LICENSE
+#    TERMS AND CONDITIONS FOR COPYING, DISTRIBUTION AND MODIFICATION
+#
+#   0. You just DO WHAT THE FUCK YOU WANT TO.
+#
+#------------------------------------------------------------------------------
+
+#------------------------------------------------------------------------------
+# test_spatial.py - Spatial queries over splines and ants.
+#------------------------------------------------------------------------------
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rib     import RibSequence
+from spatial import AntIndex
+from spatial import SplineIndex
+
+#------------------------------------------------------------------------------
+# class TestSplineIndex
+#------------------------------------------------------------------------------
+
+class TestSplineIndex(unittest.TestCase):
+
+    class _Spline(object):
+        def __init__(self, points):
+            self.points = points
+
+    #--------------------------------------------------------------------------
+
+    def setUp(self):
+        rand          = np.random.RandomState(3)
+        self._splines = [TestSplineIndex._Spline(rand.uniform(-50, 50, (20, 4)))
+                         for _ in xrange(10)]
+
+    #--------------------------------------------------------------------------
+
+    def _bruteForce(self, position, radius):
+        matches = []
+        for spline in self._splines:
+            distances = np.sqrt(((spline.points[:, :3] - position) ** 2).sum(axis=1))
+            for index, distance in enumerate(distances):
+                if distance <= radius:
+                    matches.append((distance, id(spline), index))
+        return sorted(matches)
+
+    #--------------------------------------------------------------------------
+
+    def _check(self, index, position, radius):
+        found    = index.radius(position, radius)
+        expected = self._bruteForce(np.array(position, dtype=np.float64), radius)
+        self.assertEqual(sorted((d, id(s), i) for s, i, d in found), expected)
+        self.assertEqual([d for _, _, d in found], sorted(d for _, _, d in found))
+
+    #--------------------------------------------------------------------------
+
+    def testRadius(self):
+        for cell_size in (None, 0.5, 7.0):
+            index = SplineIndex(self._splines, cell_size)
+            for position, radius in (((0, 0, 0), 10), ((40, 5, -40), 25),
+                                     ((500, 0, 500), 5), ((0, 0, 0), 1e6)):
+                self._check(index, position, radius)
+
+    #--------------------------------------------------------------------------
+
+    def testNearest(self):
+        index = SplineIndex(self._splines)
+        spline, point, distance = index.nearestPoint((3, 1, -7))
+        expected = self._bruteForce(np.array([3, 1, -7.0]), 1e9)[0]
+        self.assertEqual((distance, id(spline), point), expected)
+
+    #--------------------------------------------------------------------------
+
+    def testUpdate(self):
+        index  = SplineIndex(self._splines)
+        spline = self._splines[0]
+        spline.points = spline.points + 1000
+        index.update(spline)
+        self._check(index, (1000, 1000, 1000), 60)
+        index.remove(*self._splines[1:])
+        self.assertEqual(len(index), 1)
+
+    #--------------------------------------------------------------------------
+
+    def testEmpty(self):
+        index = SplineIndex()
+        self.assertEqual(index.radius((0, 0, 0), 10), [])
+        self.assertEqual(index.nearestPoint((0, 0, 0)), None)
+        self.assertRaises(ValueError, SplineIndex, None, 0)
+
+
+#------------------------------------------------------------------------------
+# class TestAntIndex
+#------------------------------------------------------------------------------
+
+class TestAntIndex(unittest.TestCase):
+
+    def setUp(self):
+        rand            = np.random.RandomState(5)
+        self._ids       = rand.permutation(np.arange(100, 300))
+        self._positions = rand.uniform(-40, 40, (200, 3))
+
+    #--------------------------------------------------------------------------
+
+    def _getDistances(self, use_3d):
+        points = self._positions if use_3d else self._positions[:, [0, 2]]
+        return np.sqrt(((points[:, None] - points[None]) ** 2).sum(axis=2))
+
+    #--------------------------------------------------------------------------
+
+    def testRadius(self):
+        for use_3d in (False, True):
+            axes = [0, 1, 2] if use_3d else [0, 2]
+            for cell_size in (0.5, 6.0, 100.0):
+                index = AntIndex(self._ids, self._positions, cell_size, use_3d)
+                for position, radius in (((0, 0, 0), 10), ((35, 5, -35), 20),
+                                         ((500, 0, 500), 5), ((0, 0, 0), 1e6)):
+                    ids, distances = index.radius(position, radius)
+                    offsets  = self._positions[:, axes] - np.array(position)[axes]
+                    expected = np.sqrt((offsets ** 2).sum(axis=1))
+                    inside   = np.flatnonzero(expected <= radius)
+                    self.assertEqual(sorted(ids), sorted(self._ids[inside]))
+                    self.assertTrue((np.diff(distances) >= 0).all())
+                    lookup = dict(zip(self._ids, expected))
+                    self.assertTrue(np.allclose(distances, [lookup[i] for i in ids]))
+
+    #--------------------------------------------------------------------------
+
+    def testPairs(self):
+        for use_3d in (False, True):
+            distances = self._getDistances(use_3d)
+            for cell_size, radius in ((2.0, 7.5), (10.0, 3.0), (20.0, 1e3)):
+                index = AntIndex(self._ids, self._positions, cell_size, use_3d)
+                pairs, lengths = index.pairs(radius)
+                found    = sorted(tuple(sorted(pair)) for pair in pairs.tolist())
+                first, second = np.nonzero(np.triu(distances <= radius, 1))
+                expected = sorted(tuple(sorted(pair)) for pair in
+                                  zip(self._ids[first], self._ids[second]))
+                self.assertEqual(found, expected)
+                self.assertEqual(len(lengths), len(found))
+
+                counts = (distances <= radius).sum(axis=1) - 1
+                self.assertEqual(index.neighbourCounts(radius).tolist(),
+                                 counts.tolist())
+
+    #--------------------------------------------------------------------------
+
+    def testEmpty(self):
+        index = AntIndex([], np.zeros((0, 3)), 1.0)
+        self.assertEqual(len(index.radius((0, 0, 0), 10)[0]), 0)
+        self.assertEqual(len(index.pairs(10)[0]), 0)
+        self.assertEqual(index.cellDensity(), 0.0)
+        self.assertRaises(ValueError, AntIndex, [], np.zeros((0, 3)), 0)
+
+    #--------------------------------------------------------------------------
+
+    def testScanSequence(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'scene.0001.rib')
+            with open(path, 'w') as rib_file:
+                for id, (x, y, z) in zip(self._ids, self._positions):
+                    rib_file.write('Procedural "DynamicLoad" ["run_program" '
+                                   '"%d agent.cdl a.apf 1 foo 1"] '
+                                   '[%r %r %r 0 0 0]\n' % (id, x, y, z))
+            sequence = RibSequence([path])
+
+            report = AntIndex.scanSequence(sequence, 5.0, processes=1)[0]
+            counts = (self._getDistances(False) <= 5.0).sum(axis=1) - 1
+            self.assertEqual(report['frame'], 1)
+            self.assertEqual(report['ants'], 200)
+            self.assertEqual(report['pairs'], counts.sum() // 2)
+            self.assertEqual(report['neighbours'], counts.max())
+
+            for radius, cell_size in ((0, None), (-1, 2.0), (5.0, 0)):
+                self.assertRaises(ValueError, AntIndex.scanSequence, sequence,
+                                  radius, cell_size, processes=1)
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()